@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from models import TaskAnalysis
+
+
+@dataclass(frozen=True)
+class Rule:
+    priority: str
+    keywords: Tuple[str, ...]
+
+
+# Ключевые слова ищутся как подстроки (как и раньше: "urgently" тоже срочно),
+# поэтому для русского достаточно основ: "срочн" покрывает срочно/срочная/...
+DEFAULT_RULES = (
+    Rule("high", ("urgent", "important", "asap", "critical", "срочн", "важн", "немедленн", "горит")),
+    Rule("low", ("later", "someday", "maybe", "потом", "позже", "когда-нибудь", "не спеша")),
+)
+
+ADVICE = {
+    "high": "Эта задача кажется срочной. Приоритизируйте её немедленно.",
+    "medium": "Стандартный приоритет. Запланируйте соответственно.",
+    "low": "Это можно сделать позже. Нет спешки.",
+}
+DUE_SOON_ADVICE = "Срок истекает в ближайшие сутки. Приоритизируйте её немедленно."
+OVERDUE_ADVICE = "Срок уже прошёл. Разберитесь с задачей как можно скорее."
+
+NOT_LEFT = timedelta(0)
+DUE_SOON = timedelta(days=1)
+DUE_THIS_WEEK = timedelta(days=3)
+
+
+class AnalysisEngine:
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES):
+        # Правила по убыванию приоритета: побеждает первое, чьё слово есть в тексте.
+        # Поиск подстроки через `in` идёт в C и быстрее общего регулярного выражения
+        # с альтернативами на каждом символе текста
+        order = {"high": 0, "low": 1, "medium": 2}
+        self._rules = tuple(
+            (rule.priority, tuple(k.lower() for k in rule.keywords))
+            for rule in sorted(rules, key=lambda rule: order.get(rule.priority, len(order)))
+        )
+        # Ответов всего несколько — экземпляры общие, без создания модели на каждую задачу
+        self._results = {
+            (priority, advice): TaskAnalysis(advice=advice, suggested_priority=priority)
+            for priority, advice in (
+                *ADVICE.items(), ("high", DUE_SOON_ADVICE), ("high", OVERDUE_ADVICE),
+            )
+        }
+
+    def _text_priority(self, title: str, description: Optional[str]) -> str:
+        # Без мемоизации: поиск дешевле, чем хэширование текста для ключа LRU
+        text = f"{title}\n{description}".lower() if description else title.lower()
+        for priority, keywords in self._rules:
+            for keyword in keywords:
+                if keyword in text:
+                    return priority
+        return "medium"
+
+    def analyze(
+        self,
+        title: str,
+        description: Optional[str] = None,
+        due_date: Optional[datetime] = None,
+        now: Optional[datetime] = None,
+    ) -> TaskAnalysis:
+        priority = self._text_priority(title, description)
+        advice = ADVICE[priority]
+        if due_date is not None:
+            if due_date.tzinfo is not None:
+                due_date = due_date.astimezone(timezone.utc).replace(tzinfo=None)
+            left = due_date - (now or datetime.utcnow())
+            if left < NOT_LEFT:
+                priority, advice = "high", OVERDUE_ADVICE
+            elif left <= DUE_SOON:
+                priority, advice = "high", DUE_SOON_ADVICE
+            elif left <= DUE_THIS_WEEK and priority == "low":
+                priority, advice = "medium", ADVICE["medium"]
+        return self._results[priority, advice]
+
+    def analyze_many(
+        self, items: Iterable[Tuple[str, Optional[str], Optional[datetime]]]
+    ) -> List[TaskAnalysis]:
+        now = datetime.utcnow()
+        return [self.analyze(title, description, due_date, now) for title, description, due_date in items]
+
+
+analysis_engine = AnalysisEngine()
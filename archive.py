@@ -0,0 +1,232 @@
+"""Архив выполненных задач.
+
+Выполненные задачи, которые не менялись дольше settings.archive_after_days,
+переносятся из tasks в секционированную по месяцам таблицу tasks_archive
+вместе со всеми подзадачами. Дерево переносится только целиком: если в нём
+осталась невыполненная подзадача, оно остаётся в tasks. Для /sync и ленты
+архивная задача выглядит удалённой (tombstone), доступы в shares сохраняются,
+и восстановление возвращает её на место с теми же id.
+
+Разовый прогон (например, из cron вместо фоновой задачи):
+
+    python archive.py [--older-than-days 30]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from cache import response_cache
+from database import async_session
+from feed import cache_events, change_event, publish
+from settings import settings
+from task_tree import ancestor_audience
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_LOCK_ID = 48151624
+ARCHIVED_FIELDS = (
+    "id, title, description, due_date, priority, owner_id, created_at, updated_at, plan_id, parent_id, completed, "
+    "series_id, occurrence_at"
+)
+
+# Корни переносимых деревьев: выполненная старая задача, чей родитель сам не
+# кандидат (иначе она уйдёт вместе с ним). Ключ (updated_at, id) — курсор между
+# пачками, чтобы деревья с открытыми подзадачами не выбирались снова
+ROOTS_SQL = """
+    SELECT t.id, t.updated_at FROM tasks t
+    WHERE t.completed AND t.updated_at < :cutoff
+      AND (t.updated_at, t.id) > (:after_updated_at, :after_id)
+      AND NOT EXISTS (
+          SELECT 1 FROM tasks p WHERE p.id = t.parent_id AND p.completed AND p.updated_at < :cutoff
+      )
+    ORDER BY t.updated_at, t.id
+    LIMIT :limit
+"""
+
+# completed повторно проверяется в DELETE: задачу, которую успели открыть,
+# не трогаем, а FK на parent_id откатит перенос её предка
+MOVE_SQL = f"""
+    WITH RECURSIVE tree AS (
+        SELECT id AS root_id, id FROM tasks WHERE id = ANY(:root_ids)
+        UNION
+        SELECT tree.root_id, t.id FROM tasks t JOIN tree ON t.parent_id = tree.id
+    ),
+    movable AS (
+        SELECT tree.root_id FROM tree JOIN tasks t ON t.id = tree.id
+        GROUP BY tree.root_id
+        HAVING bool_and(t.completed)
+    ),
+    moved AS (
+        DELETE FROM tasks t
+        USING tree JOIN movable ON movable.root_id = tree.root_id
+        WHERE t.id = tree.id AND t.completed
+        RETURNING t.*
+    )
+    INSERT INTO tasks_archive ({ARCHIVED_FIELDS}, archived_at)
+    SELECT {ARCHIVED_FIELDS}, :archived_at FROM moved
+    RETURNING id, owner_id, parent_id, shared_users('task', id) AS shared_with
+"""
+
+# Корень встаёт к прежнему родителю, если тот есть в tasks, иначе — на верхний
+# уровень; план и серия, которых больше нет, обнуляются. updated_at сдвигается, чтобы
+# восстановленное дерево не ушло в архив следующим же прогоном
+RESTORE_SQL = f"""
+    WITH RECURSIVE tree AS (
+        SELECT id, archived_at FROM tasks_archive WHERE id = :task_id AND owner_id = :owner_id
+        UNION
+        SELECT a.id, a.archived_at FROM tasks_archive a JOIN tree ON a.parent_id = tree.id
+    ),
+    restored AS (
+        DELETE FROM tasks_archive a USING tree
+        WHERE a.id = tree.id AND a.archived_at = tree.archived_at
+        RETURNING a.*
+    )
+    INSERT INTO tasks ({ARCHIVED_FIELDS})
+    SELECT r.id, r.title, r.description, r.due_date, r.priority, r.owner_id, r.created_at, :now,
+           CASE WHEN EXISTS (SELECT 1 FROM plans p WHERE p.id = r.plan_id) THEN r.plan_id END,
+           CASE WHEN r.id <> :task_id OR EXISTS (SELECT 1 FROM tasks t WHERE t.id = r.parent_id) THEN r.parent_id END,
+           r.completed,
+           CASE WHEN EXISTS (SELECT 1 FROM task_series s WHERE s.id = r.series_id) THEN r.series_id END,
+           r.occurrence_at
+    FROM restored r
+    RETURNING id
+"""
+
+
+def partition_bounds(moment: datetime) -> Tuple[str, datetime, datetime]:
+    start = datetime(moment.year, moment.month, 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return f"tasks_archive_p{start:%Y%m}", start, end
+
+
+async def ensure_partition(db: AsyncSession, moment: datetime) -> None:
+    name, start, end = partition_bounds(moment)
+    if await db.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is None:
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF tasks_archive "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+
+async def archive_batch(
+    db: AsyncSession, cutoff: datetime, after: Tuple[datetime, int], limit: int
+) -> Tuple[int, Optional[Tuple[datetime, int]]]:
+    """Переносит одну пачку деревьев; возвращает число задач и курсор следующей пачки."""
+    # Параллельные воркеры не архивируют одно и то же: пачку берёт тот, кто взял блокировку
+    if not await db.scalar(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ARCHIVE_LOCK_ID}):
+        return 0, None
+    params = {"cutoff": cutoff, "after_updated_at": after[0], "after_id": after[1], "limit": limit}
+    roots = (await db.execute(text(ROOTS_SQL), params)).all()
+    if not roots:
+        return 0, None
+
+    now = datetime.utcnow()
+    await ensure_partition(db, now)
+    # Флаг читает record_tombstone: при архивации строки shares не удаляются
+    await db.execute(text("SELECT set_config('todo.archiving', 'on', true)"))
+    result = await db.execute(text(MOVE_SQL), {"root_ids": [root.id for root in roots], "archived_at": now})
+    rows = result.mappings().all()
+    await db.execute(text("SELECT set_config('todo.archiving', 'off', true)"))
+
+    # Для ленты перенос — удаление; подзадачу видят и участники её предков
+    parent_ids = {row["parent_id"] for row in rows if row["parent_id"] is not None}
+    ancestors = await ancestor_audience(db, parent_ids) if parent_ids else {}
+    audience = set()
+    payloads = []
+    for row in rows:
+        users = {row["owner_id"], *row["shared_with"]} | ancestors.get(row["parent_id"], set())
+        audience |= users
+        payloads.append(change_event("task", "delete", {"id": row["id"]}, users))
+    await publish(db, payloads + cache_events(audience, "tasks"))
+    await db.commit()
+    await response_cache.invalidate(audience, "tasks")
+    last = roots[-1]
+    return len(rows), (last.updated_at, last.id)
+
+
+async def archive_completed(session_factory: async_sessionmaker, older_than: timedelta, batch_size: int) -> int:
+    cutoff = datetime.utcnow() - older_than
+    after = (datetime.min, 0)
+    total = 0
+    while True:
+        async with session_factory() as db:
+            moved, after = await archive_batch(db, cutoff, after, batch_size)
+        total += moved
+        if after is None:
+            return total
+
+
+async def restore_task(db: AsyncSession, task_id: int, owner_id: int) -> List[int]:
+    """Возвращает задачу и её архивные подзадачи в tasks; commit — за вызывающим."""
+    result = await db.execute(text(RESTORE_SQL), {"task_id": task_id, "owner_id": owner_id, "now": datetime.utcnow()})
+    return list(result.scalars())
+
+
+class TaskArchiver:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        older_than: timedelta,
+        interval: float,
+        batch_size: int,
+    ):
+        self.session_factory = session_factory
+        self.older_than = older_than
+        self.interval = interval
+        self.batch_size = batch_size
+        self._runner: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._runner is None and self.older_than > timedelta(0):
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                moved = await archive_completed(self.session_factory, self.older_than, self.batch_size)
+                if moved:
+                    logger.info("Archived %d completed tasks", moved)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Task archiving failed")
+            await asyncio.sleep(self.interval)
+
+
+task_archiver = TaskArchiver(
+    async_session,
+    older_than=timedelta(days=settings.archive_after_days),
+    interval=settings.archive_interval_seconds,
+    batch_size=settings.archive_batch_size,
+)
+
+
+async def main() -> None:
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Move old completed tasks to tasks_archive")
+    parser.add_argument("--older-than-days", type=int, default=settings.archive_after_days)
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    args = parser.parse_args()
+    moved = await archive_completed(async_session, timedelta(days=args.older_than_days), args.batch_size)
+    print(json.dumps({"archived": moved}))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
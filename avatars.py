@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models import TelegramUser
+from schemas import TelegramUserOut
+from user_directory import USER_COLUMNS, UserDirectory
+
+logger = logging.getLogger(__name__)
+
+AVATAR_DIR = "static/avatars"
+AVATAR_TTL = timedelta(hours=6)
+
+
+class AvatarService:
+    def __init__(self, session_factory: async_sessionmaker, bot: Bot, directory: UserDirectory, ttl: timedelta = AVATAR_TTL):
+        self.session_factory = session_factory
+        self.bot = bot
+        self.directory = directory
+        self.ttl = ttl
+        # Один запрос к Bot API на идентификатор, сколько бы клиентов его ни ждало
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._background: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(identifier: str) -> str:
+        return identifier.strip().lstrip("@").lower()
+
+    async def get_user(self, identifier: str) -> TelegramUserOut:
+        cached = await self._lookup(identifier)
+        if cached is None:
+            return await self.fetch(identifier)
+        user, checked_at = cached
+        if checked_at is None or datetime.utcnow() - checked_at > self.ttl:
+            self.refresh_in_background(identifier)
+        return user
+
+    async def fetch(self, identifier: str) -> TelegramUserOut:
+        key = self._key(identifier)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(identifier))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего запроса не отменяет общую загрузку
+        return await asyncio.shield(task)
+
+    def refresh_in_background(self, identifier: str) -> None:
+        task = asyncio.create_task(self.fetch(identifier))
+        self._background.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Avatar refresh failed: %s", task.exception())
+
+    async def _lookup(self, identifier: str):
+        key = self._key(identifier)
+        if key.lstrip("-").isdigit():
+            condition = TelegramUser.id == int(key)
+        else:
+            condition = func.lower(TelegramUser.username) == key
+        stmt = select(*USER_COLUMNS, TelegramUser.avatar_checked_at).where(condition)
+        async with self.session_factory() as session:
+            row = (await session.execute(stmt)).mappings().one_or_none()
+        if row is None:
+            return None
+        return TelegramUserOut.model_validate(dict(row)), row["avatar_checked_at"]
+
+    async def _fetch(self, identifier: str) -> TelegramUserOut:
+        chat = await self.bot.get_chat(identifier)
+        async with self.session_factory() as session:
+            known_unique_id = await session.scalar(
+                select(TelegramUser.avatar_file_unique_id).where(TelegramUser.id == chat.id)
+            )
+
+        photos = await self.bot.get_user_profile_photos(chat.id, limit=1)
+        avatar_url = None
+        file_unique_id = None
+        if photos.total_count > 0:
+            biggest = photos.photos[0][-1]
+            file_unique_id = biggest.file_unique_id
+            save_path = f"{AVATAR_DIR}/{chat.id}.jpg"
+            # file_unique_id не меняется, пока не сменилась сама фотография
+            if file_unique_id != known_unique_id or not os.path.exists(save_path):
+                file = await self.bot.get_file(biggest.file_id)
+                # Свой временный файл на каждую загрузку: один и тот же аватар могут
+                # одновременно обновлять несколько воркеров
+                with tempfile.NamedTemporaryFile(dir=AVATAR_DIR, suffix=".tmp", delete=False) as tmp:
+                    pass
+                try:
+                    await self.bot.download_file(file.file_path, tmp.name)
+                    # NamedTemporaryFile создаёт файл с правами 0600
+                    os.chmod(tmp.name, 0o644)
+                    os.replace(tmp.name, save_path)
+                except BaseException:
+                    os.unlink(tmp.name)
+                    raise
+            avatar_url = f"/{save_path}"
+
+        values = dict(
+            username=chat.username,
+            first_name=chat.first_name,
+            last_name=chat.last_name,
+            avatar_url=avatar_url,
+            avatar_file_unique_id=file_unique_id,
+            avatar_checked_at=datetime.utcnow(),
+        )
+        stmt = insert(TelegramUser).values(id=chat.id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TelegramUser.id],
+            set_={**values, "updated_at": func.now()},
+        ).returning(*USER_COLUMNS)
+        async with self.session_factory() as session:
+            row = (await session.execute(stmt)).mappings().one()
+            await session.commit()
+        user = TelegramUserOut.model_validate(dict(row))
+        self.directory.prime(user)
+        return user
@@ -0,0 +1,93 @@
+"""Micro-benchmark: AnalysisEngine vs the original keyword analyze_task.
+
+The engine checks more keywords and the due date, yet has to stay cheaper
+per task than the three-substring original it replaced; "speedup" is
+legacy time divided by engine time.
+
+    python benchmarks/bench_analysis.py --tasks 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Модели тянут за собой database.py; соединение не открывается, нужен лишь URL
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")
+
+from analysis import AnalysisEngine  # noqa: E402
+from models import TaskAnalysis  # noqa: E402
+
+WORDS = [
+    "report", "call", "review", "deploy", "meeting", "invoice", "draft", "budget",
+    "отчёт", "звонок", "встреча", "счёт", "проверить", "купить", "написать", "план",
+]
+KEYWORDS = ["urgent", "important", "later", "срочно", "важно", "потом", "позже"]
+
+
+def legacy_analyze_task(title: str, description: Optional[str]) -> TaskAnalysis:
+    combined = f"{title} {description or ''}".lower()
+    if "urgent" in combined or "important" in combined:
+        suggested_priority = "high"
+        advice = "Эта задача кажется срочной. Приоритизируйте её немедленно."
+    elif "later" in combined:
+        suggested_priority = "low"
+        advice = "Это можно сделать позже. Нет спешки."
+    else:
+        suggested_priority = "medium"
+        advice = "Стандартный приоритет. Запланируйте соответственно."
+    return TaskAnalysis(advice=advice, suggested_priority=suggested_priority)
+
+
+def synthetic_tasks(count: int, seed: int):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    tasks = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(2, 6))
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(KEYWORDS))
+        title = " ".join(words).capitalize()
+        description = " ".join(rng.choices(WORDS, k=rng.randint(0, 30))) or None
+        due_date = now + timedelta(hours=rng.randint(-48, 24 * 14)) if rng.random() < 0.5 else None
+        tasks.append((title, description, due_date))
+    return tasks
+
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tasks = synthetic_tasks(args.tasks, args.seed)
+    legacy = measure(lambda: [legacy_analyze_task(t, d) for t, d, _ in tasks], args.repeat)
+    engine = AnalysisEngine()
+    current = measure(lambda: engine.analyze_many(tasks), args.repeat)
+
+    results = {"tasks": args.tasks, "speedup": round(legacy / current, 2)}
+    for name, seconds in (("legacy", legacy), ("engine", current)):
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "tasks_per_second": round(args.tasks / seconds),
+            "us_per_task": round(seconds / args.tasks * 1e6, 3),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
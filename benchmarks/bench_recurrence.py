@@ -0,0 +1,125 @@
+"""Micro-benchmark: lazy expansion of recurring series for a due window.
+
+Builds N synthetic series (daily/weekly/monthly, mixed intervals, weekdays,
+until/count) with dtstart spread over the past years and expands them for
+several windows starting now, the way GET /tasks?expand_series=true and
+/reminders do:
+
+    lazy  — recurrence.occurrences(): first index in the window is computed
+            arithmetically, cost does not depend on the age of the series;
+    naive — walk occurrence(rule, k) from k=0 until the window ends.
+
+Both paths must produce the same occurrences. No database is needed.
+
+    python benchmarks/bench_recurrence.py --series 10000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Модели тянут за собой database.py; соединение не открывается, нужен лишь URL
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")
+
+from recurrence import last_occurrence, occurrence, occurrences  # noqa: E402
+
+
+def synthetic_series(count: int, max_age_days: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    rows = []
+    for series_id in range(1, count + 1):
+        freq = rng.choice(("daily", "daily", "weekly", "weekly", "monthly"))
+        dtstart = now - timedelta(days=rng.randrange(max_age_days), minutes=rng.randrange(24 * 60))
+        rule = {
+            "id": series_id,
+            "dtstart": dtstart,
+            "freq": freq,
+            "interval": rng.choice((1, 1, 1, 2, 3)),
+            "weekdays": sorted(rng.sample(range(7), k=rng.randint(1, 5))) if freq == "weekly" and rng.random() < 0.6 else None,
+            "until": None,
+            "count": None,
+        }
+        # Немного конечных серий, большая часть ещё активна
+        ending = rng.random()
+        if ending < 0.1:
+            rule["until"] = now + timedelta(days=rng.randrange(1, 365))
+        elif ending < 0.15:
+            rule["count"] = rng.randint(max_age_days, max_age_days * 2)
+        rule["ends_at"] = last_occurrence(rule)
+        rows.append(rule)
+    return rows
+
+
+def naive_occurrences(rule, start: datetime, end: datetime):
+    k = 0
+    while rule["count"] is None or k < rule["count"]:
+        at = occurrence(rule, k)
+        if at >= end or (rule["until"] is not None and at > rule["until"]):
+            return
+        if at >= start:
+            yield at
+        k += 1
+
+
+def measure(expand: Callable, series: List[dict], start: datetime, end: datetime, repeats: int) -> dict:
+    found = sum(1 for row in series for _ in expand(row, start, end))
+    cpu_started = time.process_time()
+    for _ in range(repeats):
+        for row in series:
+            for _ in expand(row, start, end):
+                pass
+    cpu = (time.process_time() - cpu_started) / repeats
+    tracemalloc.start()
+    for row in series:
+        for _ in expand(row, start, end):
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "occurrences": found,
+        "ms_per_window": round(cpu * 1000, 2),
+        "us_per_series": round(cpu / len(series) * 10**6, 3),
+        "occurrences_per_second": round(found / cpu) if cpu else None,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(args) -> dict:
+    series = synthetic_series(args.series, args.max_age_days, args.seed)
+    start = datetime.utcnow()
+    results = {"series": args.series, "max_age_days": args.max_age_days, "windows": {}}
+    for days in args.windows:
+        end = start + timedelta(days=days)
+        # Как load_window: серии, закончившиеся до окна, в выборку не попадают
+        active = [row for row in series if row["dtstart"] < end and (row["ends_at"] is None or row["ends_at"] >= start)]
+        for row in active:
+            if list(occurrences(row, start, end)) != list(naive_occurrences(row, start, end)):
+                raise SystemExit(f"lazy expansion differs from the naive one for series {row['id']}")
+        window = {"active_series": len(active)}
+        window["lazy"] = measure(occurrences, active, start, end, args.repeats)
+        window["naive"] = measure(naive_occurrences, active, start, end, max(1, args.repeats // 10))
+        window["speedup"] = round(window["naive"]["ms_per_window"] / window["lazy"]["ms_per_window"], 1)
+        results["windows"][f"{days}d"] = window
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=10000)
+    parser.add_argument("--max-age-days", type=int, default=3 * 365)
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 7, 30])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Micro-benchmark: pydantic response path vs serialization.py for task lists.
+
+Both endpoints live in a throwaway FastAPI app and serve the same in-memory
+rows, so the numbers cover the whole framework path without a database:
+
+    legacy — Task.model_validate per row, then FastAPI validates again against
+             response_model=List[Task] and encodes the result;
+    fast   — task_dict + orjson, returned as a ready Response.
+
+    python benchmarks/bench_serialization.py --tasks 1000 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Модели тянут за собой database.py; соединение не открывается, нужен лишь URL
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from models import Task  # noqa: E402
+from serialization import json_response, task_dict  # noqa: E402
+
+
+def synthetic_rows(count: int, subtask_ratio: float, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    def row(task_id: int, parent_id=None) -> dict:
+        return {
+            "id": task_id,
+            "title": f"Task {rng.randrange(10**6)}",
+            "description": "lorem ipsum " * rng.randint(0, 10) or None,
+            "due_date": now + timedelta(minutes=rng.randrange(60 * 24 * 30)) if rng.random() < 0.5 else None,
+            "completed": rng.random() < 0.2,
+            "owner_id": 1,
+            "priority": rng.choice(("low", "medium", "high")),
+            "shared_with": rng.sample(range(2, 100), k=rng.randint(0, 3)),
+            "created_at": now,
+            "updated_at": now - timedelta(microseconds=rng.randrange(10**9)),
+            "plan_id": rng.choice((None, 1, 2)),
+            "parent_id": parent_id,
+            "series_id": None,
+            "occurrence_at": None,
+            "sub_tasks": [],
+        }
+
+    # Подзадачи вкладываются в sub_tasks случайных корней, как после build_trees
+    top = [row(i) for i in range(1, round(count * (1 - subtask_ratio)) + 1)]
+    for task_id in range(len(top) + 1, count + 1):
+        parent = rng.choice(top)
+        parent["sub_tasks"].append(row(task_id, parent["id"]))
+    return top
+
+
+def build_app(rows: List[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/legacy", response_model=List[Task])
+    async def legacy():
+        return [Task.model_validate(row) for row in rows]
+
+    @app.get("/fast", response_model=List[Task])
+    async def fast():
+        return json_response([task_dict(row) for row in rows])
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int) -> dict:
+    for _ in range(max(1, requests // 10)):
+        await client.get(path)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = await client.get(path)
+        response.raise_for_status()
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - started
+    return {
+        "cpu_ms_per_response": round(cpu / requests * 1000, 3),
+        "wall_ms_per_response": round(wall / requests * 1000, 3),
+        "bytes": len(response.content),
+    }
+
+
+async def run(args) -> dict:
+    rows = synthetic_rows(args.tasks, args.subtask_ratio, args.seed)
+    app = build_app(rows)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        legacy_body = (await client.get("/legacy")).content
+        fast_body = (await client.get("/fast")).content
+        if legacy_body != fast_body:
+            raise SystemExit("fast path output differs from the pydantic output")
+        results = {"tasks": args.tasks, "requests": args.requests}
+        for name in ("legacy", "fast"):
+            results[name] = await measure(client, f"/{name}", args.requests)
+    results["cpu_speedup"] = round(
+        results["legacy"]["cpu_ms_per_response"] / results["fast"]["cpu_ms_per_response"], 2
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--subtask-ratio", type=float, default=0.3)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
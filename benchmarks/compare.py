@@ -0,0 +1,32 @@
+"""Сравнение двух отчётов load_test.py: python benchmarks/compare.py base.json new.json"""
+import json
+import sys
+
+METRICS = (
+    ("throughput_rps", lambda r: r["throughput_rps"]),
+    ("p50_ms", lambda r: r["latency_ms"]["p50"]),
+    ("p95_ms", lambda r: r["latency_ms"]["p95"]),
+    ("p99_ms", lambda r: r["latency_ms"]["p99"]),
+    ("sql/req", lambda r: r["sql_statements_per_request"]),
+)
+
+
+def main(base_path: str, new_path: str) -> None:
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'endpoint':<14}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    for name, result in new["results"].items():
+        if name not in base["results"]:
+            continue
+        for metric, get in METRICS:
+            before, after = get(base["results"][name]), get(result)
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{name:<14}{metric:<16}{before:>12}{after:>12}{change:>10}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2])
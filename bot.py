@@ -1,23 +1,31 @@
 # bot.py
 import asyncio
-import os
-from aiogram import Bot, Dispatcher
-from dotenv import load_dotenv
+from aiogram import Dispatcher
 
 from handlers.start import router as start_router  # твой роутер /start
+from settings import settings
+from tg import bot
+from updates import ChatOrderingMiddleware, UpdateRunner
+from user_directory import user_directory
 
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-
-bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
+dp.update.outer_middleware(ChatOrderingMiddleware(settings.bot_update_concurrency))
 
 # Подключаем роутеры
 dp.include_router(start_router)
 
+# Для webhook-режима: апдейты приходят в FastAPI (routers/webhook.py)
+update_runner = UpdateRunner(dp, bot)
+
 async def main():
+    if settings.bot_webhook_url:
+        raise SystemExit("BOT_WEBHOOK_URL задан: апдейты принимает API, polling не нужен")
     print("Бот запущен...")
-    await dp.start_polling(bot, allowed_updates=["message"])
+    await bot.delete_webhook()
+    try:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types(), handle_as_tasks=True)
+    finally:
+        await user_directory.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
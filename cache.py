@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Protocol
+
+from fastapi import Request, Response
+
+CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+REDIS_URL = os.getenv("REDIS_URL")
+# Ключи счётчиков версий: v:{scope}:{user_id}
+VERSION_PREFIX = "v:"
+
+
+class CacheBackend(Protocol):
+    # Подмножество команд Redis; любой совместимый клиент (или фейк в тестах) подходит
+    async def get(self, key: str) -> Optional[bytes]: ...
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None: ...
+    async def incr(self, key: str) -> int: ...
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[Optional[float], bytes]] = OrderedDict()
+        # Счётчики версий — в своём LRU того же размера. Номера берутся из одной
+        # возрастающей последовательности на все счётчики, а вытесненный счётчик
+        # читается как _floor — номер не меньше любого уже выданного. Так версия
+        # после сброса никогда не возвращается к прежней и старые записи не находятся
+        self._counters: OrderedDict[str, int] = OrderedDict()
+        self._last_version = 0
+        self._floor = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if key.startswith(VERSION_PREFIX):
+            version = self._counters.get(key)
+            if version is None:
+                return str(self._floor).encode()
+            self._counters.move_to_end(key)
+            return str(version).encode()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ex if ex else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def incr(self, key: str) -> int:
+        return self.bump(key)
+
+    def bump(self, key: str) -> int:
+        self._last_version += 1
+        self._counters[key] = self._last_version
+        self._counters.move_to_end(key)
+        while len(self._counters) > self.maxsize:
+            self._counters.popitem(last=False)
+            self._floor = self._last_version
+        return self._last_version
+
+    def clear(self) -> None:
+        # Записей не осталось — счётчики больше ничего не защищают
+        self._entries.clear()
+        self._counters.clear()
+        self._floor = self._last_version
+
+
+class CachedResponse:
+    def __init__(self, body: bytes, headers: dict):
+        self.body = body
+        self.headers = headers
+        self.etag = headers["ETag"]
+
+    def dumps(self) -> bytes:
+        return json.dumps(self.headers).encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        headers, body = raw.split(b"\n", 1)
+        return cls(body, json.loads(headers))
+
+
+class ResponseCache:
+    """Кэш ответов списков по пользователю и фильтру.
+
+    Инвалидация — через номер версии пользователя в scope: запись с устаревшей
+    версией просто перестаёт находиться и вытесняется LRU/TTL. У MemoryBackend
+    версии свои в каждом воркере, поэтому сброс ещё и рассылается остальным
+    через канал ленты (feed.cache_events) и применяется в invalidate_local.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.local = isinstance(backend, MemoryBackend)
+
+    async def key(self, user_id: int, scope: str, request: Request) -> str:
+        version = int(await self.backend.get(f"{VERSION_PREFIX}{scope}:{user_id}") or 0)
+        params = "&".join(sorted(request.url.query.split("&")))
+        return f"r:{scope}:{user_id}:{version}:{params}"
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        raw = await self.backend.get(key)
+        return CachedResponse.loads(raw) if raw is not None else None
+
+    async def put(self, key: str, body: bytes, headers: Optional[dict] = None) -> CachedResponse:
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = CachedResponse(body, {**(headers or {}), "ETag": etag})
+        await self.backend.set(key, entry.dumps(), ex=self.ttl)
+        return entry
+
+    async def invalidate(self, user_ids: Iterable[int], *scopes: str) -> None:
+        for user_id in set(user_ids):
+            for scope in scopes:
+                await self.backend.incr(f"{VERSION_PREFIX}{scope}:{user_id}")
+
+    def invalidate_local(self, user_ids: Iterable[int], scopes: Iterable[str]) -> None:
+        # Сброс от другого воркера; счётчики Redis общие, там он уже применён
+        if self.local:
+            for user_id in set(user_ids):
+                for scope in scopes:
+                    self.backend.bump(f"{VERSION_PREFIX}{scope}:{user_id}")
+
+    def reset_local(self) -> None:
+        # Рассылки сбросов могли потеряться (обрыв LISTEN) — локальные записи не доверяем
+        if self.local:
+            self.backend.clear()
+
+
+def respond(request: Request, entry: CachedResponse) -> Response:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and entry.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=entry.headers)
+    return Response(content=entry.body, media_type="application/json", headers=entry.headers)
+
+
+def create_backend() -> CacheBackend:
+    if REDIS_URL:
+        # redis — опциональная зависимость, нужна только при REDIS_URL
+        from redis.asyncio import Redis
+        return Redis.from_url(REDIS_URL)
+    return MemoryBackend()
+
+
+response_cache = ResponseCache(create_backend())
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+from typing import Iterable
+
+import asyncpg
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "todo_changes"
+QUEUE_SIZE = 256
+RECONNECT_DELAY = 5
+# Лимит payload у NOTIFY — 8000 байт; крупные записи уходят без данных
+MAX_PAYLOAD = 7500
+
+RESYNC = {"kind": "workspace", "op": "resync"}
+# Пользователей в одном сбросе кэша: id до 10 цифр, так payload укладывается в MAX_PAYLOAD
+CACHE_EVENT_USERS = 500
+
+
+def encode_event(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False, default=lambda v: v.isoformat())
+
+
+def change_event(kind: str, op: str, row, users: Iterable[int]) -> str:
+    data = {key: row[key] for key in row.keys() if key != "sub_tasks"}
+    event = {"kind": kind, "op": op, "users": sorted(users), "data": data}
+    payload = encode_event(event)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = encode_event({**event, "data": {"id": data["id"]}, "partial": True})
+    return payload
+
+
+def cache_events(users: Iterable[int], *scopes: str) -> list[str]:
+    # Сброс кэша ответов для остальных воркеров; с Redis версии общие и рассылать нечего
+    if not response_cache.local:
+        return []
+    users = sorted(set(users))
+    return [
+        encode_event({"kind": "cache", "op": "invalidate", "scopes": list(scopes), "users": users[i:i + CACHE_EVENT_USERS]})
+        for i in range(0, len(users), CACHE_EVENT_USERS)
+    ]
+
+
+async def publish(db: AsyncSession, payloads: list[str]) -> None:
+    # Доставка идёт через Postgres, поэтому события видят все воркеры uvicorn,
+    # включая тот, что их отправил. NOTIFY срабатывает при commit
+    if not payloads:
+        return
+    payload = func.unnest(bindparam("payloads", payloads, type_=ARRAY(Text))).table_valued("payload")
+    await db.execute(select(func.pg_notify(CHANNEL, payload.c.payload)).select_from(payload))
+
+
+class ChangeFeed:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._listener: asyncio.Task | None = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def _offer(self, queue: asyncio.Queue, event: dict) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент: вместо накопления диффов — один сигнал перечитать списки
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+    def dispatch(self, event: dict) -> None:
+        users = event.pop("users", [])
+        if event["kind"] == "cache":
+            response_cache.invalidate_local(users, event["scopes"])
+            return
+        for user_id in users:
+            for queue in self._subscribers.get(user_id, ()):
+                self._offer(queue, event)
+
+    def resync_all(self) -> None:
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._offer(queue, RESYNC)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            self.dispatch(json.loads(payload))
+        except ValueError:
+            logger.warning("Malformed change notification: %r", payload)
+
+    async def start(self, database_url: str) -> None:
+        if self._listener is None:
+            dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+            self._listener = asyncio.create_task(self._listen(dsn))
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self, dsn: str) -> None:
+        connected_before = False
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+                terminated = asyncio.Event()
+                connection.add_termination_listener(lambda _: terminated.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                if connected_before:
+                    # Пока соединения не было, события могли потеряться
+                    self.resync_all()
+                    response_cache.reset_local()
+                connected_before = True
+                try:
+                    await terminated.wait()
+                finally:
+                    if not connection.is_closed():
+                        await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed listener failed, reconnecting")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+change_feed = ChangeFeed()
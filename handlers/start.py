@@ -2,10 +2,13 @@
 from aiogram import Router
 from aiogram.filters import CommandStart
 from aiogram.types import Message
-from sqlalchemy import select
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
 
 from database import async_session
 from models import TelegramUser  # Добавьте этот импорт!
+from schemas import TelegramUserOut
+from user_directory import USER_COLUMNS, user_directory
 
 router = Router(name="start")
 
@@ -14,28 +17,25 @@ router = Router(name="start")
 async def cmd_start(message: Message):
     user = message.from_user
 
+    values = dict(username=user.username, first_name=user.first_name, last_name=user.last_name)
+    # Регистрация пишется сразу, а не через накопление user_directory: ответ
+    # «ты зарегистрирован» не должен опережать строку в БД.
+    # xmax = 0 только у только что вставленной строки — так узнаём, новый ли пользователь
+    stmt = (
+        insert(TelegramUser)
+        .values(id=user.id, **values)
+        .on_conflict_do_update(index_elements=[TelegramUser.id], set_={**values, "updated_at": func.now()})
+        .returning(*USER_COLUMNS, literal_column("xmax = 0").label("inserted"))
+    )
     async with async_session() as session:
-        async with session.begin():
-            stmt = select(TelegramUser).where(TelegramUser.id == user.id)
-            result = await session.execute(stmt)
-            db_user = result.scalar_one_or_none()
+        row = dict((await session.execute(stmt)).mappings().one())
+        await session.commit()
 
-            if db_user:
-                db_user.username = user.username
-                db_user.first_name = user.first_name
-                db_user.last_name = user.last_name
-                text = f"Рад тебя видеть снова, {user.first_name}! 👋\nДанные обновлены."
-            else:
-                new_user = TelegramUser(
-                    id=user.id,
-                    username=user.username,
-                    first_name=user.first_name,
-                    last_name=user.last_name,
-                    avatar_url=None,
-                )
-                session.add(new_user)
-                text = f"Привет, {user.first_name}! 🎉\nТы зарегистрирован в системе задач."
+    inserted = row.pop("inserted")
+    user_directory.saved(TelegramUserOut.model_validate(row))
 
-            await session.commit()
-
-    await message.answer(text)
\ No newline at end of file
+    if inserted:
+        text = f"Привет, {user.first_name}! 🎉\nТы зарегистрирован в системе задач."
+    else:
+        text = f"Рад тебя видеть снова, {user.first_name}! 👋\nДанные обновлены."
+    await message.answer(text)
@@ -1,17 +1,36 @@
 from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware  # ← добавь этот импорт!
 import uvicorn
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 
+from routers.series import router as series_router
 from routers.tasks import router as tasks_router
 from tg import router as tg_router
 from routers.plans import router as plans_router
-from database import engine, Base, get_db
+from routers.transfer import router as transfer_router
+from routers.feed import router as feed_router
+from routers.sync import router as sync_router
+from routers.webhook import router as webhook_router, WEBHOOK_PATH
+from bot import dp, update_runner
+from tg import bot
+from user_directory import user_directory
+from database import engine, get_db, pool_metrics
+from migrations import run_migrations
+from feed import change_feed
+from metrics import MetricsMiddleware, instrument_engine, registry
+from settings import settings
+from queries import visible_to
+from reminders import reminder_scheduler, REMIND_BEFORE
+from archive import task_archiver
+from tombstones import tombstone_purger
 from register import TelegramUser, get_current_user
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
-from models import DBTask, Task
+from sqlalchemy import select
+from models import DBTask, DBTaskSeries, TASK_COLUMNS
+from recurrence import expand, load_window, occurrence_row
+from serialization import json_response, task_dict
 from fastapi.staticfiles import StaticFiles
 
 app = FastAPI(
@@ -29,29 +48,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Подключение роутеров
+app.add_middleware(MetricsMiddleware, server_timing=settings.metrics_server_timing)
+instrument_engine(engine.sync_engine, settings.db_slow_query_ms / 1000)
+
+# Подключение роутеров; series раньше tasks, иначе /tasks/series заберёт маршрут /{task_id}
+app.include_router(series_router, prefix="/tasks", tags=["tasks"])
 app.include_router(tasks_router, prefix="/tasks", tags=["tasks"])
 app.include_router(tg_router, prefix="/tg", tags=["telegram"])
 app.include_router(plans_router, prefix="/plans", tags=["plans"])
+app.include_router(transfer_router)
+app.include_router(feed_router)
+app.include_router(sync_router)
+if settings.bot_webhook_url:
+    # Очередь апдейтов одного чата живёт в памяти процесса (ChatOrderingMiddleware):
+    # при нескольких воркерах апдейты чата разошлись бы по ним и обгоняли друг друга
+    if settings.web_concurrency > 1:
+        raise RuntimeError("BOT_WEBHOOK_URL requires a single API worker (WEB_CONCURRENCY=1); run the bot with polling otherwise")
+    app.include_router(webhook_router)
 
 import asyncio
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
 
 @app.on_event("startup")
 async def startup():
     await init_db()
+    await reminder_scheduler.start()
+    await task_archiver.start()
+    await tombstone_purger.start()
+    await change_feed.start(settings.database_url)
+    if settings.bot_webhook_url:
+        # Каждый воркер выставляет один и тот же webhook — вызов идемпотентный
+        await bot.set_webhook(
+            settings.bot_webhook_url.rstrip("/") + WEBHOOK_PATH,
+            secret_token=settings.bot_webhook_secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+@app.on_event("shutdown")
+async def shutdown():
+    await reminder_scheduler.stop()
+    await task_archiver.stop()
+    await tombstone_purger.stop()
+    await change_feed.stop()
+    await update_runner.stop()
+    await user_directory.close()
 
 @app.get("/reminders")
 async def check_reminders(current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    stmt = select(DBTask).where(
-        or_(DBTask.owner_id == current_user.id, DBTask.shared_with.contains([current_user.id]))
-    ).where(DBTask.due_date < datetime.utcnow() + timedelta(hours=1))
-    result = await db.execute(stmt)
-    db_tasks = result.scalars().all()
-    return {"reminders": [Task.model_validate(t) for t in db_tasks]}
+    now = datetime.utcnow()
+    stmt = select(*TASK_COLUMNS).where(visible_to(DBTask, current_user.id)).where(
+        ~DBTask.completed,
+        DBTask.due_date >= now,
+        DBTask.due_date < now + REMIND_BEFORE,
+    )
+    reminders = [task_dict(row) for row in (await db.execute(stmt)).mappings()]
+    # Повторения серий, ещё не ставшие задачами, разворачиваются только на окно напоминаний
+    series, taken = await load_window(db, visible_to(DBTaskSeries, current_user.id), now, now + REMIND_BEFORE)
+    reminders += [task_dict(occurrence_row(row, at)) for row, at in expand(series, taken, now, now + REMIND_BEFORE)]
+    return json_response({"reminders": reminders})
+
+@app.get("/health/db")
+async def db_health():
+    return pool_metrics(engine)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    # Метрики в памяти процесса: при нескольких воркерах uvicorn каждый отдаёт свои
+    gauges = {f"db_pool_{name}": value for name, value in pool_metrics(engine).items()}
+    return registry.render(gauges)
 
 os.makedirs("static/avatars", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -0,0 +1,237 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [счётчики по бакетам (не накопительные), сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels((*self.labelnames, "le"), (*labels, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels((*self.labelnames, "le"), (*labels, "+Inf"))
+            lines.append(f"{self.name}_bucket{inf_labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, gauges: Optional[dict] = None) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"),
+))
+http_request_sql_statements = registry.register(Histogram(
+    "http_request_sql_statements", "SQL statements executed per HTTP request", ("route",), COUNT_BUCKETS,
+))
+http_request_db_duration = registry.register(Histogram(
+    "http_request_db_seconds", "Total SQL time per HTTP request", ("route",),
+))
+db_statements_total = registry.register(Counter("db_statements_total", "SQL statements executed"))
+db_slow_statements_total = registry.register(Counter("db_slow_statements_total", "SQL statements over the slow threshold"))
+telegram_request_duration = registry.register(Histogram(
+    "telegram_api_duration_seconds", "Telegram Bot API call latency", ("method",),
+))
+telegram_request_errors = registry.register(Counter(
+    "telegram_api_errors_total", "Failed Telegram Bot API calls", ("method",),
+))
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_seconds", "tg_count", "tg_seconds")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.tg_count = 0
+        self.tg_seconds = 0.0
+
+
+# Статистика текущего HTTP-запроса; SQLAlchemy переносит контекст в свои greenlet'ы
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def redact_parameters(parameters) -> str:
+    # В лог уходят только типы: значения могут содержать initData, тексты задач и т.п.
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: <{type(v).__name__}>" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"<{len(parameters)} parameter sets>"
+        return "(" + ", ".join(f"<{type(v).__name__}>" for v in parameters) + ")"
+    return f"<{type(parameters).__name__}>"
+
+
+def instrument_engine(engine: Engine, slow_query_seconds: float) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_statements_total.inc()
+        stats = request_stats.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+        if elapsed >= slow_query_seconds:
+            db_slow_statements_total.inc()
+            logger.warning(
+                "Slow query (%.1f ms): %s; parameters: %s",
+                elapsed * 1000, " ".join(statement.split()), redact_parameters(parameters),
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: латентность по маршрутам, число SQL и время БД на запрос."""
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", self._server_timing(stats, started).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_stats.reset(token)
+            route = scope.get("route")
+            # Шаблон пути, а не сам путь: иначе id задач раздуют число серий
+            route = getattr(route, "path", None) or UNMATCHED_ROUTE
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], route, status_code)
+            http_request_sql_statements.observe(stats.sql_count, route)
+            http_request_db_duration.observe(stats.sql_seconds, route)
+
+    @staticmethod
+    def _server_timing(stats: RequestStats, started: float) -> str:
+        parts = [
+            f"app;dur={(time.perf_counter() - started) * 1000:.1f}",
+            f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} queries"',
+        ]
+        if stats.tg_count:
+            parts.append(f'tg;dur={stats.tg_seconds * 1000:.1f};desc="{stats.tg_count} calls"')
+        return ", ".join(parts)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            telegram_request_errors.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            telegram_request_duration.observe(elapsed, name)
+            stats = request_stats.get()
+            if stats is not None:
+                stats.tg_count += 1
+                stats.tg_seconds += elapsed
@@ -0,0 +1,403 @@
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, func, Integer, MetaData, String, Table, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from models import SEARCH_VECTOR_SQL
+
+# Произвольный ключ advisory-lock: воркеры uvicorn стартуют одновременно,
+# мигрирует только тот, кто первым взял блокировку
+MIGRATION_LOCK_ID = 48151623
+
+
+# SQL счётчиков планов зафиксирован здесь на момент миграций 7 и 9: правки
+# plan_stats.py не должны менять уже применённые шаги
+_PLAN_COUNTERS = "total, completed, high, medium, low"
+_PLAN_DELTAS = (
+    "sum(sign)",
+    "sum(CASE WHEN completed THEN sign ELSE 0 END)",
+    "sum(CASE WHEN priority = 'high' THEN sign ELSE 0 END)",
+    "sum(CASE WHEN priority = 'medium' THEN sign ELSE 0 END)",
+    "sum(CASE WHEN priority = 'low' THEN sign ELSE 0 END)",
+)
+
+
+def _plan_stats_delta(source: str) -> str:
+    return f"""
+            INSERT INTO plan_stats (plan_id, {_PLAN_COUNTERS})
+            SELECT plan_id, {", ".join(_PLAN_DELTAS)}
+            FROM ({source}) AS changes
+            WHERE plan_id IS NOT NULL
+            GROUP BY plan_id
+            HAVING {" OR ".join(f"{d} <> 0" for d in _PLAN_DELTAS)}
+            ORDER BY plan_id
+            ON CONFLICT (plan_id) DO UPDATE SET total = plan_stats.total + EXCLUDED.total,
+                completed = plan_stats.completed + EXCLUDED.completed, high = plan_stats.high + EXCLUDED.high,
+                medium = plan_stats.medium + EXCLUDED.medium, low = plan_stats.low + EXCLUDED.low;"""
+
+
+def _plan_stats_repair(source: str) -> str:
+    return f"""
+        INSERT INTO plan_stats (plan_id, {_PLAN_COUNTERS})
+        SELECT p.id, count(t.id), count(t.id) FILTER (WHERE t.completed),
+               count(t.id) FILTER (WHERE t.priority = 'high'), count(t.id) FILTER (WHERE t.priority = 'medium'),
+               count(t.id) FILTER (WHERE t.priority = 'low')
+        FROM plans p LEFT JOIN {source} t ON t.plan_id = p.id
+        GROUP BY p.id
+        ORDER BY p.id
+        ON CONFLICT (plan_id) DO UPDATE SET total = EXCLUDED.total, completed = EXCLUDED.completed,
+            high = EXCLUDED.high, medium = EXCLUDED.medium, low = EXCLUDED.low
+        WHERE (plan_stats.total, plan_stats.completed, plan_stats.high, plan_stats.medium, plan_stats.low)
+            IS DISTINCT FROM (EXCLUDED.total, EXCLUDED.completed, EXCLUDED.high, EXCLUDED.medium, EXCLUDED.low)
+    """
+
+
+PLAN_STATS_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION plan_stats_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN{_plan_stats_delta("SELECT plan_id, 1 AS sign, completed, priority FROM new_rows")}
+        ELSIF TG_OP = 'DELETE' THEN{_plan_stats_delta("SELECT plan_id, -1 AS sign, completed, priority FROM old_rows")}
+        ELSE{_plan_stats_delta(
+            "SELECT plan_id, 1 AS sign, completed, priority FROM new_rows "
+            "UNION ALL SELECT plan_id, -1, completed, priority FROM old_rows"
+        )}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def _plan_stats_triggers(table: str, events) -> list:
+    transitions = {
+        "INSERT": "NEW TABLE AS new_rows",
+        "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "DELETE": "OLD TABLE AS old_rows",
+    }
+    steps = []
+    for event in events:
+        name = f"{table}_plan_stats_{event.lower()}"
+        steps.append(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        steps.append(
+            f"CREATE TRIGGER {name} AFTER {event} ON {table} REFERENCING {transitions[event]} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION plan_stats_apply()"
+        )
+    return steps
+
+
+# Схема, которую приложение создавало до появления миграций (Base.metadata.create_all).
+# Миграция 1 строит её, а не текущие модели: на свежей базе дальше по порядку
+# применяются те же шаги, что и на старых, и им есть на что ссылаться
+# (например, индексам миграции 2 — на колонки shared_with)
+BASELINE = MetaData()
+Table(
+    "plans", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, nullable=False),
+    Column("owner_id", Integer, nullable=False),
+    Column("shared_with", ARRAY(Integer)),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+Table(
+    "tasks", BASELINE,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, nullable=False),
+    Column("description", String),
+    Column("due_date", DateTime),
+    Column("priority", String),
+    Column("owner_id", Integer, nullable=False),
+    Column("shared_with", ARRAY(Integer)),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("plan_id", Integer, ForeignKey("plans.id"), nullable=True),
+    Column("parent_id", Integer, ForeignKey("tasks.id"), nullable=True),
+    Column("completed", Boolean),
+)
+Table(
+    "telegram_users", BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("username", String(100), unique=True),
+    Column("first_name", String(100), nullable=False),
+    Column("last_name", String(100)),
+    Column("avatar_url", String(500)),
+    Column("updated_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+
+# Все шаги после миграции 1 идемпотентны (IF NOT EXISTS / CREATE OR REPLACE):
+# базы, созданные до их появления, уже могли содержать часть объектов.
+# Применённые шаги не меняются: исправления — только новыми номерами
+MIGRATIONS = [
+    (1, "initial schema", [
+        lambda sync_conn: BASELINE.create_all(sync_conn),
+    ]),
+    (2, "visibility indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_tasks_owner_updated ON tasks (owner_id, updated_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_shared_with ON tasks USING gin (shared_with)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_plan_id ON tasks (plan_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_parent_id ON tasks (parent_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_due_date_open ON tasks (due_date) WHERE NOT completed",
+        "CREATE INDEX IF NOT EXISTS ix_plans_owner_id ON plans (owner_id)",
+        "CREATE INDEX IF NOT EXISTS ix_plans_shared_with ON plans USING gin (shared_with)",
+    ]),
+    (3, "reminder dedup", [
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS reminder_sent_for TIMESTAMP",
+    ]),
+    (4, "avatar cache", [
+        "ALTER TABLE telegram_users ADD COLUMN IF NOT EXISTS avatar_file_unique_id VARCHAR(100)",
+        "ALTER TABLE telegram_users ADD COLUMN IF NOT EXISTS avatar_checked_at TIMESTAMP",
+    ]),
+    # change_seq — id транзакции (xid8), изменившей строку. В отличие от
+    # sequence, он позволяет /sync выдать токен pg_snapshot_xmin: всё, что
+    # меньше него, уже закоммичено, так что долгие транзакции не теряются
+    (5, "change sequence and tombstones", [
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS change_seq BIGINT",
+        "ALTER TABLE plans ADD COLUMN IF NOT EXISTS change_seq BIGINT",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_change_seq ON tasks (change_seq)",
+        "CREATE INDEX IF NOT EXISTS ix_plans_change_seq ON plans (change_seq)",
+        """
+        CREATE TABLE IF NOT EXISTS tombstones (
+            id BIGSERIAL PRIMARY KEY,
+            kind VARCHAR NOT NULL,
+            entity_id INTEGER NOT NULL,
+            user_ids INTEGER[] NOT NULL,
+            change_seq BIGINT NOT NULL,
+            deleted_at TIMESTAMP DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_tombstones_user_ids ON tombstones USING gin (user_ids)",
+        "CREATE INDEX IF NOT EXISTS ix_tombstones_change_seq ON tombstones (change_seq)",
+        """
+        CREATE OR REPLACE FUNCTION set_change_seq() RETURNS trigger AS $$
+        BEGIN
+            NEW.change_seq := pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO tombstones (kind, entity_id, user_ids, change_seq)
+            VALUES (TG_ARGV[0], OLD.id, array_prepend(OLD.owner_id, coalesce(OLD.shared_with, '{}')),
+                    pg_current_xact_id()::text::bigint);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS tasks_change_seq ON tasks",
+        "CREATE TRIGGER tasks_change_seq BEFORE INSERT OR UPDATE ON tasks FOR EACH ROW EXECUTE FUNCTION set_change_seq()",
+        "DROP TRIGGER IF EXISTS plans_change_seq ON plans",
+        "CREATE TRIGGER plans_change_seq BEFORE INSERT OR UPDATE ON plans FOR EACH ROW EXECUTE FUNCTION set_change_seq()",
+        "DROP TRIGGER IF EXISTS tasks_tombstone ON tasks",
+        "CREATE TRIGGER tasks_tombstone AFTER DELETE ON tasks FOR EACH ROW EXECUTE FUNCTION record_tombstone('task')",
+        "DROP TRIGGER IF EXISTS plans_tombstone ON plans",
+        "CREATE TRIGGER plans_tombstone AFTER DELETE ON plans FOR EACH ROW EXECUTE FUNCTION record_tombstone('plan')",
+        "UPDATE tasks SET change_seq = pg_current_xact_id()::text::bigint WHERE change_seq IS NULL",
+        "UPDATE plans SET change_seq = pg_current_xact_id()::text::bigint WHERE change_seq IS NULL",
+    ]),
+    (6, "task full-text search", [
+        f"ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING gin (search_vector)",
+    ]),
+    (7, "plan stats counters", [
+        """
+        CREATE TABLE IF NOT EXISTS plan_stats (
+            plan_id INTEGER PRIMARY KEY REFERENCES plans (id) ON DELETE CASCADE,
+            total INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            high INTEGER NOT NULL DEFAULT 0,
+            medium INTEGER NOT NULL DEFAULT 0,
+            low INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_tasks_plan_open_due ON tasks (plan_id, due_date) WHERE NOT completed",
+        PLAN_STATS_FUNCTION_SQL,
+        *_plan_stats_triggers("tasks", ("INSERT", "UPDATE", "DELETE")),
+        _plan_stats_repair("tasks"),
+    ]),
+    (8, "shares table", [
+        """
+        CREATE TABLE IF NOT EXISTS shares (
+            resource_type VARCHAR(16) NOT NULL,
+            resource_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            role VARCHAR(16) NOT NULL DEFAULT 'viewer',
+            created_at TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (resource_type, resource_id, user_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_shares_user ON shares (user_id, resource_type, resource_id)",
+        """
+        CREATE OR REPLACE FUNCTION shared_users(kind VARCHAR, entity_id INTEGER) RETURNS INTEGER[] AS $$
+            SELECT ARRAY(
+                SELECT user_id FROM shares
+                WHERE resource_type = kind AND resource_id = entity_id
+                ORDER BY user_id
+            )
+        $$ LANGUAGE sql STABLE
+        """,
+        # Перенос массивов; на свежей базе колонок shared_with уже нет
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'tasks' AND column_name = 'shared_with') THEN
+                INSERT INTO shares (resource_type, resource_id, user_id)
+                SELECT DISTINCT 'task', t.id, u.user_id FROM tasks t, unnest(t.shared_with) AS u(user_id)
+                WHERE u.user_id IS NOT NULL AND u.user_id <> t.owner_id
+                ON CONFLICT DO NOTHING;
+                ALTER TABLE tasks DROP COLUMN shared_with;
+            END IF;
+            IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'plans' AND column_name = 'shared_with') THEN
+                INSERT INTO shares (resource_type, resource_id, user_id)
+                SELECT DISTINCT 'plan', p.id, u.user_id FROM plans p, unnest(p.shared_with) AS u(user_id)
+                WHERE u.user_id IS NOT NULL AND u.user_id <> p.owner_id
+                ON CONFLICT DO NOTHING;
+                ALTER TABLE plans DROP COLUMN shared_with;
+            END IF;
+        END
+        $$
+        """,
+        # Участники удалённого ресурса уходят в tombstone, их строки в shares удаляются
+        """
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            WITH removed AS (
+                DELETE FROM shares WHERE resource_type = TG_ARGV[0] AND resource_id = OLD.id
+                RETURNING user_id
+            )
+            INSERT INTO tombstones (kind, entity_id, user_ids, change_seq)
+            SELECT TG_ARGV[0], OLD.id, array_prepend(OLD.owner_id, coalesce(array_agg(user_id), '{}')),
+                   pg_current_xact_id()::text::bigint
+            FROM removed;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+    (9, "tasks archive", [
+        # Секции по месяцам создаёт archive.ensure_partition перед каждым переносом
+        """
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER NOT NULL,
+            archived_at TIMESTAMP NOT NULL,
+            title VARCHAR NOT NULL,
+            description VARCHAR,
+            due_date TIMESTAMP,
+            priority VARCHAR,
+            owner_id INTEGER NOT NULL,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            plan_id INTEGER,
+            parent_id INTEGER,
+            completed BOOLEAN,
+            PRIMARY KEY (id, archived_at)
+        ) PARTITION BY RANGE (archived_at)
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_tasks_archive_owner ON tasks_archive (owner_id, archived_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_archive_id ON tasks_archive (id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_archive_parent_id ON tasks_archive (parent_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_completed_updated ON tasks (updated_at, id) WHERE completed",
+        *_plan_stats_triggers("tasks_archive", ("INSERT", "DELETE")),
+        # Пересчёт с учётом архива: архивные задачи остаются в итогах плана
+        _plan_stats_repair("""(
+            SELECT id, plan_id, completed, priority FROM tasks
+            UNION ALL
+            SELECT id, plan_id, completed, priority FROM tasks_archive
+        )"""),
+        # При архивации (todo.archiving = on) задача пропадает у всех через tombstone,
+        # но её строки в shares остаются до восстановления
+        """
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('todo.archiving', true) = 'on' THEN
+                INSERT INTO tombstones (kind, entity_id, user_ids, change_seq)
+                VALUES (TG_ARGV[0], OLD.id, array_prepend(OLD.owner_id, shared_users(TG_ARGV[0], OLD.id)),
+                        pg_current_xact_id()::text::bigint);
+            ELSE
+                WITH removed AS (
+                    DELETE FROM shares WHERE resource_type = TG_ARGV[0] AND resource_id = OLD.id
+                    RETURNING user_id
+                )
+                INSERT INTO tombstones (kind, entity_id, user_ids, change_seq)
+                SELECT TG_ARGV[0], OLD.id, array_prepend(OLD.owner_id, coalesce(array_agg(user_id), '{}')),
+                       pg_current_xact_id()::text::bigint
+                FROM removed;
+            END IF;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+    (10, "recurring task series", [
+        """
+        CREATE TABLE IF NOT EXISTS task_series (
+            id SERIAL PRIMARY KEY,
+            owner_id INTEGER NOT NULL,
+            title VARCHAR NOT NULL,
+            description VARCHAR,
+            priority VARCHAR,
+            plan_id INTEGER REFERENCES plans (id) ON DELETE SET NULL,
+            dtstart TIMESTAMP NOT NULL,
+            freq VARCHAR(16) NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 1,
+            until TIMESTAMP,
+            count INTEGER,
+            weekdays INTEGER[],
+            ends_at TIMESTAMP,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_task_series_owner ON task_series (owner_id, dtstart)",
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS series_id INTEGER REFERENCES task_series (id) ON DELETE SET NULL",
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS occurrence_at TIMESTAMP",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_tasks_series_occurrence ON tasks (series_id, occurrence_at)",
+        "ALTER TABLE tasks_archive ADD COLUMN IF NOT EXISTS series_id INTEGER",
+        "ALTER TABLE tasks_archive ADD COLUMN IF NOT EXISTS occurrence_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_archive_series ON tasks_archive (series_id, occurrence_at)",
+    ]),
+    # Индексы миграции 2 на shared_with уходят вместе с колонками в миграции 8;
+    # удаление записано отдельным шагом, а не правкой миграции 2
+    (11, "drop shared_with indexes", [
+        "DROP INDEX IF EXISTS ix_tasks_shared_with",
+        "DROP INDEX IF EXISTS ix_plans_shared_with",
+    ]),
+    (12, "series reminders", [
+        "ALTER TABLE task_series ADD COLUMN IF NOT EXISTS reminder_sent_for TIMESTAMP",
+    ]),
+    (13, "tombstone retention", [
+        """
+        CREATE TABLE IF NOT EXISTS sync_horizon (
+            id BOOLEAN PRIMARY KEY DEFAULT true CONSTRAINT sync_horizon_single_row CHECK (id),
+            purged_seq BIGINT NOT NULL
+        )
+        """,
+    ]),
+]
+
+
+async def run_migrations(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+        result = await conn.execute(text("SELECT version FROM schema_migrations"))
+        applied = set(result.scalars().all())
+
+        for version, name, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            for step in steps:
+                if callable(step):
+                    await conn.run_sync(step)
+                else:
+                    await conn.execute(text(step))
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :at)"),
+                {"v": version, "n": name, "at": datetime.utcnow()},
+            )
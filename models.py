@@ -1,12 +1,40 @@
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy import Column, Integer, String, DateTime, ARRAY, func, ForeignKey, Boolean
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import CheckConstraint, Column, BigInteger, Computed, Integer, String, DateTime, func, ForeignKey, Boolean, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import Mapped, column_property, deferred, mapped_column, relationship
 from database import Base
 
+# Задачи пишут и по-русски, и по-английски: индексируем текст в обеих
+# конфигурациях, чтобы работали стемминг и стоп-слова для каждого языка
+SEARCH_CONFIGS = ("russian", "english")
+SEARCH_DOCUMENT = "coalesce(title, '') || ' ' || coalesce(description, '')"
+SEARCH_VECTOR_SQL = " || ".join(f"to_tsvector('{c}'::regconfig, {SEARCH_DOCUMENT})" for c in SEARCH_CONFIGS)
+
+class DBShare(Base):
+    # Доступ к задаче или плану: одна строка на пару (ресурс, пользователь).
+    # Первичный ключ отвечает на «кому открыт ресурс», ix_shares_user — на «что открыто мне»
+    __tablename__ = "shares"
+
+    resource_type = Column(String(16), primary_key=True)
+    resource_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    role = Column(String(16), nullable=False, server_default="viewer")
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_shares_user", "user_id", "resource_type", "resource_id"),
+    )
+
+def shared_users(resource_type: str, resource_id):
+    # SQL-функция shared_users (migrations.py), а не коррелированный подзапрос:
+    # в RETURNING у INSERT SQLAlchemy не умеет коррелировать подзапрос с целевой таблицей
+    return func.shared_users(resource_type, resource_id, type_=ARRAY(Integer)).label("shared_with")
+
 class DBTask(Base):
     __tablename__ = "tasks"
+    share_kind = "task"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -14,17 +42,45 @@ class DBTask(Base):
     due_date = Column(DateTime)
     priority = Column(String)
     owner_id = Column(Integer, nullable=False)
-    shared_with = Column(ARRAY(Integer), default=[])
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     plan_id = Column(Integer, ForeignKey("plans.id"), nullable=True)
     parent_id = Column(Integer, ForeignKey("tasks.id"), nullable=True)
     completed = Column(Boolean, default=False)
+    reminder_sent_for = Column(DateTime, nullable=True)
+    # Проставляется триггером set_change_seq (см. migrations.py)
+    change_seq = Column(BigInteger, nullable=True)
+    # Материализованное повторение серии (recurrence.py): серия и плановое время повторения
+    series_id = Column(Integer, ForeignKey("task_series.id", ondelete="SET NULL"), nullable=True)
+    occurrence_at = Column(DateTime, nullable=True)
+    # Генерируемая колонка: Postgres сам пересчитывает её при изменении title/description
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
+    # Только для чтения: участники из shares, меняются через /share
+    shared_with = column_property(shared_users("task", id))
 
     plan = relationship("DBPlan", back_populates="tasks")
     parent = relationship("DBTask", back_populates="sub_tasks", remote_side=[id])
     sub_tasks: Mapped[List["DBTask"]] = relationship("DBTask", back_populates="parent", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_tasks_owner_updated", "owner_id", text("updated_at DESC"), text("id DESC")),
+        Index("ix_tasks_plan_id", "plan_id"),
+        Index("ix_tasks_parent_id", "parent_id"),
+        Index("ix_tasks_due_date_open", "due_date", postgresql_where=text("NOT completed")),
+        Index("ix_tasks_change_seq", "change_seq"),
+        Index("ix_tasks_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_tasks_plan_open_due", "plan_id", "due_date", postgresql_where=text("NOT completed")),
+        # Поиск кандидатов на архивацию (archive.py)
+        Index("ix_tasks_completed_updated", "updated_at", "id", postgresql_where=text("completed")),
+        Index("ix_tasks_series_occurrence", "series_id", "occurrence_at", unique=True),
+    )
+
+TASK_FIELDS = (
+    "id", "title", "description", "due_date", "completed", "owner_id", "priority",
+    "shared_with", "created_at", "updated_at", "plan_id", "parent_id", "series_id", "occurrence_at",
+)
+TASK_COLUMNS = [getattr(DBTask, f) for f in TASK_FIELDS]
+
 class TaskBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -43,10 +99,13 @@ class TaskUpdate(BaseModel):
     completed: Optional[bool] = None
 
 class TaskAnalysis(BaseModel):
+    # Неизменяемый: analysis.py отдаёт одни и те же экземпляры на все задачи
+    model_config = ConfigDict(frozen=True)
+
     advice: str
     suggested_priority: str
 
-class Task(TaskBase):
+class TaskFields(TaskBase):
     id: int
     owner_id: int
     priority: Optional[str] = None
@@ -55,25 +114,186 @@ class Task(TaskBase):
     updated_at: datetime
     plan_id: Optional[int] = None
     parent_id: Optional[int] = None
-    sub_tasks: List["Task"] = []
+    series_id: Optional[int] = None
+    occurrence_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+class Task(TaskFields):
+    sub_tasks: List["Task"] = []
+
+class TaskTreeNode(TaskFields):
+    # Плоское представление поддерева: depth 0 — корень, path — id от корня до узла
+    depth: int
+    path: List[int]
+
+class TaskListItem(BaseModel):
+    # Элемент GET /tasks: при fields= приходят только запрошенные поля.
+    # У неразвёрнутого в строку повторения серии (expand_series) id нет
+    id: Optional[int]
+    title: Optional[str] = None
+    description: Optional[str] = None
+    due_date: Optional[datetime] = None
+    completed: Optional[bool] = None
+    owner_id: Optional[int] = None
+    priority: Optional[str] = None
+    shared_with: Optional[List[int]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    plan_id: Optional[int] = None
+    parent_id: Optional[int] = None
+    series_id: Optional[int] = None
+    occurrence_at: Optional[datetime] = None
+    sub_tasks: Optional[List[Task]] = None
+    sub_task_count: Optional[int] = None
+
+SHARE_ROLES = Literal["viewer", "editor"]
+
 class ShareTask(BaseModel):
     user_id: int
+    role: SHARE_ROLES = "viewer"
+
+MAX_BATCH_SIZE = 500
+
+class TaskBatchUpdate(TaskUpdate):
+    id: int
+
+class TaskBatchIds(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class TaskBatchComplete(TaskBatchIds):
+    completed: bool = True
+
+class TaskBatchShare(TaskBatchIds):
+    user_id: int
+    role: SHARE_ROLES = "viewer"
+
+class TaskBatchResult(BaseModel):
+    id: Optional[int] = None
+    ok: bool
+    error: Optional[str] = None
+    task: Optional[Task] = None
 
 class DBPlan(Base):
     __tablename__ = "plans"
+    share_kind = "plan"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     owner_id = Column(Integer, nullable=False)
-    shared_with = Column(ARRAY(Integer), default=[])
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = Column(BigInteger, nullable=True)
+    shared_with = column_property(shared_users("plan", id))
 
     tasks: Mapped[List["DBTask"]] = relationship("DBTask", back_populates="plan")
 
+    __table_args__ = (
+        Index("ix_plans_owner_id", "owner_id"),
+        Index("ix_plans_change_seq", "change_seq"),
+    )
+
+class DBTaskSeries(Base):
+    # Шаблон повторяющейся задачи; повторения разворачиваются на лету (recurrence.py),
+    # в tasks попадают только выполненные или изменённые
+    __tablename__ = "task_series"
+    share_kind = "series"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, nullable=False)
+    title = Column(String, nullable=False)
+    description = Column(String)
+    priority = Column(String)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="SET NULL"), nullable=True)
+    dtstart = Column(DateTime, nullable=False)
+    freq = Column(String(16), nullable=False)
+    interval = Column(Integer, nullable=False, server_default="1")
+    until = Column(DateTime)
+    count = Column(Integer)
+    # 0 — понедельник; только для weekly
+    weekdays = Column(ARRAY(Integer))
+    # Последнее повторение по until/count; NULL — бесконечная серия
+    ends_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Последнее повторение, о котором напомнили (reminders.py); повторения идут по возрастанию
+    reminder_sent_for = Column(DateTime, nullable=True)
+    shared_with = column_property(shared_users("series", id))
+
+    __table_args__ = (
+        Index("ix_task_series_owner", "owner_id", "dtstart"),
+    )
+
+class DBPlanStats(Base):
+    # Счётчики задач плана; поддерживаются триггером plan_stats_apply (см. plan_stats.py)
+    __tablename__ = "plan_stats"
+
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), primary_key=True)
+    total = Column(Integer, nullable=False, server_default="0")
+    completed = Column(Integer, nullable=False, server_default="0")
+    high = Column(Integer, nullable=False, server_default="0")
+    medium = Column(Integer, nullable=False, server_default="0")
+    low = Column(Integer, nullable=False, server_default="0")
+
+class DBTaskArchive(Base):
+    # Выполненные задачи, перенесённые из tasks задачей архивации (archive.py).
+    # Секционирована по месяцам archived_at; секции создаёт сама архивация.
+    # Доступы остаются в shares, поэтому visible_to работает и здесь
+    __tablename__ = "tasks_archive"
+    share_kind = "task"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    archived_at = Column(DateTime, primary_key=True)
+    title = Column(String, nullable=False)
+    description = Column(String)
+    due_date = Column(DateTime)
+    priority = Column(String)
+    owner_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    plan_id = Column(Integer)
+    parent_id = Column(Integer)
+    completed = Column(Boolean)
+    series_id = Column(Integer)
+    occurrence_at = Column(DateTime)
+    shared_with = column_property(shared_users("task", id))
+
+    __table_args__ = (
+        Index("ix_tasks_archive_owner", "owner_id", text("archived_at DESC"), text("id DESC")),
+        Index("ix_tasks_archive_id", "id"),
+        Index("ix_tasks_archive_parent_id", "parent_id"),
+        Index("ix_tasks_archive_series", "series_id", "occurrence_at"),
+        {"postgresql_partition_by": "RANGE (archived_at)"},
+    )
+
+class DBTombstone(Base):
+    # След удалённой задачи или плана для /sync; пишется триггером record_tombstone
+    __tablename__ = "tombstones"
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    user_ids = Column(ARRAY(Integer), nullable=False)
+    change_seq = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tombstones_user_ids", "user_ids", postgresql_using="gin"),
+        Index("ix_tombstones_change_seq", "change_seq"),
+    )
+
+class DBSyncHorizon(Base):
+    # Одна строка: наибольший change_seq среди tombstones, удалённых по сроку хранения
+    # (tombstones.py). Токену /sync не новее него нужна полная синхронизация
+    __tablename__ = "sync_horizon"
+
+    id = Column(Boolean, primary_key=True, server_default=text("true"))
+    purged_seq = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        CheckConstraint("id", name="sync_horizon_single_row"),
+    )
+
 class TelegramUser(Base):
     __tablename__ = "telegram_users"
 
@@ -82,6 +302,8 @@ class TelegramUser(Base):
     first_name: Mapped[str] = mapped_column(String(100))
     last_name: Mapped[str | None] = mapped_column(String(100))
     avatar_url: Mapped[str | None] = mapped_column(String(500))
+    avatar_file_unique_id: Mapped[str | None] = mapped_column(String(100))
+    avatar_checked_at: Mapped[datetime | None] = mapped_column(DateTime)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, server_default=func.now(), onupdate=func.now()
     )
@@ -0,0 +1,113 @@
+"""Счётчики задач по планам.
+
+Итоги по плану (всего, выполнено, по приоритетам) хранятся в plan_stats и
+меняются триггерами на tasks на уровне оператора: пакетные вставки и импорт
+дают одно обновление на план, а не на строку. overdue зависит от времени,
+поэтому считается при чтении по частичному индексу ix_tasks_plan_open_due.
+Те же триггеры висят на tasks_archive: перенос задачи в архив даёт -1 и +1,
+так что архивные задачи остаются в итогах плана. Сами триггеры создают
+миграции 7 и 9 (migrations.py).
+
+Ручной пересчёт (например, после TRUNCATE или правки данных в обход триггеров):
+
+    python plan_stats.py [--plan-id 1 --plan-id 2]
+"""
+import argparse
+import asyncio
+import json
+from typing import List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import DBPlan, DBPlanStats, DBTask
+
+PRIORITIES = ("high", "medium", "low")
+COUNTERS = ("total", "completed", *PRIORITIES)
+
+
+def _repair_sql(where: str = "") -> str:
+    counts = ", ".join([
+        "count(t.id)",
+        "count(t.id) FILTER (WHERE t.completed)",
+        *(f"count(t.id) FILTER (WHERE t.priority = '{p}')" for p in PRIORITIES),
+    ])
+    columns = ", ".join(COUNTERS)
+    return f"""
+        INSERT INTO plan_stats (plan_id, {columns})
+        SELECT p.id, {counts}
+        FROM plans p LEFT JOIN (
+            SELECT id, plan_id, completed, priority FROM tasks
+            UNION ALL
+            SELECT id, plan_id, completed, priority FROM tasks_archive
+        ) t ON t.plan_id = p.id
+        {where}
+        GROUP BY p.id
+        ORDER BY p.id
+        ON CONFLICT (plan_id) DO UPDATE SET {", ".join(f"{c} = EXCLUDED.{c}" for c in COUNTERS)}
+        WHERE ({", ".join(f"plan_stats.{c}" for c in COUNTERS)})
+            IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in COUNTERS)})
+        RETURNING plan_id
+    """
+
+
+REPAIR_ALL_SQL = _repair_sql()
+REPAIR_SOME_SQL = _repair_sql("WHERE p.id = ANY(:plan_ids)")
+
+_overdue = (
+    select(func.count())
+    .where(
+        DBTask.plan_id == DBPlan.id,
+        ~DBTask.completed,
+        DBTask.due_date < func.timezone("UTC", func.now()),
+    )
+    .correlate(DBPlan)
+    .scalar_subquery()
+)
+
+# Колонки для select(...).outerjoin(DBPlanStats, ...): у плана без задач строки в plan_stats ещё нет
+STATS_COLUMNS = [
+    *(func.coalesce(getattr(DBPlanStats, c), 0).label(f"stats_{c}") for c in COUNTERS),
+    _overdue.label("stats_overdue"),
+]
+STATS_JOIN = (DBPlanStats, DBPlanStats.plan_id == DBPlan.id)
+
+
+def stats_from_row(row) -> dict:
+    # Словарь в порядке полей PlanStats — уходит в ответ без повторной валидации
+    return {
+        "total": row["stats_total"],
+        "completed": row["stats_completed"],
+        "overdue": row["stats_overdue"],
+        "by_priority": {p: row[f"stats_{p}"] for p in PRIORITIES},
+    }
+
+
+async def repair_plan_stats(db: AsyncSession, plan_ids: Optional[List[int]] = None) -> List[int]:
+    """Пересчитывает счётчики с нуля и возвращает id планов, где они разошлись."""
+    # SHARE блокирует запись в tasks и архив до конца транзакции: иначе дельта
+    # параллельной транзакции потерялась бы при перезаписи итогов
+    await db.execute(text("LOCK TABLE tasks, tasks_archive IN SHARE MODE"))
+    if plan_ids is None:
+        result = await db.execute(text(REPAIR_ALL_SQL))
+    else:
+        result = await db.execute(text(REPAIR_SOME_SQL), {"plan_ids": plan_ids})
+    repaired = list(result.scalars())
+    await db.commit()
+    return repaired
+
+
+async def main() -> None:
+    from database import async_session, engine
+
+    parser = argparse.ArgumentParser(description="Recompute plan_stats counters")
+    parser.add_argument("--plan-id", type=int, action="append", dest="plan_ids")
+    args = parser.parse_args()
+    async with async_session() as db:
+        repaired = await repair_plan_stats(db, args.plan_ids)
+    print(json.dumps({"repaired": repaired}))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+from sqlalchemy import exists, or_, select, union_all
+
+from models import DBShare
+
+
+def visible_ids(model, user_id: int):
+    # Две ветки вместо OR: владелец идёт по btree на owner_id, общий доступ — по ix_shares_user
+    return union_all(
+        select(model.id).where(model.owner_id == user_id),
+        select(DBShare.resource_id).where(DBShare.user_id == user_id, DBShare.resource_type == model.share_kind),
+    )
+
+
+def visible_to(model, user_id: int):
+    return model.id.in_(visible_ids(model, user_id))
+
+
+def shared_with_user(model, user_id: int):
+    # «Открыто мне»: только ресурсы из shares пользователя, чужие строки не читаются
+    return model.id.in_(
+        select(DBShare.resource_id).where(DBShare.user_id == user_id, DBShare.resource_type == model.share_kind)
+    )
+
+
+def editable_by(model, user_id: int):
+    # Менять ресурс может владелец и участник с ролью editor; viewer только читает
+    return or_(
+        model.owner_id == user_id,
+        exists().where(
+            DBShare.resource_type == model.share_kind, DBShare.resource_id == model.id,
+            DBShare.user_id == user_id, DBShare.role == "editor",
+        ),
+    )
@@ -0,0 +1,169 @@
+"""Повторяющиеся задачи.
+
+Серия (task_series) хранит правило в духе RRULE: freq daily/weekly/monthly,
+interval, until/count и для weekly — дни недели. Повторения не хранятся:
+генератор occurrences() считает их только для запрошенного окна, причём
+номер первого повторения в окне вычисляется арифметически, а не перебором
+с dtstart, так что цена окна не зависит от возраста серии. Строкой в tasks
+повторение становится, только когда его выполнили или изменили
+(series_id + occurrence_at); такие повторения при развёртке пропускаются.
+
+Отличие от RFC 5545: monthly по 29–31 числу в коротком месяце сдвигается
+на последний день месяца, а не пропускается — иначе k-е повторение нельзя
+было бы вычислить без перебора. Все времена — naive UTC, как и due_date.
+"""
+from calendar import monthrange
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from analysis import analysis_engine
+from models import DBTask, DBTaskArchive, DBTaskSeries
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+# Самое длинное окно развёртки в GET /tasks
+MAX_WINDOW = timedelta(days=366)
+
+SERIES_FIELDS = (
+    "id", "owner_id", "title", "description", "priority", "plan_id", "shared_with",
+    "dtstart", "freq", "interval", "until", "count", "weekdays", "ends_at", "created_at", "updated_at",
+)
+SERIES_COLUMNS = [getattr(DBTaskSeries, f) for f in SERIES_FIELDS]
+
+
+def _add_months(start: datetime, months: int) -> datetime:
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    day = min(start.day, monthrange(year, month + 1)[1])
+    return start.replace(year=year, month=month + 1, day=day)
+
+
+def _week_slots(rule) -> Tuple[datetime, List[int], int]:
+    # Неделя серии начинается с понедельника недели dtstart; дни до dtstart в первой неделе не в счёт
+    dtstart = rule["dtstart"]
+    days = sorted(set(rule["weekdays"]))
+    week_start = dtstart - timedelta(days=dtstart.weekday())
+    skipped = sum(1 for d in days if d < dtstart.weekday())
+    return week_start, days, skipped
+
+
+def occurrence(rule, k: int) -> datetime:
+    """k-е повторение серии (с нуля) без учёта until/count."""
+    dtstart, freq, interval = rule["dtstart"], rule["freq"], rule["interval"]
+    if freq == "daily":
+        return dtstart + timedelta(days=interval * k)
+    if freq == "monthly":
+        return _add_months(dtstart, interval * k)
+    if not rule["weekdays"]:
+        return dtstart + timedelta(weeks=interval * k)
+    week_start, days, skipped = _week_slots(rule)
+    week, slot = divmod(k + skipped, len(days))
+    return week_start + timedelta(weeks=interval * week, days=days[slot])
+
+
+def first_index(rule, moment: datetime) -> int:
+    """Номер первого повторения не раньше moment."""
+    dtstart, freq, interval = rule["dtstart"], rule["freq"], rule["interval"]
+    if moment <= dtstart:
+        return 0
+    # Оценка снизу, дальше — несколько шагов вперёд
+    if freq == "daily":
+        k = (moment - dtstart) // timedelta(days=interval)
+    elif freq == "monthly":
+        months = (moment.year - dtstart.year) * 12 + moment.month - dtstart.month
+        k = max(0, months // interval - 1)
+    elif not rule["weekdays"]:
+        k = (moment - dtstart) // timedelta(weeks=interval)
+    else:
+        week_start, days, skipped = _week_slots(rule)
+        k = max(0, (moment - week_start) // timedelta(weeks=interval) * len(days) - skipped)
+    while occurrence(rule, k) < moment:
+        k += 1
+    return k
+
+
+def occurrences(rule, start: datetime, end: datetime) -> Iterator[datetime]:
+    """Повторения в окне [start, end) с учётом until и count."""
+    count, until = rule["count"], rule["until"]
+    k = first_index(rule, start)
+    while count is None or k < count:
+        at = occurrence(rule, k)
+        if at >= end or (until is not None and at > until):
+            return
+        yield at
+        k += 1
+
+
+def last_occurrence(rule) -> Optional[datetime]:
+    """Последнее повторение конечной серии; None — серия бесконечна или пуста."""
+    candidates = []
+    if rule["count"] is not None:
+        candidates.append(occurrence(rule, rule["count"] - 1))
+    if rule["until"] is not None:
+        k = first_index(rule, rule["until"] + timedelta(microseconds=1)) - 1
+        if k < 0:
+            return None
+        candidates.append(occurrence(rule, k))
+    return min(candidates) if candidates else None
+
+
+def is_occurrence(rule, moment: datetime) -> bool:
+    k = first_index(rule, moment)
+    return (
+        occurrence(rule, k) == moment
+        and (rule["count"] is None or k < rule["count"])
+        and (rule["until"] is None or moment <= rule["until"])
+    )
+
+
+def occurrence_row(series, at: datetime, now: Optional[datetime] = None) -> dict:
+    # Повторение в виде строки задачи; id нет, пока его не материализовали.
+    # У серии приоритет только по тексту, срок у каждого повторения свой
+    priority = analysis_engine.analyze(series["title"], series["description"], at, now).suggested_priority
+    return {
+        "id": None,
+        "title": series["title"],
+        "description": series["description"],
+        "due_date": at,
+        "completed": False,
+        "owner_id": series["owner_id"],
+        "priority": priority,
+        "shared_with": series["shared_with"],
+        "created_at": series["created_at"],
+        "updated_at": series["updated_at"],
+        "plan_id": series["plan_id"],
+        "parent_id": None,
+        "series_id": series["id"],
+        "occurrence_at": at,
+    }
+
+
+async def load_window(db: AsyncSession, series_clause, start: datetime, end: datetime, *extra_columns):
+    """Серии, у которых могут быть повторения в [start, end), и уже материализованные повторения окна."""
+    stmt = select(*SERIES_COLUMNS, *extra_columns).where(
+        series_clause,
+        DBTaskSeries.dtstart < end,
+        or_(DBTaskSeries.ends_at.is_(None), DBTaskSeries.ends_at >= start),
+    )
+    series = (await db.execute(stmt)).mappings().all()
+    if not series:
+        return series, set()
+    ids = [row["id"] for row in series]
+    # Выполненное повторение могло уже уйти в архив — его тоже не показываем
+    taken = union_all(*(
+        select(model.series_id, model.occurrence_at).where(
+            model.series_id.in_(ids), model.occurrence_at >= start, model.occurrence_at < end,
+        )
+        for model in (DBTask, DBTaskArchive)
+    ))
+    return series, set((await db.execute(taken)).all())
+
+
+def expand(series: Iterable, taken: Set[Tuple[int, datetime]], start: datetime, end: datetime) -> Iterator[tuple]:
+    """(серия, время) для ещё не материализованных повторений окна."""
+    for row in series:
+        for at in occurrences(row, start, end):
+            if (row["id"], at) not in taken:
+                yield row, at
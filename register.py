@@ -1,9 +1,22 @@
+import hashlib
 import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import APIKeyHeader
 from telegram_init_data import validate, parse, TelegramInitDataError
 from pydantic import BaseModel
 
+from user_directory import user_directory
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+INIT_DATA_EXPIRES_IN = 3600
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "10000"))
+
 
 class TelegramUser(BaseModel):
     id: int
@@ -13,6 +26,48 @@ class TelegramUser(BaseModel):
 init_data_header = APIKeyHeader(name="X-Telegram-Init-Data", auto_error=False)
 
 
+class InitDataCache:
+    """LRU кэш уже проверенных initData: digest заголовка -> (expires_at, user)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[float, TelegramUser]] = OrderedDict()
+
+    @staticmethod
+    def key(init_data_raw: str) -> bytes:
+        return hashlib.blake2b(init_data_raw.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> TelegramUser | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return user
+
+    def put(self, key: bytes, user: TelegramUser, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return
+        self._entries[key] = (expires_at, user)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+init_data_cache = InitDataCache(INIT_DATA_CACHE_SIZE)
+
+
 async def get_current_user(
     init_data_raw: str = Depends(init_data_header)
 ) -> TelegramUser:
@@ -23,31 +78,35 @@ async def get_current_user(
             detail="Telegram initData missing"
         )
 
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
+    if not BOT_TOKEN:
         raise HTTPException(
             status_code=500,
             detail="BOT_TOKEN not configured in environment"
         )
 
+    cache_key = InitDataCache.key(init_data_raw)
+    cached = init_data_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         validate(
             value=init_data_raw,
-            token=bot_token,
-            expires_in=3600,
+            token=BOT_TOKEN,
+            options={"expires_in": INIT_DATA_EXPIRES_IN},
         )
 
         parsed = parse(init_data_raw)
 
-        user_data = parsed.user
+        user_data = parsed.get("user")
         if not user_data:
             raise ValueError("User data not found in initData")
 
-        return TelegramUser(
-            id=user_data.id,
-            first_name=user_data.first_name,
-            last_name=user_data.last_name,
-            username=user_data.username,
+        user = TelegramUser(
+            id=user_data["id"],
+            first_name=user_data.get("first_name"),
+            last_name=user_data.get("last_name"),
+            username=user_data.get("username"),
         )
 
     except TelegramInitDataError as e:
@@ -59,4 +118,10 @@ async def get_current_user(
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Unexpected error during initData validation: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    # initData остаётся валидной до auth_date + expires_in — столько и храним
+    init_data_cache.put(cache_key, user, parsed["auth_date"] + INIT_DATA_EXPIRES_IN)
+    # Профиль из свежей initData пополняет справочник (запись отложенная и пачкой)
+    user_directory.record(user.id, user.username, user.first_name, user.last_name)
+    return user
@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+from sqlalchemy import exists, or_, select, true, update as sa_update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import async_session
+from models import DBTask, DBTaskSeries
+from recurrence import expand, load_window, occurrences
+from tg import bot
+
+logger = logging.getLogger(__name__)
+
+REMIND_BEFORE = timedelta(hours=1)
+# Сколько времени вперёд держим в куче; дальше задачи догружаются порциями
+LOAD_HORIZON = timedelta(hours=6)
+RETRY_DELAY = 30
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ReminderScheduler:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        bot: Bot,
+        remind_before: timedelta = REMIND_BEFORE,
+        horizon: timedelta = LOAD_HORIZON,
+    ):
+        self.session_factory = session_factory
+        self.bot = bot
+        self.remind_before = remind_before
+        self.horizon = horizon
+        # (fire_at, kind, id, due_date), kind — "task" или "series";
+        # устаревшие записи отбрасываются при извлечении
+        self._heap: list[tuple[datetime, str, int, datetime]] = []
+        self._scheduled: dict[int, datetime] = {}
+        # Повторения серий, ещё не ставшие строками tasks: (series_id, occurrence_at)
+        self._occurrences: set[tuple[int, datetime]] = set()
+        self._loaded_until: datetime | None = None
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    def schedule(self, task_id: int, due_date: datetime | None, completed: bool | None = False) -> None:
+        self._scheduled.pop(task_id, None)
+        if self._loaded_until is None or due_date is None or completed:
+            return
+        due_date = to_utc_naive(due_date)
+        fire_at = due_date - self.remind_before
+        # Задачи за пределами загруженного окна подхватит следующая догрузка
+        if due_date <= datetime.utcnow() or fire_at > self._loaded_until:
+            return
+        self._push(task_id, due_date)
+        self._wakeup.set()
+
+    def unschedule(self, task_id: int) -> None:
+        self._scheduled.pop(task_id, None)
+
+    def schedule_series(self, series) -> None:
+        # Новая серия: её повторения в уже загруженном окне. Удалённую серию
+        # снимать не нужно — _fire_series её просто не найдёт
+        if self._loaded_until is None:
+            return
+        for at in occurrences(series, datetime.utcnow(), self._loaded_until + self.remind_before):
+            self._push_occurrence(series["id"], at)
+        self._wakeup.set()
+
+    def _push(self, task_id: int, due_date: datetime) -> None:
+        self._scheduled[task_id] = due_date
+        heapq.heappush(self._heap, (due_date - self.remind_before, "task", task_id, due_date))
+
+    def _push_occurrence(self, series_id: int, at: datetime) -> None:
+        if (series_id, at) in self._occurrences:
+            return
+        self._occurrences.add((series_id, at))
+        heapq.heappush(self._heap, (at - self.remind_before, "series", series_id, at))
+
+    async def _load(self, now: datetime) -> None:
+        until = now + self.horizon
+        due_from = now if self._loaded_until is None else self._loaded_until + self.remind_before
+        stmt = select(DBTask.id, DBTask.due_date).where(
+            ~DBTask.completed,
+            DBTask.due_date > max(due_from, now),
+            DBTask.due_date <= until + self.remind_before,
+            DBTask.reminder_sent_for.is_distinct_from(DBTask.due_date),
+        )
+        # Повторения серий — в том же окне, полуоткрытом: следующая догрузка начнётся с его конца
+        start, end = max(due_from, now), until + self.remind_before
+        async with self.session_factory() as session:
+            rows = (await session.execute(stmt)).all()
+            series, taken = await load_window(session, true(), start, end, DBTaskSeries.reminder_sent_for)
+        for task_id, due_date in rows:
+            if task_id not in self._scheduled:
+                self._push(task_id, due_date)
+        for row, at in expand(series, taken, start, end):
+            if row["reminder_sent_for"] is None or at > row["reminder_sent_for"]:
+                self._push_occurrence(row["id"], at)
+        self._loaded_until = until
+
+    async def _fire(self, task_id: int, due_date: datetime) -> None:
+        # Условный UPDATE — это и есть дедупликация: напоминание для данного
+        # due_date отправит только один воркер и только один раз
+        stmt = (
+            sa_update(DBTask)
+            .where(
+                DBTask.id == task_id,
+                DBTask.due_date == due_date,
+                ~DBTask.completed,
+                DBTask.reminder_sent_for.is_distinct_from(due_date),
+            )
+            .values(reminder_sent_for=due_date)
+            .returning(DBTask.title, DBTask.owner_id, DBTask.shared_with)
+        )
+        async with self.session_factory() as session:
+            row = (await session.execute(stmt)).one_or_none()
+            await session.commit()
+        if row is not None:
+            await self._send(row, due_date, f"task {task_id}")
+
+    async def _fire_series(self, series_id: int, at: datetime) -> None:
+        # Та же дедупликация, но на серии: повторения идут по возрастанию, так что
+        # хватает отметки о последнем. Повторение, ставшее строкой tasks, напоминает
+        # о себе как задача. updated_at серии не трогаем — её правило не менялось
+        stmt = (
+            sa_update(DBTaskSeries)
+            .where(
+                DBTaskSeries.id == series_id,
+                or_(DBTaskSeries.reminder_sent_for.is_(None), DBTaskSeries.reminder_sent_for < at),
+                ~exists().where(DBTask.series_id == series_id, DBTask.occurrence_at == at),
+            )
+            .values(reminder_sent_for=at, updated_at=DBTaskSeries.updated_at)
+            .returning(DBTaskSeries.title, DBTaskSeries.owner_id, DBTaskSeries.shared_with)
+        )
+        async with self.session_factory() as session:
+            row = (await session.execute(stmt)).one_or_none()
+            await session.commit()
+        if row is not None:
+            await self._send(row, at, f"series {series_id}")
+
+    async def _send(self, row, due_date: datetime, what: str) -> None:
+        title, owner_id, shared_with = row
+        text = f"⏰ Напоминание: «{title}» — срок {due_date:%d.%m %H:%M} UTC"
+        for chat_id in {owner_id, *(shared_with or [])}:
+            try:
+                await self.bot.send_message(chat_id, text)
+            except Exception:
+                logger.exception("Failed to send reminder for %s to %s", what, chat_id)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                now = datetime.utcnow()
+                if self._loaded_until is None or now + self.horizon / 2 >= self._loaded_until:
+                    await self._load(now)
+
+                while self._heap and self._heap[0][0] <= now:
+                    _, kind, entity_id, due_date = heapq.heappop(self._heap)
+                    if kind == "series":
+                        self._occurrences.discard((entity_id, due_date))
+                        await self._fire_series(entity_id, due_date)
+                        continue
+                    if self._scheduled.get(entity_id) != due_date:
+                        continue
+                    del self._scheduled[entity_id]
+                    await self._fire(entity_id, due_date)
+
+                timeout = (self._loaded_until - self.horizon / 2 - now).total_seconds()
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reminder scheduler iteration failed")
+                timeout = RETRY_DELAY
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+
+reminder_scheduler = ReminderScheduler(async_session, bot)
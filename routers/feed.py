@@ -0,0 +1,34 @@
+import asyncio
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from feed import change_feed, encode_event
+from register import get_current_user, TelegramUser
+
+router = APIRouter(tags=["feed"])
+
+KEEPALIVE_SECONDS = 15
+
+
+@router.get("/feed")
+async def change_stream(current_user: TelegramUser = Depends(get_current_user)):
+    async def events():
+        queue = change_feed.subscribe(current_user.id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['kind']}\ndata: {encode_event(event)}\n\n"
+        finally:
+            change_feed.unsubscribe(current_user.id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
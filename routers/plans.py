@@ -1,73 +1,135 @@
 from datetime import datetime
-from typing import List
+from typing import Iterable, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select, or_, update as sa_update
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import and_, select, insert, update as sa_update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
+from cache import response_cache, respond
 from database import get_db
-from models import DBPlan, DBTask  # Добавьте DBTask сюда!
+from feed import cache_events, change_event, publish
+from models import DBPlan, DBTask, ShareTask  # Добавьте DBTask сюда!
+from plan_stats import STATS_COLUMNS, STATS_JOIN, stats_from_row
+from queries import editable_by, shared_with_user, visible_to
 from register import get_current_user, TelegramUser
-from schemas import Plan, PlanCreate, PlanUpdate
+from schemas import Plan, PlanCreate, PlanDetail, PlanStats, PlanUpdate
+from serialization import dumps, json_response, plan_detail_dict, plan_dict
+from sharing import access_revoked, grant, revoke
+from task_tree import load_trees
 
 router = APIRouter(prefix="/plans", tags=["plans"])
 
 
+PLAN_COLUMNS = [DBPlan.id, DBPlan.title, DBPlan.owner_id, DBPlan.shared_with, DBPlan.created_at, DBPlan.updated_at]
+
+
+async def plans_changed(db: AsyncSession, rows, revoked: Iterable[int] = ()) -> None:
+    # Как tasks_changed: события публикуются в транзакции изменения, затем commit
+    audience = set(revoked)
+    payloads = []
+    for row in rows:
+        users = {row["owner_id"], *(row["shared_with"] or [])}
+        audience |= users
+        payloads.append(change_event("plan", "upsert", row, users))
+    await publish(db, payloads + cache_events(audience, "plans"))
+    await db.commit()
+    await response_cache.invalidate(audience, "plans")
+
+
 @router.post("", response_model=Plan)
 async def create_plan(
     plan: PlanCreate,
     current_user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    new_plan = DBPlan(
+    stmt = insert(DBPlan).values(
         title=plan.title,
         owner_id=current_user.id,
-        shared_with=[],
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
-    )
-    db.add(new_plan)
-    await db.commit()
-    await db.refresh(new_plan)
-    return Plan.model_validate(new_plan)
+    ).returning(*PLAN_COLUMNS)
+    row = (await db.execute(stmt)).mappings().one()
+    await plans_changed(db, [row])
+    return json_response(plan_dict(row))
 
 
 @router.get("", response_model=List[Plan])
 async def list_plans(
+    request: Request,
     current_user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(DBPlan).options(
-        joinedload(DBPlan.tasks).joinedload(DBTask.sub_tasks)
-    ).where(
-        or_(
-            DBPlan.owner_id == current_user.id,
-            DBPlan.shared_with.contains([current_user.id])
+    cache_key = await response_cache.key(current_user.id, "plans", request)
+    entry = await response_cache.get(cache_key)
+    if entry is None:
+        stmt = (
+            select(*PLAN_COLUMNS, *STATS_COLUMNS)
+            .outerjoin(*STATS_JOIN)
+            .where(visible_to(DBPlan, current_user.id))
         )
+        result = await db.execute(stmt)
+        plans = [plan_dict(p, stats_from_row(p)) for p in result.mappings()]
+        entry = await response_cache.put(cache_key, dumps(plans))
+    return respond(request, entry)
+
+
+@router.get("/shared", response_model=List[Plan])
+async def list_shared_plans(
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    stmt = (
+        select(*PLAN_COLUMNS, *STATS_COLUMNS)
+        .outerjoin(*STATS_JOIN)
+        .where(shared_with_user(DBPlan, current_user.id))
+        .order_by(DBPlan.updated_at.desc(), DBPlan.id.desc())
     )
     result = await db.execute(stmt)
-    db_plans = result.unique().scalars().all()
-    return [Plan.model_validate(p) for p in db_plans]
+    return json_response([plan_dict(p, stats_from_row(p)) for p in result.mappings()])
 
 
-@router.get("/{plan_id}", response_model=Plan)
+@router.get("/{plan_id}", response_model=PlanDetail)
 async def get_plan(
     plan_id: int,
+    include_tasks: bool = Query(False, description="Include top-level tasks with their sub-task trees"),
     current_user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(DBPlan).options(
-        joinedload(DBPlan.tasks).joinedload(DBTask.sub_tasks)
-    ).where(DBPlan.id == plan_id)
-
+    stmt = (
+        select(*PLAN_COLUMNS, *STATS_COLUMNS)
+        .outerjoin(*STATS_JOIN)
+        .where(DBPlan.id == plan_id, visible_to(DBPlan, current_user.id))
+    )
     result = await db.execute(stmt)
-    p = result.scalar_one_or_none()
+    p = result.mappings().one_or_none()
 
-    if p is None or (p.owner_id != current_user.id and current_user.id not in p.shared_with):
+    if p is None:
         raise HTTPException(status_code=404, detail="План не найден")
 
-    return Plan.model_validate(p)
+    tasks = None
+    if include_tasks:
+        # Участнику плана видны только задачи, открытые ему самому; подзадачи — через корень
+        tasks = await load_trees(
+            db, and_(DBTask.plan_id == plan_id, DBTask.parent_id.is_(None), visible_to(DBTask, current_user.id))
+        )
+    return json_response(plan_detail_dict(p, stats_from_row(p), tasks))
+
+
+@router.get("/{plan_id}/stats", response_model=PlanStats)
+async def get_plan_stats(
+    plan_id: int,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    stmt = (
+        select(*STATS_COLUMNS)
+        .outerjoin(*STATS_JOIN)
+        .where(DBPlan.id == plan_id, visible_to(DBPlan, current_user.id))
+    )
+    p = (await db.execute(stmt)).mappings().one_or_none()
+    if p is None:
+        raise HTTPException(status_code=404, detail="План не найден")
+    return json_response(stats_from_row(p))
 
 
 @router.put("/{plan_id}", response_model=Plan)
@@ -77,28 +139,72 @@ async def update_plan(
     current_user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(DBPlan).where(
-        DBPlan.id == plan_id,
-        DBPlan.owner_id == current_user.id
+    update_dict = update_data.dict(exclude_unset=True)
+    update_dict["updated_at"] = datetime.utcnow()
+
+    stmt = (
+        sa_update(DBPlan)
+        .where(DBPlan.id == plan_id, editable_by(DBPlan, current_user.id))
+        .values(**update_dict)
+        .returning(*PLAN_COLUMNS)
+        .execution_options(synchronize_session=False)
     )
-    result = await db.execute(stmt)
-    plan = result.scalar_one_or_none()
+    row = (await db.execute(stmt)).mappings().one_or_none()
 
-    if plan is None:
+    if row is None:
+        raise HTTPException(
+            status_code=404,
+            detail="План не найден или у вас нет прав на изменение"
+        )
+
+    await plans_changed(db, [row])
+    return json_response(plan_dict(row))
+
+
+async def touch_plan(db: AsyncSession, plan_id: int, owner_id: int, changed: bool):
+    # Изменение доступа двигает updated_at, чтобы план подхватили /sync и кэш
+    if changed:
+        stmt = (
+            sa_update(DBPlan)
+            .where(DBPlan.id == plan_id)
+            .values(updated_at=datetime.utcnow())
+            .returning(*PLAN_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        stmt = select(*PLAN_COLUMNS).where(DBPlan.id == plan_id, DBPlan.owner_id == owner_id)
+    row = (await db.execute(stmt)).mappings().one_or_none()
+    if row is None:
         raise HTTPException(
             status_code=404,
             detail="План не найден или вы не являетесь владельцем"
         )
+    return row
 
-    update_dict = update_data.dict(exclude_unset=True)
-    update_dict["updated_at"] = datetime.utcnow()
 
-    await db.execute(
-        sa_update(DBPlan)
-        .where(DBPlan.id == plan_id)
-        .values(**update_dict)
-    )
-    await db.commit()
-    await db.refresh(plan)
+@router.post("/{plan_id}/share", response_model=Plan)
+async def share_plan(
+    plan_id: int,
+    share: ShareTask,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    changed = (await db.execute(grant(DBPlan, [plan_id], current_user.id, share.user_id, share.role))).first() is not None
+    row = await touch_plan(db, plan_id, current_user.id, changed)
+    await plans_changed(db, [row] if changed else [])
+    return json_response(plan_dict(row))
+
 
-    return Plan.model_validate(plan)
\ No newline at end of file
+@router.delete("/{plan_id}/share/{user_id}", response_model=Plan)
+async def unshare_plan(
+    plan_id: int,
+    user_id: int,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    changed = (await db.execute(revoke(DBPlan, [plan_id], current_user.id, user_id))).first() is not None
+    if changed:
+        await access_revoked(db, "plan", [plan_id], user_id)
+    row = await touch_plan(db, plan_id, current_user.id, changed)
+    await plans_changed(db, [row] if changed else [], revoked=[user_id] if changed else [])
+    return json_response(plan_dict(row))
@@ -0,0 +1,152 @@
+from datetime import datetime
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import delete as sa_delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from analysis import analysis_engine
+from cache import response_cache
+from database import get_db
+from feed import cache_events, publish
+from models import DBPlan, DBTask, DBTaskArchive, DBTaskSeries, Task, TASK_COLUMNS
+from queries import visible_to
+from recurrence import SERIES_COLUMNS, is_occurrence, last_occurrence, occurrence_row
+from register import get_current_user, TelegramUser
+from reminders import reminder_scheduler, to_utc_naive
+from routers.tasks import tasks_changed
+from schemas import OccurrenceUpdate, TaskSeries, TaskSeriesCreate
+from serialization import json_response, task_dict
+
+router = APIRouter(prefix="/tasks/series", tags=["tasks"])
+
+NOT_FOUND = "Series not found or not authorized"
+PLAN_NOT_FOUND = "Plan not found or not authorized"
+
+
+@router.post("", response_model=TaskSeries)
+async def create_series(
+    series: TaskSeriesCreate,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    rule = series.model_dump()
+    rule["dtstart"] = to_utc_naive(series.dtstart)
+    if series.until is not None:
+        rule["until"] = to_utc_naive(series.until)
+        if rule["until"] < rule["dtstart"]:
+            raise HTTPException(status_code=400, detail="until must not be earlier than dtstart")
+    if series.weekdays is not None:
+        if series.freq != "weekly":
+            raise HTTPException(status_code=400, detail="weekdays are only supported for freq=weekly")
+        if any(d not in range(7) for d in series.weekdays):
+            raise HTTPException(status_code=400, detail="weekdays must be in 0..6 (0 is Monday)")
+    if series.plan_id is not None:
+        stmt = select(DBPlan.id).where(DBPlan.id == series.plan_id, visible_to(DBPlan, current_user.id))
+        if await db.scalar(stmt) is None:
+            raise HTTPException(status_code=404, detail=PLAN_NOT_FOUND)
+
+    now = datetime.utcnow()
+    # Приоритет серии — только по тексту; срок учитывается у каждого повторения (occurrence_row)
+    analysis = analysis_engine.analyze(series.title, series.description)
+    stmt = insert(DBTaskSeries).values(
+        **rule,
+        owner_id=current_user.id,
+        priority=analysis.suggested_priority,
+        ends_at=last_occurrence(rule),
+        created_at=now,
+        updated_at=now,
+    ).returning(*SERIES_COLUMNS)
+    row = (await db.execute(stmt)).mappings().one()
+    await publish(db, cache_events([current_user.id], "tasks"))
+    await db.commit()
+    reminder_scheduler.schedule_series(row)
+    await response_cache.invalidate([current_user.id], "tasks")
+    return TaskSeries.model_validate(dict(row))
+
+
+@router.get("", response_model=List[TaskSeries])
+async def list_series(
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    stmt = select(*SERIES_COLUMNS).where(visible_to(DBTaskSeries, current_user.id)).order_by(DBTaskSeries.id)
+    rows = (await db.execute(stmt)).mappings().all()
+    return [TaskSeries.model_validate(dict(row)) for row in rows]
+
+
+@router.delete("/{series_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_series(
+    series_id: int,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Материализованные повторения остаются обычными задачами (series_id -> NULL)
+    stmt = (
+        sa_delete(DBTaskSeries)
+        .where(DBTaskSeries.id == series_id, DBTaskSeries.owner_id == current_user.id)
+        .returning(DBTaskSeries.owner_id, DBTaskSeries.shared_with)
+    )
+    row = (await db.execute(stmt)).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    audience = {row.owner_id, *row.shared_with}
+    await publish(db, cache_events(audience, "tasks"))
+    await db.commit()
+    await response_cache.invalidate(audience, "tasks")
+
+
+@router.post("/{series_id}/occurrences", response_model=Task)
+async def update_occurrence(
+    series_id: int,
+    update: OccurrenceUpdate,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Выполнение или правка повторения превращает его в строку tasks; повторный
+    # вызов для того же occurrence_at правит уже созданную строку
+    stmt = select(*SERIES_COLUMNS).where(DBTaskSeries.id == series_id, DBTaskSeries.owner_id == current_user.id)
+    series = (await db.execute(stmt)).mappings().one_or_none()
+    if series is None:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    occurrence_at = to_utc_naive(update.occurrence_at)
+    if not is_occurrence(series, occurrence_at):
+        raise HTTPException(status_code=400, detail="occurrence_at is not an occurrence of this series")
+    stmt = select(DBTaskArchive.id).where(
+        DBTaskArchive.series_id == series_id, DBTaskArchive.occurrence_at == occurrence_at,
+    ).limit(1)
+    archived_id = await db.scalar(stmt)
+    if archived_id is not None:
+        raise HTTPException(status_code=409, detail=f"Occurrence is archived as task {archived_id}; restore it instead")
+
+    changes = update.model_dump(exclude_unset=True, exclude={"occurrence_at"})
+    if any(f in changes for f in ("title", "description", "due_date")) and "priority" not in changes:
+        analysis = analysis_engine.analyze(
+            changes.get("title", series["title"]),
+            changes.get("description", series["description"]),
+            changes.get("due_date", occurrence_at),
+        )
+        changes["priority"] = analysis.suggested_priority
+    now = datetime.utcnow()
+    values = dict(
+        title=series["title"],
+        description=series["description"],
+        due_date=occurrence_at,
+        priority=occurrence_row(series, occurrence_at, now)["priority"],
+        owner_id=series["owner_id"],
+        plan_id=series["plan_id"],
+        completed=False,
+        series_id=series_id,
+        occurrence_at=occurrence_at,
+        created_at=now,
+    )
+    values.update(changes, updated_at=now)
+    stmt = pg_insert(DBTask).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DBTask.series_id, DBTask.occurrence_at],
+        set_={**changes, "updated_at": now},
+    ).returning(*TASK_COLUMNS)
+    row = (await db.execute(stmt)).mappings().one()
+    await tasks_changed(db, [row])
+    return json_response(task_dict(row))
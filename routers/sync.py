@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import BigInteger, cast, func, select, Text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from models import DBPlan, DBSyncHorizon, DBTask, DBTombstone, TASK_COLUMNS
+from queries import visible_to
+from register import get_current_user, TelegramUser
+from routers.plans import PLAN_COLUMNS
+from schemas import SyncResponse
+from serialization import json_response, plan_dict, task_fields_dict
+
+router = APIRouter(tags=["sync"])
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync(
+    since: str = Query("0", description="Token from the previous /sync response; 0 for a full snapshot"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        since_seq = int(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+    # Токен берётся до чтения данных: транзакции, не закоммиченные к этому
+    # моменту, имеют xid >= токена и попадут в следующую синхронизацию
+    snapshot_xmin = func.pg_snapshot_xmin(func.pg_current_snapshot())
+    purged_seq = select(DBSyncHorizon.purged_seq).scalar_subquery()
+    token, purged_seq = (await db.execute(select(cast(cast(snapshot_xmin, Text), BigInteger), purged_seq))).one()
+    # Tombstones после такого токена могли быть уже удалены по сроку — удаления
+    # не восстановить, поэтому вместо изменений отдаётся полный снимок
+    if purged_seq is not None and since_seq <= purged_seq:
+        since_seq = 0
+
+    stmt = select(*TASK_COLUMNS, DBTask.change_seq).where(visible_to(DBTask, current_user.id), DBTask.change_seq >= since_seq)
+    tasks = [dict(row) for row in (await db.execute(stmt)).mappings()]
+    stmt = select(*PLAN_COLUMNS, DBPlan.change_seq).where(visible_to(DBPlan, current_user.id), DBPlan.change_seq >= since_seq)
+    plans = [dict(row) for row in (await db.execute(stmt)).mappings()]
+    live = {
+        "task": {row["id"]: row["change_seq"] for row in tasks},
+        "plan": {row["id"]: row["change_seq"] for row in plans},
+    }
+
+    deleted = {"task": set(), "plan": set()}
+    if since_seq > 0:
+        stmt = select(DBTombstone.kind, DBTombstone.entity_id, DBTombstone.change_seq).where(
+            DBTombstone.user_ids.contains([current_user.id]),
+            DBTombstone.change_seq >= since_seq,
+        )
+        for kind, entity_id, change_seq in (await db.execute(stmt)).all():
+            # Доступ вернули или задачу восстановили из архива позже tombstone —
+            # клиенту нужна только живая строка
+            if live[kind].get(entity_id, -1) < change_seq:
+                deleted[kind].add(entity_id)
+
+    # Поля в порядке SyncResponse
+    return json_response({
+        "token": str(token),
+        "full": since_seq == 0,
+        "tasks": [task_fields_dict(row) for row in tasks],
+        "plans": [plan_dict(row) for row in plans],
+        "deleted_tasks": sorted(deleted["task"]),
+        "deleted_plans": sorted(deleted["plan"]),
+    })
@@ -1,10 +1,11 @@
+import base64
+import json
 from datetime import datetime
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy import select, or_, update as sa_update, delete as sa_delete
+from typing import Iterable, List, Literal, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import and_, select, case, insert, literal_column, tuple_, update as sa_update, delete as sa_delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func
-from sqlalchemy.orm import joinedload
 
 from register import get_current_user, TelegramUser
 from models import Task, TaskCreate, TaskUpdate, TaskAnalysis, ShareTask, TaskBase, DBTask
@@ -13,121 +14,595 @@ from database import get_db
 # ... остальной код остается таким же
 
 from register import get_current_user, TelegramUser
-from models import Task, TaskCreate, TaskUpdate, TaskAnalysis, ShareTask, TaskBase, DBTask
+from models import (
+    Task, TaskCreate, TaskUpdate, TaskAnalysis, ShareTask, TaskBase, DBTask, TaskListItem, TaskTreeNode,
+    DBPlan, DBTaskArchive, DBTaskSeries, SEARCH_VECTOR_SQL, TASK_FIELDS, TASK_COLUMNS,
+    TaskBatchUpdate, TaskBatchIds, TaskBatchComplete, TaskBatchShare, TaskBatchResult, MAX_BATCH_SIZE,
+)
 from database import get_db
+from queries import editable_by, shared_with_user, visible_to
+from sharing import access_revoked, grant, revoke
+from archive import restore_task
+from recurrence import MAX_WINDOW, expand, load_window, occurrence_row
+from schemas import ArchivedTask
+from reminders import reminder_scheduler, to_utc_naive
+from task_tree import MAX_TREE_DEPTH, ancestor_audience, build_trees, load_subtree_rows, load_trees
+from analysis import analysis_engine
+from cache import response_cache, respond
+from serialization import archived_task_dict, dumps, json_response, task_dict, task_list_item_dict, task_tree_node_dict
+from feed import cache_events, change_event, publish
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
-def analyze_task(title: str, description: Optional[str]) -> TaskAnalysis:
-    combined = f"{title} {description or ''}".lower()
-    if "urgent" in combined or "important" in combined:
-        suggested_priority = "high"
-        advice = "Эта задача кажется срочной. Приоритизируйте её немедленно."
-    elif "later" in combined:
-        suggested_priority = "low"
-        advice = "Это можно сделать позже. Нет спешки."
-    else:
-        suggested_priority = "medium"
-        advice = "Стандартный приоритет. Запланируйте соответственно."
-    return TaskAnalysis(advice=advice, suggested_priority=suggested_priority)
+def analyze_task(title: str, description: Optional[str], due_date: Optional[datetime] = None) -> TaskAnalysis:
+    return analysis_engine.analyze(title, description, due_date)
+
+ANALYSIS_FIELDS = ("title", "description", "due_date")
+
+NOT_FOUND = "Task not found or not authorized"
+
+async def shared_rows(db: AsyncSession, ids: List[int], owner_id: int, changed: set) -> list:
+    # Задачи с изменённым доступом «трогаем» (updated_at, а триггер — change_seq),
+    # чтобы их подхватили /sync и кэш; остальные свои просто перечитываем
+    rows = []
+    if changed:
+        stmt = (
+            sa_update(DBTask)
+            .where(DBTask.id.in_(changed))
+            .values(updated_at=datetime.utcnow())
+            .returning(*TASK_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        rows.extend((await db.execute(stmt)).mappings().all())
+    unchanged = set(ids) - changed
+    if unchanged:
+        stmt = select(*TASK_COLUMNS).where(DBTask.id.in_(unchanged), DBTask.owner_id == owner_id)
+        rows.extend((await db.execute(stmt)).mappings().all())
+    return rows
 
 @router.post("", response_model=Task)
 async def create_task(task: TaskCreate, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    analysis = analyze_task(task.title, task.description)
-    new_task = DBTask(
+    analysis = analyze_task(task.title, task.description, task.due_date)
+    stmt = insert(DBTask).values(
         title=task.title,
         description=task.description,
         due_date=task.due_date,
         priority=analysis.suggested_priority,
         owner_id=current_user.id,
-        shared_with=[],
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow(),
         plan_id=task.plan_id,
         parent_id=task.parent_id,
         completed=task.completed
-    )
-    db.add(new_task)
-    await db.commit()
-    await db.refresh(new_task)
-    return Task.model_validate(new_task)
+    ).returning(*TASK_COLUMNS)
+    row = (await db.execute(stmt)).mappings().one()
+    await tasks_changed(db, [row])
+    return json_response(task_dict(row))
 
 @router.post("/analyze-task", response_model=TaskAnalysis)
 async def analyze_new_task(task: TaskBase, current_user: TelegramUser = Depends(get_current_user)):
-    return analyze_task(task.title, task.description)
+    return analyze_task(task.title, task.description, task.due_date)
+
+@router.post("/analyze-tasks", response_model=List[TaskAnalysis])
+async def analyze_new_tasks(tasks: List[TaskBase] = Body(..., max_length=MAX_BATCH_SIZE), current_user: TelegramUser = Depends(get_current_user)):
+    return analysis_engine.analyze_many((t.title, t.description, t.due_date) for t in tasks)
 
-@router.get("", response_model=List[Task])
+PRIORITY_RANKS = {"high": 3, "medium": 2, "low": 1}
+PRIORITY_RANK = case(PRIORITY_RANKS, value=DBTask.priority, else_=0)
+# NULL в ключе сортировки ломает сравнение кортежей в курсоре, поэтому задачи
+# без срока уходят в конец через заведомо далёкую дату
+NO_DUE_DATE = datetime(9999, 12, 31)
+
+# имя -> (выражение, значение в курсоре — дата)
+SORT_KEYS = {
+    "updated_at": (DBTask.updated_at, True),
+    "created_at": (DBTask.created_at, True),
+    "due_date": (func.coalesce(DBTask.due_date, NO_DUE_DATE), True),
+    "priority": (PRIORITY_RANK, False),
+    "title": (DBTask.title, False),
+    "relevance": (None, False),
+}
+SORT_PATTERN = "^-?(" + "|".join(SORT_KEYS) + ")$"
+# Те же ключи для повторений серий (expand_series); due_date и priority берутся у самого повторения
+SERIES_SORT_KEYS = {
+    "updated_at": DBTaskSeries.updated_at,
+    "created_at": DBTaskSeries.created_at,
+    "title": DBTaskSeries.title,
+}
+# Та же формула, что у tasks.search_vector; серий у пользователя немного, индекс не нужен
+SERIES_SEARCH_VECTOR = literal_column(f"({SEARCH_VECTOR_SQL})")
+# Порядок GET /tasks/archive; в SORT_KEYS его нет — у tasks нет archived_at
+ARCHIVE_SORT = "-archived_at"
+ARCHIVE_COLUMNS = [*(getattr(DBTaskArchive, f) for f in TASK_FIELDS), DBTaskArchive.archived_at]
+
+def search_query(q: str):
+    # Запрос разбирается в обеих конфигурациях, совпадение в любой засчитывается
+    return func.websearch_to_tsquery(literal_column("'russian'::regconfig"), q).op("||")(
+        func.websearch_to_tsquery(literal_column("'english'::regconfig"), q)
+    )
+
+def encode_cursor(sort: str, value, task_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(data) == 2:
+            # Курсоры, выданные до появления sort=
+            data = ["-updated_at", *data]
+        cursor_sort, value, task_id = data
+        if cursor_sort != sort:
+            raise ValueError("cursor was issued for another sort")
+        if sort == ARCHIVE_SORT or SORT_KEYS[sort.lstrip("-")][1]:
+            value = datetime.fromisoformat(value)
+        return value, int(task_id)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(TASK_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(requested) - set(TASK_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # id и updated_at нужны для курсора, поэтому выбираются всегда
+    return ["id", "updated_at"] + [f for f in requested if f not in ("id", "updated_at")]
+
+async def attach_sub_tasks(db: AsyncSession, items: List[dict], mode: str, max_depth: int = MAX_TREE_DEPTH) -> None:
+    ids = [item["id"] for item in items]
+    if mode == "none" or not ids:
+        return
+    if mode == "count":
+        stmt = select(DBTask.parent_id, func.count()).where(DBTask.parent_id.in_(ids)).group_by(DBTask.parent_id)
+        counts = dict((await db.execute(stmt)).all())
+        for item in items:
+            item["sub_task_count"] = counts.get(item["id"], 0)
+        return
+    # Прямые подзадачи — корни деревьев, вся глубина приходит одним WITH RECURSIVE
+    children: dict[int, List[dict]] = {}
+    for node in await load_trees(db, DBTask.parent_id.in_(ids), max_depth - 1):
+        children.setdefault(node["parent_id"], []).append(node)
+    for item in items:
+        item["sub_tasks"] = children.get(item["id"], [])
+
+async def tasks_changed(db: AsyncSession, rows, deleted: bool = False, revoked: Iterable[int] = ()) -> None:
+    # Завершает транзакцию изменения: события в ленту (pg_notify) уходят тем же
+    # commit, что и сами строки. После него — напоминания и сброс кэша списков
+    # у всех, кто видит задачу напрямую или через дерево предка; revoked — те,
+    # кто доступ потерял, им сбрасывается только кэш
+    parent_ids = {row["parent_id"] for row in rows if row["parent_id"] is not None}
+    ancestors = await ancestor_audience(db, parent_ids) if parent_ids else {}
+    audience = set(revoked)
+    payloads = []
+    for row in rows:
+        users = {row["owner_id"], *(row["shared_with"] or [])} | ancestors.get(row["parent_id"], set())
+        audience |= users
+        payloads.append(change_event("task", "delete" if deleted else "upsert", row, users))
+    # Счётчики в списке планов тоже поменялись — сбрасываем его всем, кто видит план
+    plan_ids = {row["plan_id"] for row in rows if row["plan_id"] is not None}
+    plan_audience = set()
+    if plan_ids:
+        stmt = select(DBPlan.owner_id, DBPlan.shared_with).where(DBPlan.id.in_(plan_ids))
+        for owner_id, shared_with in (await db.execute(stmt)).all():
+            plan_audience |= {owner_id, *(shared_with or [])}
+    await publish(db, payloads + cache_events(audience, "tasks") + cache_events(plan_audience, "plans"))
+    await db.commit()
+    for row in rows:
+        if deleted:
+            reminder_scheduler.unschedule(row["id"])
+        else:
+            reminder_scheduler.schedule(row["id"], row["due_date"], row["completed"])
+    await response_cache.invalidate(audience, "tasks")
+    await response_cache.invalidate(plan_audience, "plans")
+
+
+@router.get("", response_model=List[TaskListItem], response_model_exclude_unset=True)
 async def list_tasks(
+    request: Request,
     filter_plan_id: Optional[int] = Query(None, description="Filter by plan_id; use 0 for tasks without plan"),
+    parent_id: Optional[int] = Query(None, description="Filter by parent_id; use 0 for top-level tasks"),
+    completed: Optional[bool] = Query(None),
+    priority: Optional[str] = Query(None, description="Comma-separated priorities, e.g. high,medium"),
+    due_from: Optional[datetime] = Query(None, description="due_date >= due_from"),
+    due_to: Optional[datetime] = Query(None, description="due_date < due_to"),
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Full-text search over title and description"),
+    sort: str = Query("-updated_at", pattern=SORT_PATTERN, description="Sort key, prefix with - for descending; relevance requires q"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; next page cursor is returned in X-Next-Cursor"),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated task fields to return"),
+    sub_tasks: Literal["full", "count", "none"] = Query("full", description="Return sub-task trees, direct sub-task count or nothing"),
+    max_depth: int = Query(MAX_TREE_DEPTH, ge=1, le=MAX_TREE_DEPTH, description="Sub-task tree depth"),
+    expand_series: bool = Query(False, description="Add not yet materialized occurrences of recurring series due in [due_from, due_to); they have no id"),
     current_user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(DBTask).options(joinedload(DBTask.sub_tasks)).where(
-        or_(DBTask.owner_id == current_user.id, DBTask.shared_with.contains([current_user.id]))
-    )
+    if expand_series:
+        if due_from is None or due_to is None:
+            raise HTTPException(status_code=400, detail="expand_series requires due_from and due_to")
+        if limit is not None or cursor:
+            raise HTTPException(status_code=400, detail="expand_series does not support pagination; narrow the due window instead")
+        if to_utc_naive(due_to) - to_utc_naive(due_from) > MAX_WINDOW:
+            raise HTTPException(status_code=400, detail=f"Due window is limited to {MAX_WINDOW.days} days with expand_series")
+
+    cache_key = await response_cache.key(current_user.id, "tasks", request)
+    entry = await response_cache.get(cache_key)
+    if entry is not None:
+        return respond(request, entry)
+
+    sort_name = sort.lstrip("-")
+    descending = sort.startswith("-")
+    if sort_name == "relevance":
+        if q is None:
+            raise HTTPException(status_code=400, detail="sort=relevance requires q")
+        sort_key = func.ts_rank(DBTask.search_vector, search_query(q))
+    else:
+        sort_key = SORT_KEYS[sort_name][0]
+
+    columns = parse_fields(fields)
+    stmt = select(*(getattr(DBTask, c) for c in columns), sort_key.label("sort_key")).where(visible_to(DBTask, current_user.id))
     if filter_plan_id is not None:
         if filter_plan_id == 0:
             stmt = stmt.where(DBTask.plan_id.is_(None))
         else:
             stmt = stmt.where(DBTask.plan_id == filter_plan_id)
-    result = await db.execute(stmt)
-    db_tasks = result.unique().scalars().all()
-    return [Task.model_validate(t) for t in db_tasks]
+    if parent_id is not None:
+        if parent_id == 0:
+            stmt = stmt.where(DBTask.parent_id.is_(None))
+        else:
+            stmt = stmt.where(DBTask.parent_id == parent_id)
+    if completed is not None:
+        stmt = stmt.where(DBTask.completed.is_(completed))
+    if priority:
+        stmt = stmt.where(DBTask.priority.in_([p.strip() for p in priority.split(",") if p.strip()]))
+    if due_from is not None:
+        stmt = stmt.where(DBTask.due_date >= to_utc_naive(due_from))
+    if due_to is not None:
+        stmt = stmt.where(DBTask.due_date < to_utc_naive(due_to))
+    if q is not None:
+        stmt = stmt.where(DBTask.search_vector.op("@@")(search_query(q)))
+    if cursor:
+        cursor_value, cursor_id = decode_cursor(cursor, sort)
+        position = tuple_(sort_key, DBTask.id)
+        bound = tuple_(cursor_value, cursor_id)
+        stmt = stmt.where(position < bound if descending else position > bound)
+    if descending:
+        stmt = stmt.order_by(sort_key.desc(), DBTask.id.desc())
+    else:
+        stmt = stmt.order_by(sort_key.asc(), DBTask.id.asc())
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+
+    headers = {}
+    items = [dict(row) for row in (await db.execute(stmt)).mappings()]
+    if limit is not None and len(items) > limit:
+        items = items[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(sort, items[-1]["sort_key"], items[-1]["id"])
+    await attach_sub_tasks(db, items, sub_tasks, max_depth)
+    if expand_series:
+        occurrences = await series_occurrences(
+            db, current_user.id, to_utc_naive(due_from), to_utc_naive(due_to), columns, sort_name,
+            filter_plan_id=filter_plan_id, parent_id=parent_id, completed=completed, priority=priority, q=q,
+        )
+        for item in occurrences:
+            if sub_tasks == "full":
+                item["sub_tasks"] = []
+            elif sub_tasks == "count":
+                item["sub_task_count"] = 0
+        # Слияние с тем же порядком, что в SQL; у повторений без id вместо него 0
+        items = sorted(
+            items + occurrences,
+            key=lambda item: (item["sort_key"], item["id"] or 0),
+            reverse=descending,
+        )
+    for item in items:
+        del item["sort_key"]
+
+    body = dumps([task_list_item_dict(item) for item in items])
+    entry = await response_cache.put(cache_key, body, headers)
+    return respond(request, entry)
+
+async def series_occurrences(
+    db: AsyncSession, user_id: int, start: datetime, end: datetime, columns: List[str], sort_name: str,
+    filter_plan_id: Optional[int], parent_id: Optional[int], completed: Optional[bool], priority: Optional[str], q: Optional[str],
+) -> List[dict]:
+    # Повторения — невыполненные задачи верхнего уровня; фильтры GET /tasks применяются к серии
+    if completed or parent_id:
+        return []
+    clauses = [visible_to(DBTaskSeries, user_id)]
+    if filter_plan_id is not None:
+        clauses.append(DBTaskSeries.plan_id.is_(None) if filter_plan_id == 0 else DBTaskSeries.plan_id == filter_plan_id)
+    if q is not None:
+        clauses.append(SERIES_SEARCH_VECTOR.op("@@")(search_query(q)))
+    if sort_name == "relevance":
+        sort_key = func.ts_rank(SERIES_SEARCH_VECTOR, search_query(q))
+    else:
+        sort_key = SERIES_SORT_KEYS.get(sort_name)
+    extra = [sort_key.label("sort_key")] if sort_key is not None else []
+
+    # Приоритет повторения зависит от его срока, поэтому фильтр и сортировка по нему — здесь
+    priorities = {p.strip() for p in priority.split(",") if p.strip()} if priority else None
+    series, taken = await load_window(db, and_(*clauses), start, end, *extra)
+    now = datetime.utcnow()
+    items = []
+    for row, at in expand(series, taken, start, end):
+        occurrence = occurrence_row(row, at, now)
+        if priorities is not None and occurrence["priority"] not in priorities:
+            continue
+        item = {c: occurrence[c] for c in columns}
+        if sort_name == "priority":
+            item["sort_key"] = PRIORITY_RANKS.get(occurrence["priority"], 0)
+        else:
+            item["sort_key"] = row["sort_key"] if sort_key is not None else at
+        items.append(item)
+    return items
+
+def batch_results(ids: List[int], rows, with_task: bool = True) -> Response:
+    # Поля в порядке TaskBatchResult
+    by_id = {row["id"]: row for row in rows}
+    return json_response([
+        {"id": i, "ok": True, "error": None, "task": task_dict(by_id[i]) if with_task else None}
+        if i in by_id else {"id": i, "ok": False, "error": NOT_FOUND, "task": None}
+        for i in ids
+    ])
+
+@router.post("/batch", response_model=List[TaskBatchResult])
+async def batch_create_tasks(tasks: List[TaskCreate] = Body(..., max_length=MAX_BATCH_SIZE), current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if not tasks:
+        return []
+    now = datetime.utcnow()
+    analyses = analysis_engine.analyze_many((t.title, t.description, t.due_date) for t in tasks)
+    values = []
+    for task, analysis in zip(tasks, analyses):
+        values.append(dict(
+            title=task.title,
+            description=task.description,
+            due_date=task.due_date,
+            priority=analysis.suggested_priority,
+            owner_id=current_user.id,
+            created_at=now,
+            updated_at=now,
+            plan_id=task.plan_id,
+            parent_id=task.parent_id,
+            completed=task.completed
+        ))
+    stmt = insert(DBTask).returning(*TASK_COLUMNS, sort_by_parameter_order=True)
+    rows = (await db.execute(stmt, values)).mappings().all()
+    await tasks_changed(db, rows)
+    return batch_results([row["id"] for row in rows], rows)
+
+@router.put("/batch", response_model=List[TaskBatchResult])
+async def batch_update_tasks(updates: List[TaskBatchUpdate] = Body(..., max_length=MAX_BATCH_SIZE), current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    ids = [u.id for u in updates]
+    stmt = select(DBTask.id, *(getattr(DBTask, f) for f in ANALYSIS_FIELDS)).where(DBTask.id.in_(ids), editable_by(DBTask, current_user.id))
+    editable = {row["id"]: row for row in (await db.execute(stmt)).mappings()}
+
+    now = datetime.utcnow()
+    params = []
+    for item in updates:
+        if item.id not in editable:
+            continue
+        update_dict = item.dict(exclude_unset=True)
+        if any(f in update_dict for f in ANALYSIS_FIELDS):
+            fields = {f: update_dict.get(f, editable[item.id][f]) for f in ANALYSIS_FIELDS}
+            update_dict["priority"] = analyze_task(**fields).suggested_priority
+        update_dict["updated_at"] = now
+        params.append(update_dict)
+
+    rows = []
+    if params:
+        # ORM bulk UPDATE по первичному ключу — один executemany на весь батч
+        await db.execute(sa_update(DBTask), params)
+        rows = (await db.execute(select(*TASK_COLUMNS).where(DBTask.id.in_(editable)))).mappings().all()
+        await tasks_changed(db, rows)
+    return batch_results(ids, rows)
+
+@router.post("/batch/complete", response_model=List[TaskBatchResult])
+async def batch_complete_tasks(batch: TaskBatchComplete, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    stmt = (
+        sa_update(DBTask)
+        .where(DBTask.id.in_(batch.ids), DBTask.owner_id == current_user.id)
+        .values(completed=batch.completed, updated_at=datetime.utcnow())
+        .returning(*TASK_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).mappings().all()
+    await tasks_changed(db, rows)
+    return batch_results(batch.ids, rows)
+
+@router.post("/batch/delete", response_model=List[TaskBatchResult])
+async def batch_delete_tasks(batch: TaskBatchIds, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    stmt = (
+        sa_delete(DBTask)
+        .where(DBTask.id.in_(batch.ids), DBTask.owner_id == current_user.id)
+        .returning(*TASK_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).mappings().all()
+    await tasks_changed(db, rows, deleted=True)
+    return batch_results(batch.ids, rows, with_task=False)
+
+@router.post("/batch/share", response_model=List[TaskBatchResult])
+async def batch_share_tasks(batch: TaskBatchShare, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    stmt = grant(DBTask, batch.ids, current_user.id, batch.user_id, batch.role)
+    changed = set((await db.execute(stmt)).scalars())
+    rows = await shared_rows(db, batch.ids, current_user.id, changed)
+    await tasks_changed(db, [row for row in rows if row["id"] in changed])
+    return batch_results(batch.ids, rows)
+
+@router.post("/batch/unshare", response_model=List[TaskBatchResult])
+async def batch_unshare_tasks(batch: TaskBatchShare, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    changed = set((await db.execute(revoke(DBTask, batch.ids, current_user.id, batch.user_id))).scalars())
+    await access_revoked(db, "task", changed, batch.user_id)
+    rows = await shared_rows(db, batch.ids, current_user.id, changed)
+    await tasks_changed(db, [row for row in rows if row["id"] in changed], revoked=[batch.user_id])
+    return batch_results(batch.ids, rows)
+
+@router.get("/shared", response_model=List[Task])
+async def list_shared_tasks(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Задачи, открытые пользователю напрямую; идём от его строк в shares, а не по tasks
+    stmt = select(*TASK_COLUMNS).where(shared_with_user(DBTask, current_user.id))
+    if cursor:
+        cursor_updated_at, cursor_id = decode_cursor(cursor, "-updated_at")
+        stmt = stmt.where(tuple_(DBTask.updated_at, DBTask.id) < tuple_(cursor_updated_at, cursor_id))
+    stmt = stmt.order_by(DBTask.updated_at.desc(), DBTask.id.desc()).limit(limit + 1)
+    rows = (await db.execute(stmt)).mappings().all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor("-updated_at", rows[-1]["updated_at"], rows[-1]["id"])
+    return json_response([task_dict(row) for row in rows], headers=headers)
+
+@router.get("/archive", response_model=List[ArchivedTask])
+async def list_archived_tasks(
+    filter_plan_id: Optional[int] = Query(None, description="Filter by plan_id"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Сначала недавно заархивированные: курсор по archived_at отсекает старые секции
+    stmt = select(*ARCHIVE_COLUMNS).where(visible_to(DBTaskArchive, current_user.id))
+    if filter_plan_id is not None:
+        stmt = stmt.where(DBTaskArchive.plan_id == filter_plan_id)
+    if cursor:
+        cursor_archived_at, cursor_id = decode_cursor(cursor, ARCHIVE_SORT)
+        stmt = stmt.where(tuple_(DBTaskArchive.archived_at, DBTaskArchive.id) < tuple_(cursor_archived_at, cursor_id))
+    stmt = stmt.order_by(DBTaskArchive.archived_at.desc(), DBTaskArchive.id.desc()).limit(limit + 1)
+    rows = (await db.execute(stmt)).mappings().all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(ARCHIVE_SORT, rows[-1]["archived_at"], rows[-1]["id"])
+    return json_response([archived_task_dict(row) for row in rows], headers=headers)
+
+@router.post("/archive/{task_id}/restore", response_model=Task)
+async def restore_archived_task(
+    task_id: int,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    restored = await restore_task(db, task_id, current_user.id)
+    if not restored:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    rows = (await db.execute(select(*TASK_COLUMNS).where(DBTask.id.in_(restored)))).mappings().all()
+    await tasks_changed(db, rows)
+    return json_response(task_dict((await load_trees(db, DBTask.id == task_id))[0]))
 
 @router.get("/{task_id}", response_model=Task)
-async def get_task(task_id: int, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    stmt = select(DBTask).options(joinedload(DBTask.sub_tasks)).where(DBTask.id == task_id)
-    result = await db.execute(stmt)
-    t = result.scalar_one_or_none()
-    if t is None or (t.owner_id != current_user.id and current_user.id not in t.shared_with):
+async def get_task(
+    task_id: int,
+    max_depth: int = Query(MAX_TREE_DEPTH, ge=0, le=MAX_TREE_DEPTH, description="Sub-task tree depth"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    rows = await load_subtree_rows(db, and_(DBTask.id == task_id, visible_to(DBTask, current_user.id)), max_depth)
+    if not rows:
         raise HTTPException(status_code=404, detail="Task not found")
-    return Task.model_validate(t)
+    return json_response(task_dict(build_trees(rows)[0]))
 
-@router.put("/{task_id}", response_model=Task)
-async def update_task(task_id: int, update_data: TaskUpdate, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    stmt = select(DBTask).where(DBTask.id == task_id, DBTask.owner_id == current_user.id)
-    result = await db.execute(stmt)
-    t = result.scalar_one_or_none()
-    if t is None:
-        raise HTTPException(status_code=404, detail="Task not found or not authorized")
+@router.get("/{task_id}/subtree", response_model=List[TaskTreeNode])
+async def get_task_subtree(
+    task_id: int,
+    max_depth: int = Query(MAX_TREE_DEPTH, ge=0, le=MAX_TREE_DEPTH, description="Sub-task tree depth"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    rows = await load_subtree_rows(db, and_(DBTask.id == task_id, visible_to(DBTask, current_user.id)), max_depth)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return json_response([task_tree_node_dict(row) for row in rows])
 
+@router.put("/{task_id}", response_model=Task)
+async def update_task(
+    task_id: int,
+    update_data: TaskUpdate,
+    include_sub_tasks: bool = Query(False, description="Also return the sub-task tree"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
     update_dict = update_data.dict(exclude_unset=True)
-    if "title" in update_dict or "description" in update_dict:
-        new_title = update_dict.get("title", t.title)
-        new_desc = update_dict.get("description", t.description)
-        analysis = analyze_task(new_title, new_desc)
+    # Приоритет зависит и от срока, поэтому перенос due_date тоже пересчитывает его
+    if any(f in update_dict for f in ANALYSIS_FIELDS):
+        fields = {f: update_dict[f] for f in ANALYSIS_FIELDS if f in update_dict}
+        missing = [f for f in ANALYSIS_FIELDS if f not in fields]
+        if missing:
+            # Для анализа нужны и неизменённые поля — дочитываем только их
+            stmt = select(*(getattr(DBTask, f) for f in missing)).where(DBTask.id == task_id, editable_by(DBTask, current_user.id))
+            current = (await db.execute(stmt)).mappings().one_or_none()
+            if current is None:
+                raise HTTPException(status_code=404, detail=NOT_FOUND)
+            fields.update(current)
+        analysis = analyze_task(**fields)
         update_dict["priority"] = analysis.suggested_priority
 
     update_dict["updated_at"] = datetime.utcnow()
-    await db.execute(sa_update(DBTask).where(DBTask.id == task_id).values(**update_dict))
-    await db.commit()
-    await db.refresh(t)
-    return Task.model_validate(t)
+    stmt = (
+        sa_update(DBTask)
+        .where(DBTask.id == task_id, editable_by(DBTask, current_user.id))
+        .values(**update_dict)
+        .returning(*TASK_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).mappings().one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    item = dict(row)
+    if include_sub_tasks:
+        await attach_sub_tasks(db, [item], "full")
+    await tasks_changed(db, [item])
+    return json_response(task_dict(item))
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(task_id: int, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    stmt = sa_delete(DBTask).where(DBTask.id == task_id, DBTask.owner_id == current_user.id)
-    result = await db.execute(stmt)
-    if result.rowcount == 0:
-        raise HTTPException(status_code=404, detail="Task not found or not authorized")
-    await db.commit()
+    stmt = (
+        sa_delete(DBTask)
+        .where(DBTask.id == task_id, DBTask.owner_id == current_user.id)
+        .returning(*TASK_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).mappings().one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    await tasks_changed(db, [row], deleted=True)
 
 @router.post("/{task_id}/share", response_model=Task)
-async def share_task(task_id: int, share: ShareTask, current_user: TelegramUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    stmt = select(DBTask).where(DBTask.id == task_id, DBTask.owner_id == current_user.id)
-    result = await db.execute(stmt)
-    t = result.scalar_one_or_none()
-    if t is None:
-        raise HTTPException(status_code=404, detail="Task not found or not authorized")
-
-    await db.execute(
-        sa_update(DBTask)
-        .where(DBTask.id == task_id)
-        .values(
-            shared_with=func.array_append(DBTask.shared_with, share.user_id),
-            updated_at=datetime.utcnow()
-        )
-    )
-    await db.commit()
-    await db.refresh(t)
-    return Task.model_validate(t)
\ No newline at end of file
+async def share_task(
+    task_id: int,
+    share: ShareTask,
+    include_sub_tasks: bool = Query(False, description="Also return the sub-task tree"),
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    changed = set((await db.execute(grant(DBTask, [task_id], current_user.id, share.user_id, share.role))).scalars())
+    rows = await shared_rows(db, [task_id], current_user.id, changed)
+    if not rows:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    item = dict(rows[0])
+    if include_sub_tasks:
+        await attach_sub_tasks(db, [item], "full")
+    await tasks_changed(db, [item] if changed else [])
+    return json_response(task_dict(item))
+
+@router.delete("/{task_id}/share/{user_id}", response_model=Task)
+async def unshare_task(
+    task_id: int,
+    user_id: int,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    changed = set((await db.execute(revoke(DBTask, [task_id], current_user.id, user_id))).scalars())
+    await access_revoked(db, "task", changed, user_id)
+    rows = await shared_rows(db, [task_id], current_user.id, changed)
+    if not rows:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    await tasks_changed(db, rows if changed else [], revoked=[user_id] if changed else [])
+    return json_response(task_dict(rows[0]))
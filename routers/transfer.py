@@ -0,0 +1,231 @@
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import response_cache
+from database import async_session, get_db
+from feed import RESYNC, cache_events, encode_event, publish
+from models import DBPlan, DBTask, TASK_COLUMNS
+from queries import visible_to
+from register import get_current_user, TelegramUser
+from reminders import reminder_scheduler
+from routers.plans import PLAN_COLUMNS
+from schemas import ImportPlan, ImportResult, ImportTask
+
+router = APIRouter(tags=["transfer"])
+
+EXPORT_CHUNK = 500
+IMPORT_CHUNK = 500
+EXPORT_FORMAT_VERSION = 1
+
+
+def encode_record(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, default=lambda v: v.isoformat()).encode()
+
+
+async def export_records(user_id: int) -> AsyncIterator[bytes]:
+    yield encode_record({
+        "type": "meta",
+        "version": EXPORT_FORMAT_VERSION,
+        "user_id": user_id,
+        "exported_at": datetime.utcnow(),
+    })
+    # Собственная сессия: генератор живёт дольше обработчика запроса.
+    # stream() + yield_per — серверный курсор, в памяти только текущая порция
+    async with async_session() as session:
+        stmt = select(*PLAN_COLUMNS).where(visible_to(DBPlan, user_id)).order_by(DBPlan.id)
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_CHUNK))
+        async for row in result.mappings():
+            yield encode_record({"type": "plan", **row})
+
+        # Сортировка по id: родитель создаётся раньше подзадачи, импорт на это опирается
+        stmt = select(*TASK_COLUMNS).where(visible_to(DBTask, user_id)).order_by(DBTask.id)
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_CHUNK))
+        async for row in result.mappings():
+            yield encode_record({"type": "task", **row})
+
+
+async def ndjson(records: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    async for record in records:
+        yield record + b"\n"
+
+
+async def json_array(records: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    separator = b"[\n"
+    async for record in records:
+        yield separator + record
+        separator = b",\n"
+    yield b"[]\n" if separator == b"[\n" else b"\n]\n"
+
+
+async def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@router.get("/export")
+async def export_workspace(
+    format: Literal["ndjson", "json"] = Query("ndjson"),
+    gzip: bool = Query(False, description="Compress the export with gzip"),
+    current_user: TelegramUser = Depends(get_current_user)
+):
+    body = export_records(current_user.id)
+    body = ndjson(body) if format == "ndjson" else json_array(body)
+    filename = f"workspace-{current_user.id}.{format}"
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    if gzip:
+        body = gzipped(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def json_record(line: bytes) -> bytes:
+    # Принимаем и NDJSON, и JSON-массив из export?format=json: по записи на строку
+    line = line.strip()
+    if line in (b"[", b"]", b"[]"):
+        return b""
+    return line.rstrip(b",")
+
+
+async def request_lines(request: Request) -> AsyncIterator[bytes]:
+    compressed = (
+        request.headers.get("content-encoding") == "gzip"
+        or request.headers.get("content-type", "").startswith("application/gzip")
+    )
+    decompressor = zlib.decompressobj(wbits=47) if compressed else None
+    buffer = b""
+    async for chunk in request.stream():
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            record = json_record(line)
+            if record:
+                yield record
+    record = json_record(buffer)
+    if record:
+        yield record
+
+
+class Importer:
+    """Вставляет записи экспорта порциями, переназначая id планов и задач."""
+
+    def __init__(self, db: AsyncSession, owner_id: int):
+        self.db = db
+        self.owner_id = owner_id
+        self.plan_ids: dict[int, int] = {}
+        self.task_ids: dict[int, int] = {}
+        self.plans: list[ImportPlan] = []
+        self.tasks: list[ImportTask] = []
+        self.pending_task_ids: set[int] = set()
+        # (id, due_date, completed) для напоминаний: планировщику — только после commit
+        self.reminders: list[tuple[int, datetime, bool]] = []
+
+    async def add_plan(self, plan: ImportPlan) -> None:
+        self.plans.append(plan)
+        if len(self.plans) >= IMPORT_CHUNK:
+            await self.flush_plans()
+
+    async def add_task(self, task: ImportTask) -> None:
+        await self.flush_plans()
+        # Родитель в ещё не вставленной порции — сначала нужен его новый id
+        if task.parent_id in self.pending_task_ids:
+            await self.flush_tasks()
+        self.tasks.append(task)
+        self.pending_task_ids.add(task.id)
+        if len(self.tasks) >= IMPORT_CHUNK:
+            await self.flush_tasks()
+
+    async def flush_plans(self) -> None:
+        if not self.plans:
+            return
+        now = datetime.utcnow()
+        values = [
+            dict(
+                title=p.title,
+                owner_id=self.owner_id,
+                created_at=p.created_at or now,
+                updated_at=p.updated_at or now,
+            )
+            for p in self.plans
+        ]
+        stmt = insert(DBPlan).returning(DBPlan.id, sort_by_parameter_order=True)
+        new_ids = (await self.db.execute(stmt, values)).scalars().all()
+        self.plan_ids.update(zip((p.id for p in self.plans), new_ids))
+        self.plans = []
+
+    async def flush_tasks(self) -> None:
+        if not self.tasks:
+            return
+        now = datetime.utcnow()
+        values = [
+            dict(
+                title=t.title,
+                description=t.description,
+                due_date=t.due_date,
+                priority=t.priority,
+                owner_id=self.owner_id,
+                created_at=t.created_at or now,
+                updated_at=t.updated_at or now,
+                plan_id=self.plan_ids.get(t.plan_id),
+                parent_id=self.task_ids.get(t.parent_id),
+                completed=t.completed,
+            )
+            for t in self.tasks
+        ]
+        stmt = insert(DBTask).returning(DBTask.id, DBTask.due_date, DBTask.completed, sort_by_parameter_order=True)
+        rows = (await self.db.execute(stmt, values)).all()
+        for task, row in zip(self.tasks, rows):
+            self.task_ids[task.id] = row.id
+            if row.due_date is not None and not row.completed:
+                self.reminders.append(tuple(row))
+        self.tasks = []
+        self.pending_task_ids = set()
+
+
+@router.post("/import", response_model=ImportResult)
+async def import_workspace(
+    request: Request,
+    current_user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    importer = Importer(db, current_user.id)
+    line_no = 0
+    try:
+        async for line in request_lines(request):
+            line_no += 1
+            record = json.loads(line)
+            kind = record.pop("type", None)
+            if kind == "plan":
+                await importer.add_plan(ImportPlan.model_validate(record))
+            elif kind == "task":
+                await importer.add_task(ImportTask.model_validate(record))
+        await importer.flush_plans()
+        await importer.flush_tasks()
+    except (ValueError, ValidationError, zlib.error) as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid import record at line {line_no}: {e}")
+
+    await publish(db, [encode_event({**RESYNC, "users": [current_user.id]}), *cache_events([current_user.id], "tasks", "plans")])
+    await db.commit()
+    for task_id, due_date, completed in importer.reminders:
+        reminder_scheduler.schedule(task_id, due_date, completed)
+    await response_cache.invalidate([current_user.id], "tasks", "plans")
+    return ImportResult(plans=len(importer.plan_ids), tasks=len(importer.task_ids))
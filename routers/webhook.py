@@ -0,0 +1,27 @@
+import hmac
+
+from aiogram.types import Update
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from typing import Optional
+
+from bot import update_runner
+from settings import settings
+from tg import bot
+
+router = APIRouter(tags=["telegram"])
+
+WEBHOOK_PATH = "/tg/webhook"
+
+
+@router.post(WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: Optional[str] = Header(None),
+):
+    secret = settings.bot_webhook_secret
+    if secret and not hmac.compare_digest(x_telegram_bot_api_secret_token or "", secret):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # Отвечаем сразу: Telegram ждёт ответа не дольше таймаута и иначе шлёт апдейт повторно
+    update_runner.submit(update)
+    return Response(status_code=200)
@@ -1,7 +1,9 @@
 from datetime import datetime
-from typing import Optional, List, Any
+from typing import Dict, Literal, Optional, List, Any
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from models import Task, TaskFields, TaskUpdate
 
 
 class TelegramUserOut(BaseModel):
@@ -25,11 +27,103 @@ class PlanCreate(BaseModel):
     title: str
 
 
+class PlanStats(BaseModel):
+    total: int = 0
+    completed: int = 0
+    # Считается при чтении: зависит от текущего времени, а не от изменений задач
+    overdue: int = 0
+    by_priority: Dict[str, int] = {}
+
+
 class Plan(PlanCreate):
     id: int
     owner_id: int
     shared_with: List[int] = []
     created_at: datetime
     updated_at: datetime
+    stats: Optional[PlanStats] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class PlanDetail(Plan):
+    tasks: Optional[List[Task]] = None
+
+
+class ArchivedTask(TaskFields):
+    archived_at: datetime
+
+
+class TaskSeriesCreate(BaseModel):
+    title: str
+    description: Optional[str] = None
+    plan_id: Optional[int] = None
+    # Первое повторение; время суток повторений берётся отсюда
+    dtstart: datetime
+    freq: Literal["daily", "weekly", "monthly"]
+    interval: int = Field(1, ge=1, le=1000)
+    until: Optional[datetime] = None
+    count: Optional[int] = Field(None, ge=1, le=100000)
+    # 0 — понедельник; только для freq=weekly
+    weekdays: Optional[List[int]] = Field(None, min_length=1, max_length=7)
+
+
+class TaskSeries(BaseModel):
+    id: int
+    owner_id: int
+    title: str
+    description: Optional[str] = None
+    priority: Optional[str] = None
+    plan_id: Optional[int] = None
+    shared_with: List[int] = []
+    dtstart: datetime
+    freq: str
+    interval: int
+    until: Optional[datetime] = None
+    count: Optional[int] = None
+    weekdays: Optional[List[int]] = None
+    ends_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class OccurrenceUpdate(TaskUpdate):
+    # Плановое время повторения (occurrence_at из GET /tasks?expand_series=true)
+    occurrence_at: datetime
+
+
+class ImportPlan(BaseModel):
+    id: int
+    title: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class ImportTask(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    due_date: Optional[datetime] = None
+    priority: Optional[str] = None
+    completed: bool = False
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    plan_id: Optional[int] = None
+    parent_id: Optional[int] = None
+
+
+class ImportResult(BaseModel):
+    plans: int
+    tasks: int
+
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+class SyncResponse(BaseModel):
+    # token передаётся в следующий /sync?since=; записи могут прийти повторно, но не теряются.
+    # full — полный снимок вместо изменений (since=0 или токен старше хранения tombstones):
+    # клиент заменяет им свои данные целиком
+    token: str
+    full: bool
+    tasks: List[TaskFields] = []
+    plans: List[Plan] = []
+    deleted_tasks: List[int] = []
+    deleted_plans: List[int] = []
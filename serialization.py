@@ -0,0 +1,74 @@
+"""Сборка JSON-ответов прямо из строк БД.
+
+Строки из RETURNING/SELECT уже типизированы драйвером, поэтому повторная
+валидация через pydantic (model_validate в ручке и ещё раз по response_model
+в FastAPI) здесь не нужна: словари собираются один раз в порядке полей схемы
+и кодируются orjson. Ручки возвращают готовый Response, а response_model
+остаётся в декораторе только ради OpenAPI. Вывод совпадает байт в байт с
+тем, что дал бы pydantic, — это проверяет benchmarks/bench_serialization.py.
+"""
+from typing import Any, Iterable, Optional
+
+import orjson
+from fastapi import Response
+
+from models import Task, TaskListItem, TaskTreeNode
+from schemas import ArchivedTask, Plan
+
+# OPT_UTC_Z — как pydantic: aware-время в UTC пишется с «Z», а не «+00:00»
+JSON_OPTIONS = orjson.OPT_UTC_Z
+
+TASK_KEYS = tuple(f for f in Task.model_fields if f != "sub_tasks")
+TASK_LIST_KEYS = tuple(TaskListItem.model_fields)
+TASK_TREE_NODE_KEYS = tuple(TaskTreeNode.model_fields)
+ARCHIVED_TASK_KEYS = tuple(ArchivedTask.model_fields)
+PLAN_KEYS = tuple(f for f in Plan.model_fields if f != "stats")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=JSON_OPTIONS)
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    return Response(content=dumps(content), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def task_fields_dict(row) -> dict:
+    # Поля TaskFields — задача без дерева подзадач
+    return {f: row[f] for f in TASK_KEYS}
+
+
+def task_dict(row) -> dict:
+    # row — RowMapping или узел build_trees; у строк без дерева sub_tasks нет
+    item = task_fields_dict(row)
+    item["sub_tasks"] = [task_dict(child) for child in row.get("sub_tasks") or ()]
+    return item
+
+
+def task_list_item_dict(row) -> dict:
+    # Аналог exclude_unset: в ответ попадают только выбранные поля (fields=)
+    item = {f: row[f] for f in TASK_LIST_KEYS if f in row}
+    if "sub_tasks" in item:
+        item["sub_tasks"] = [task_dict(child) for child in item["sub_tasks"]]
+    return item
+
+
+def task_tree_node_dict(row) -> dict:
+    return {f: row[f] for f in TASK_TREE_NODE_KEYS}
+
+
+def archived_task_dict(row) -> dict:
+    return {f: row[f] for f in ARCHIVED_TASK_KEYS}
+
+
+def plan_dict(row, stats: Optional[dict] = None) -> dict:
+    item = {f: row[f] for f in PLAN_KEYS}
+    item["stats"] = stats
+    return item
+
+
+def plan_detail_dict(row, stats: Optional[dict] = None, tasks: Optional[Iterable] = None) -> dict:
+    # Поля PlanDetail: поля Plan, затем tasks
+    item = plan_dict(row, stats)
+    item["tasks"] = None if tasks is None else [task_dict(task) for task in tasks]
+    return item
@@ -0,0 +1,39 @@
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    database_url: str
+    db_echo: bool = False
+    # Пул у каждого воркера свой, плюс у каждого одно соединение под LISTEN ленты (feed.py):
+    # web_concurrency × (db_pool_size + db_max_overflow + 1) должно оставаться ниже
+    # max_connections Postgres (по умолчанию 100) с запасом на миграции и psql
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Кэш подготовленных выражений asyncpg; за pgbouncer в transaction-режиме ставить 0
+    db_statement_cache_size: int = 100
+    db_slow_query_ms: float = 200
+    # Server-Timing раскрывает клиенту время БД; включать для отладки
+    metrics_server_timing: bool = False
+    # Публичный адрес API; если задан, бот работает через webhook внутри API, а не polling
+    bot_webhook_url: Optional[str] = None
+    bot_webhook_secret: Optional[str] = None
+    bot_update_concurrency: int = 16
+    # Число воркеров uvicorn (compose передаёт его в --workers); webhook-режим требует 1
+    web_concurrency: int = 1
+    # Выполненные задачи старше N дней переносятся в tasks_archive; 0 — не архивировать
+    archive_after_days: int = 90
+    archive_interval_seconds: int = 3600
+    archive_batch_size: int = 500
+    # Tombstones старше N дней удаляются; /sync с более старым токеном отдаёт полный снимок.
+    # 0 — хранить вечно
+    tombstone_retention_days: int = 90
+
+
+settings = Settings()
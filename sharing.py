@@ -0,0 +1,45 @@
+from typing import Iterable
+
+from sqlalchemy import BigInteger, Text, delete, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from feed import change_event, publish
+from models import DBShare, DBTombstone
+
+SHARE_KEY = [DBShare.resource_type, DBShare.resource_id, DBShare.user_id]
+
+
+def grant(model, ids: Iterable[int], owner_id: int, user_id: int, role: str):
+    # Владение проверяется в самом INSERT ... SELECT: чужие ресурсы просто не попадают в выборку.
+    # RETURNING отдаёт только реально изменённые строки — повтор с той же ролью ничего не трогает
+    source = select(literal(model.share_kind), model.id, literal(user_id), literal(role)).where(
+        model.id.in_(list(ids)), model.owner_id == owner_id, model.owner_id != user_id,
+    )
+    stmt = insert(DBShare).from_select(["resource_type", "resource_id", "user_id", "role"], source)
+    return stmt.on_conflict_do_update(
+        index_elements=SHARE_KEY,
+        set_={"role": stmt.excluded.role},
+        where=DBShare.role != stmt.excluded.role,
+    ).returning(DBShare.resource_id)
+
+
+def revoke(model, ids: Iterable[int], owner_id: int, user_id: int):
+    owned = select(model.id).where(model.id.in_(list(ids)), model.owner_id == owner_id)
+    return (
+        delete(DBShare)
+        .where(DBShare.resource_type == model.share_kind, DBShare.user_id == user_id, DBShare.resource_id.in_(owned))
+        .returning(DBShare.resource_id)
+    )
+
+
+async def access_revoked(db: AsyncSession, kind: str, entity_ids: Iterable[int], user_id: int) -> None:
+    # Для бывшего участника ресурс всё равно что удалён: tombstone для /sync и delete в ленту
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    change_seq = func.pg_current_xact_id().cast(Text).cast(BigInteger)
+    await db.execute(insert(DBTombstone).values([
+        dict(kind=kind, entity_id=entity_id, user_ids=[user_id], change_seq=change_seq) for entity_id in entity_ids
+    ]))
+    await publish(db, [change_event(kind, "delete", {"id": entity_id}, [user_id]) for entity_id in entity_ids])
@@ -0,0 +1,77 @@
+from typing import Dict, List
+
+from sqlalchemy import and_, any_, literal, select, func, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import DBShare, DBTask, TASK_FIELDS, shared_users
+
+MAX_TREE_DEPTH = 10
+
+
+def subtree_query(root_clause, max_depth: int = MAX_TREE_DEPTH):
+    tasks = DBTask.__table__
+    # shared_with не колонка таблицы — добавляется уже к готовому дереву
+    columns = [tasks.c[f] for f in TASK_FIELDS if f != "shared_with"]
+
+    roots = select(*columns, literal(0).label("depth"), array([tasks.c.id]).label("path")).where(root_clause)
+    tree = roots.cte("task_tree", recursive=True)
+    children = select(
+        *columns,
+        (tree.c.depth + 1).label("depth"),
+        func.array_append(tree.c.path, tasks.c.id, type_=ARRAY(Integer)).label("path"),
+    ).where(
+        tasks.c.parent_id == tree.c.id,
+        tree.c.depth < max_depth,
+        # Защита от циклов в parent_id
+        ~(tasks.c.id == any_(tree.c.path)),
+    )
+    tree = tree.union_all(children)
+    # Сортировка по path даёт обход в глубину: родитель всегда раньше детей
+    return select(tree, shared_users("task", tree.c.id)).order_by(tree.c.path)
+
+
+async def load_subtree_rows(db: AsyncSession, root_clause, max_depth: int = MAX_TREE_DEPTH) -> List[dict]:
+    result = await db.execute(subtree_query(root_clause, max_depth))
+    return [dict(row) for row in result.mappings()]
+
+
+def build_trees(rows: List[dict]) -> List[dict]:
+    # Узлы идентифицируются путём, а не id: если в выборке есть и задача, и её
+    # предок, она встретится дважды — как корень и как потомок
+    nodes: Dict[tuple, dict] = {}
+    roots = []
+    for row in rows:
+        node = {f: row[f] for f in TASK_FIELDS}
+        node["sub_tasks"] = []
+        path = tuple(row["path"])
+        nodes[path] = node
+        parent = nodes.get(path[:-1]) if len(path) > 1 else None
+        if parent is None:
+            roots.append(node)
+        else:
+            parent["sub_tasks"].append(node)
+    return roots
+
+
+async def load_trees(db: AsyncSession, root_clause, max_depth: int = MAX_TREE_DEPTH) -> List[dict]:
+    return build_trees(await load_subtree_rows(db, root_clause, max_depth))
+
+
+async def ancestor_audience(db: AsyncSession, task_ids) -> Dict[int, set]:
+    # Для каждой задачи из task_ids — владельцы и участники её самой и всех
+    # предков: они видят потомков внутри дерева sub_tasks
+    tasks = DBTask.__table__
+    columns = [tasks.c.id, tasks.c.parent_id, tasks.c.owner_id]
+    chain = select(tasks.c.id.label("origin"), *columns).where(tasks.c.id.in_(task_ids)).cte("ancestors", recursive=True)
+    chain = chain.union(select(chain.c.origin, *columns).where(tasks.c.id == chain.c.parent_id))
+    stmt = select(chain.c.origin, chain.c.owner_id, DBShare.user_id).outerjoin(
+        DBShare, and_(DBShare.resource_type == "task", DBShare.resource_id == chain.c.id)
+    )
+    audience: Dict[int, set] = {}
+    for origin, owner_id, user_id in (await db.execute(stmt)).all():
+        users = audience.setdefault(origin, set())
+        users.add(owner_id)
+        if user_id is not None:
+            users.add(user_id)
+    return audience
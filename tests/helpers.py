@@ -0,0 +1,18 @@
+"""Request helpers shared by the API tests."""
+TASKS = "/tasks/tasks"
+
+
+async def create_tasks(client, headers, tasks):
+    response = await client.post(f"{TASKS}/batch", json=tasks, headers=headers)
+    assert response.status_code == 200, response.text
+    return [result["task"]["id"] for result in response.json()]
+
+
+async def sync_token(client, headers) -> str:
+    return (await client.get("/sync", headers=headers)).json()["token"]
+
+
+async def visible_ids(client, headers, url=TASKS) -> set:
+    response = await client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    return {task["id"] for task in response.json()}
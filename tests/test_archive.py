@@ -0,0 +1,44 @@
+"""Archiving old completed trees and restoring them."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from archive import archive_completed
+from database import async_session
+from helpers import TASKS, create_tasks, sync_token, visible_ids
+from models import DBTask
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_archive_and_restore(client, new_user, as_user):
+    owner, member = as_user(new_user()), as_user(new_user())
+    member_id = int(member["X-Test-User"])
+    parent_id, open_id = await create_tasks(client, owner, [{"title": "Done", "completed": True}, {"title": "Open"}])
+    (child_id,) = await create_tasks(client, owner, [{"title": "Done too", "completed": True, "parent_id": parent_id}])
+    await client.post(f"{TASKS}/{parent_id}/share", json={"user_id": member_id}, headers=owner)
+
+    async with async_session() as db:
+        await db.execute(
+            update(DBTask).where(DBTask.id.in_([parent_id, child_id, open_id])).values(updated_at=datetime.utcnow() - timedelta(days=60))
+        )
+        await db.commit()
+    token = await sync_token(client, owner)
+    assert await archive_completed(async_session, older_than=timedelta(days=30), batch_size=100) >= 2
+
+    assert await visible_ids(client, owner) == {open_id}
+    assert {parent_id, child_id} <= await visible_ids(client, owner, f"{TASKS}/archive")
+    assert parent_id in await visible_ids(client, member, f"{TASKS}/archive")
+    assert {parent_id, child_id} <= set((await client.get("/sync", params={"since": token}, headers=owner)).json()["deleted_tasks"])
+
+    assert (await client.post(f"{TASKS}/archive/{parent_id}/restore", headers=member)).status_code == 404
+    response = await client.post(f"{TASKS}/archive/{parent_id}/restore", headers=owner)
+    assert response.status_code == 200, response.text
+    assert [task["id"] for task in response.json()["sub_tasks"]] == [child_id]
+    assert await visible_ids(client, owner) == {open_id, parent_id, child_id}
+    assert not {parent_id, child_id} & await visible_ids(client, owner, f"{TASKS}/archive")
+    assert parent_id in await visible_ids(client, member)
+    changes = (await client.get("/sync", params={"since": token}, headers=owner)).json()
+    assert {parent_id, child_id} <= {task["id"] for task in changes["tasks"]}
+    assert not {parent_id, child_id} & set(changes["deleted_tasks"])
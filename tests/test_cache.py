@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from starlette.requests import Request
+
+from cache import MemoryBackend, ResponseCache, respond
+from feed import CACHE_EVENT_USERS, ChangeFeed, cache_events
+
+pytestmark = pytest.mark.anyio
+
+
+def request(query: str = "", headers: dict = None) -> Request:
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/tasks/tasks", "query_string": query.encode(), "headers": raw_headers})
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    # Свой экземпляр вместо общего: feed.py обращается к cache.response_cache по имени модуля
+    cache = ResponseCache(MemoryBackend())
+    monkeypatch.setattr("feed.response_cache", cache)
+    return cache
+
+
+async def test_key_ignores_parameter_order(response_cache):
+    first = await response_cache.key(1, "tasks", request("sort=title&limit=10"))
+    second = await response_cache.key(1, "tasks", request("limit=10&sort=title"))
+    assert first == second
+
+
+async def test_invalidate_changes_key(response_cache):
+    before = await response_cache.key(1, "tasks", request())
+    other = await response_cache.key(3, "tasks", request())
+    await response_cache.put(before, b"[]")
+    await response_cache.invalidate([1, 2], "tasks")
+    after = await response_cache.key(1, "tasks", request())
+    assert after != before and await response_cache.get(after) is None
+    assert await response_cache.key(3, "tasks", request()) == other
+
+
+async def test_etag_not_modified(response_cache):
+    entry = await response_cache.put("k", b"[1]", {"X-Next-Cursor": "abc"})
+    assert respond(request(headers={"If-None-Match": entry.etag}), entry).status_code == 304
+    response = respond(request(headers={"If-None-Match": '"other"'}), entry)
+    assert response.status_code == 200 and response.body == b"[1]"
+    assert response.headers["X-Next-Cursor"] == "abc"
+
+
+def test_cache_events_are_chunked(response_cache):
+    users = range(CACHE_EVENT_USERS * 2 + 1)
+    events = [json.loads(payload) for payload in cache_events([*users, 0], "tasks", "plans")]
+    assert [len(event["users"]) for event in events] == [CACHE_EVENT_USERS, CACHE_EVENT_USERS, 1]
+    assert sorted(user for event in events for user in event["users"]) == list(users)
+    assert all(event["kind"] == "cache" and event["scopes"] == ["tasks", "plans"] for event in events)
+
+
+def test_cache_events_not_needed_with_shared_backend(response_cache):
+    response_cache.local = False
+    assert cache_events([1], "tasks") == []
+
+
+async def test_dispatch_invalidates_other_worker(response_cache):
+    feed = ChangeFeed()
+    queue = feed.subscribe(1)
+    key = await response_cache.key(1, "tasks", request())
+    await response_cache.put(key, b"[]")
+    for payload in cache_events([1], "tasks"):
+        feed.dispatch(json.loads(payload))
+    assert await response_cache.key(1, "tasks", request()) != key
+    # Сброс кэша клиентам ленты не отправляется
+    assert queue.empty()
+
+
+async def test_reset_local_drops_entries(response_cache):
+    key = await response_cache.key(1, "tasks", request())
+    await response_cache.put(key, b"[]")
+    response_cache.reset_local()
+    assert await response_cache.get(key) is None
+
+
+async def test_evicted_version_counter_never_revives_old_entries():
+    cache = ResponseCache(MemoryBackend(maxsize=2))
+    key = await cache.key(1, "tasks", request())
+    await cache.put(key, b"[]")
+    await cache.invalidate([1], "tasks")
+    # Счётчик пользователя 1 вытесняется чужими; его записи ещё в LRU
+    await cache.invalidate([2, 3], "tasks")
+    assert len(cache.backend._counters) == 2
+    assert await cache.key(1, "tasks", request()) != key
+    current = await cache.key(1, "tasks", request())
+    await cache.put(current, b"[1]")
+    await cache.invalidate([1], "tasks")
+    assert await cache.key(1, "tasks", request()) not in (key, current)
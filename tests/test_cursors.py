@@ -0,0 +1,39 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from routers.tasks import ARCHIVE_SORT, decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("sort, value", [
+    ("-updated_at", datetime(2025, 5, 1, 12, 30, 15, 123456)),
+    ("created_at", datetime(2025, 5, 1)),
+    ("due_date", datetime(9999, 12, 31)),
+    ("-priority", 3),
+    ("title", "Купить молоко"),
+    (ARCHIVE_SORT, datetime(2025, 5, 1, 3)),
+])
+def test_round_trip(sort, value):
+    assert decode_cursor(encode_cursor(sort, value, 42), sort) == (value, 42)
+
+
+def test_legacy_cursor_is_updated_at():
+    legacy = base64.urlsafe_b64encode(json.dumps(["2025-05-01T12:00:00", 7]).encode()).decode()
+    assert decode_cursor(legacy, "-updated_at") == (datetime(2025, 5, 1, 12), 7)
+
+
+@pytest.mark.parametrize("cursor, sort", [
+    (encode_cursor("-updated_at", datetime(2025, 5, 1), 1), "title"),
+    (encode_cursor("title", "a", 1), "-title"),
+    (encode_cursor("due_date", "not a date", 1), "due_date"),
+    (encode_cursor("title", "a", "x"), "title"),
+    ("not-base64!", "-updated_at"),
+    (base64.urlsafe_b64encode(b"[1, 2, 3, 4]").decode(), "-updated_at"),
+])
+def test_invalid_cursor(cursor, sort):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, sort)
+    assert error.value.status_code == 400
@@ -0,0 +1,151 @@
+"""EXPLAIN checks: the query shapes used by the endpoints can be served by their indexes.
+
+The test tables are small, so a sequential scan would always be cheaper;
+enable_seqscan is switched off for the EXPLAIN so the planner shows whether an
+index matches the predicate at all. A plan without the expected index means the
+query shape or the index definition drifted apart.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from archive import ROOTS_SQL
+from models import DBPlan, DBShare, DBTask, DBTaskSeries, DBTombstone
+from queries import shared_with_user, visible_to
+from reminders import REMIND_BEFORE
+from routers.tasks import search_query
+
+pytestmark = pytest.mark.anyio
+
+_workload = {}
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def index_names(plan) -> set:
+    names = set()
+
+    def walk(node):
+        if "Index Name" in node:
+            names.add(node["Index Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    for entry in plan:
+        walk(entry["Plan"])
+    return names
+
+
+@pytest.fixture
+async def workload(db, new_user):
+    # Данные общие для всех проверок модуля: сидируются один раз за прогон.
+    # Чужие строки — у отрицательных owner_id, чтобы не пересечься с пользователями других тестов
+    if _workload:
+        return _workload
+    owner, member = new_user(), new_user()
+    now = datetime.utcnow()
+    plan_id = await db.scalar(insert(DBPlan).values(title="Plan", owner_id=owner).returning(DBPlan.id))
+    series_id = await db.scalar(insert(DBTaskSeries).values(
+        owner_id=owner, title="Daily", dtstart=now - timedelta(days=100), freq="daily",
+    ).returning(DBTaskSeries.id))
+    tasks = [
+        dict(
+            title=f"task {i} milk" if i % 50 == 0 else f"task {i}", owner_id=owner if i % 4 == 0 else -1 - i % 97,
+            plan_id=plan_id if i % 2 == 0 else None, completed=i % 3 == 0, priority="medium",
+            due_date=now + timedelta(hours=i % 500 - 250), created_at=now, updated_at=now - timedelta(days=i % 90),
+            series_id=series_id if i < 100 else None, occurrence_at=now - timedelta(days=i) if i < 100 else None,
+        )
+        for i in range(4000)
+    ]
+    ids = list((await db.scalars(insert(DBTask).returning(DBTask.id), tasks)))
+    await db.execute(insert(DBTask).values(title="child", owner_id=owner, parent_id=ids[0], priority="medium"))
+    await db.execute(insert(DBShare), [{"resource_type": "task", "resource_id": task_id, "user_id": member} for task_id in ids[:40]])
+    await db.execute(insert(DBTombstone), [
+        {"kind": "task", "entity_id": i, "user_ids": [member if i % 20 == 0 else -1 - i % 97], "change_seq": i}
+        for i in range(1, 2001)
+    ])
+    await db.commit()
+    for table in ("tasks", "shares", "tombstones", "plans", "task_series"):
+        await db.execute(text(f"ANALYZE {table}"))
+    await db.commit()
+    _workload.update(owner=owner, member=member, plan_id=plan_id, series_id=series_id, parent_id=ids[0], now=now)
+    return _workload
+
+
+async def plan_indexes(db, statement, params=None) -> set:
+    await db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = (await db.execute(Explain(statement), params or {})).scalar_one()
+    await db.rollback()
+    return index_names(json.loads(plan) if isinstance(plan, str) else plan)
+
+
+async def test_visibility_uses_owner_and_share_indexes(db, workload):
+    stmt = select(DBTask.id).where(visible_to(DBTask, workload["member"])).order_by(DBTask.updated_at.desc(), DBTask.id.desc())
+    assert {"ix_tasks_owner_updated", "ix_shares_user"} <= await plan_indexes(db, stmt)
+    stmt = select(DBPlan.id).where(visible_to(DBPlan, workload["owner"]))
+    assert "ix_plans_owner_id" in await plan_indexes(db, stmt)
+
+
+async def test_shared_with_me_reads_shares_only(db, workload):
+    stmt = select(DBTask.id).where(shared_with_user(DBTask, workload["member"]))
+    indexes = await plan_indexes(db, stmt)
+    assert "ix_shares_user" in indexes and "ix_tasks_owner_updated" not in indexes
+
+
+async def test_full_text_search(db, workload):
+    stmt = select(DBTask.id).where(DBTask.search_vector.op("@@")(search_query("milk")))
+    assert "ix_tasks_search_vector" in await plan_indexes(db, stmt)
+
+
+async def test_reminder_window(db, workload):
+    now = workload["now"]
+    stmt = select(DBTask.id).where(~DBTask.completed, DBTask.due_date >= now, DBTask.due_date < now + REMIND_BEFORE)
+    assert "ix_tasks_due_date_open" in await plan_indexes(db, stmt)
+
+
+async def test_plan_overdue_counter(db, workload):
+    stmt = select(func.count()).where(
+        DBTask.plan_id == workload["plan_id"], ~DBTask.completed, DBTask.due_date < func.timezone("UTC", func.now()),
+    )
+    assert "ix_tasks_plan_open_due" in await plan_indexes(db, stmt)
+
+
+async def test_sub_tasks(db, workload):
+    stmt = select(DBTask.id).where(DBTask.parent_id.in_([workload["parent_id"]]))
+    assert "ix_tasks_parent_id" in await plan_indexes(db, stmt)
+
+
+async def test_sync_changes(db, workload):
+    since = await db.scalar(select(func.max(DBTask.change_seq)))
+    assert "ix_tasks_change_seq" in await plan_indexes(db, select(DBTask.id).where(DBTask.change_seq >= since))
+    stmt = select(DBTombstone.entity_id).where(DBTombstone.user_ids.contains([workload["member"]]), DBTombstone.change_seq >= 1)
+    assert "ix_tombstones_user_ids" in await plan_indexes(db, stmt)
+
+
+async def test_archive_candidates(db, workload):
+    params = {"cutoff": workload["now"] - timedelta(days=30), "after_updated_at": datetime.min, "after_id": 0, "limit": 500}
+    assert "ix_tasks_completed_updated" in await plan_indexes(db, text(ROOTS_SQL), params)
+
+
+async def test_series_window(db, workload):
+    now = workload["now"]
+    stmt = select(DBTaskSeries.id).where(visible_to(DBTaskSeries, workload["owner"]), DBTaskSeries.dtstart < now)
+    assert "ix_task_series_owner" in await plan_indexes(db, stmt)
+    stmt = select(DBTask.series_id, DBTask.occurrence_at).where(
+        DBTask.series_id.in_([workload["series_id"]]), DBTask.occurrence_at >= now - timedelta(days=7), DBTask.occurrence_at < now,
+    )
+    assert "ix_tasks_series_occurrence" in await plan_indexes(db, stmt)
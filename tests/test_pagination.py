@@ -0,0 +1,44 @@
+"""Keyset pages of GET /tasks for every sort order."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from helpers import TASKS, create_tasks
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("sort", ["-updated_at", "created_at", "due_date", "-due_date", "-priority", "priority", "title", "-title"])
+async def test_keyset_pages_cover_the_list(client, new_user, as_user, sort):
+    headers = as_user(new_user())
+    base = datetime(2030, 1, 1)
+    # Одинаковые created_at/updated_at у всей пачки, повторы заголовков и сроков — ничьи решает id
+    await create_tasks(client, headers, [
+        {
+            "title": ("urgent ", "later ", "", "")[i % 4] + f"task {i % 5}",
+            "due_date": None if i % 3 == 0 else (base + timedelta(days=i % 4)).isoformat(),
+        }
+        for i in range(23)
+    ])
+    full = (await client.get(TASKS, params={"sort": sort, "sub_tasks": "none"}, headers=headers)).json()
+    assert len(full) == 23
+
+    pages, cursor = [], None
+    while True:
+        params = {"sort": sort, "limit": 5, "sub_tasks": "none", **({"cursor": cursor} if cursor else {})}
+        response = await client.get(TASKS, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([task["id"] for task in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [task_id for page in pages for task_id in page] == [task["id"] for task in full]
+
+
+async def test_cursor_of_another_sort_is_rejected(client, new_user, as_user):
+    headers = as_user(new_user())
+    await create_tasks(client, headers, [{"title": f"task {i}"} for i in range(3)])
+    cursor = (await client.get(TASKS, params={"limit": 1}, headers=headers)).headers["X-Next-Cursor"]
+    response = await client.get(TASKS, params={"limit": 1, "sort": "title", "cursor": cursor}, headers=headers)
+    assert response.status_code == 400
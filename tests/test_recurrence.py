@@ -0,0 +1,113 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from recurrence import expand, is_occurrence, last_occurrence, occurrence, occurrence_row, occurrences
+
+
+def rule(dtstart, freq, interval=1, weekdays=None, until=None, count=None, series_id=1):
+    series = {
+        "id": series_id, "dtstart": dtstart, "freq": freq, "interval": interval,
+        "weekdays": weekdays, "until": until, "count": count,
+    }
+    series["ends_at"] = last_occurrence(series)
+    return series
+
+
+def walk(series, start, end):
+    # Эталон — перебор с первого повторения
+    k = 0
+    while series["count"] is None or k < series["count"]:
+        at = occurrence(series, k)
+        if at >= end or (series["until"] is not None and at > series["until"]):
+            return
+        if at >= start:
+            yield at
+        k += 1
+
+
+def random_rules(seed: int, count: int):
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 31, 9, 30)
+    for series_id in range(count):
+        freq = rng.choice(("daily", "weekly", "monthly"))
+        weekdays = sorted(rng.sample(range(7), k=rng.randint(1, 4))) if freq == "weekly" and rng.random() < 0.6 else None
+        until = base + timedelta(days=rng.randrange(30, 900)) if rng.random() < 0.3 else None
+        limit = rng.randint(1, 400) if rng.random() < 0.3 else None
+        dtstart = base + timedelta(days=rng.randrange(-400, 400), minutes=rng.randrange(24 * 60))
+        yield rule(dtstart, freq, rng.choice((1, 2, 3, 5)), weekdays, until, limit, series_id)
+
+
+def test_lazy_window_matches_walk():
+    windows = [(datetime(2024, 6, 1), timedelta(days=1)), (datetime(2025, 2, 27), timedelta(days=7)), (datetime(2025, 1, 1), timedelta(days=90))]
+    for series in random_rules(seed=7, count=300):
+        for start, length in windows:
+            assert list(occurrences(series, start, start + length)) == list(walk(series, start, start + length)), series
+
+
+def test_window_is_half_open():
+    series = rule(datetime(2025, 3, 1, 8), "daily")
+    assert list(occurrences(series, datetime(2025, 3, 2, 8), datetime(2025, 3, 4, 8))) == [
+        datetime(2025, 3, 2, 8), datetime(2025, 3, 3, 8),
+    ]
+
+
+def test_monthly_clamps_to_month_end():
+    series = rule(datetime(2025, 1, 31, 10), "monthly", count=4)
+    assert [occurrence(series, k) for k in range(4)] == [
+        datetime(2025, 1, 31, 10), datetime(2025, 2, 28, 10), datetime(2025, 3, 31, 10), datetime(2025, 4, 30, 10),
+    ]
+
+
+def test_weekly_weekdays_skip_days_before_dtstart():
+    # Среда; понедельник первой недели не в счёт
+    series = rule(datetime(2025, 1, 1, 9), "weekly", interval=2, weekdays=[0, 2, 4])
+    assert [occurrence(series, k) for k in range(4)] == [
+        datetime(2025, 1, 1, 9), datetime(2025, 1, 3, 9), datetime(2025, 1, 13, 9), datetime(2025, 1, 15, 9),
+    ]
+
+
+def test_until_and_count_end_the_series():
+    by_count = rule(datetime(2025, 1, 1), "daily", count=3)
+    by_until = rule(datetime(2025, 1, 1), "daily", interval=2, until=datetime(2025, 1, 6))
+    assert by_count["ends_at"] == datetime(2025, 1, 3)
+    assert by_until["ends_at"] == datetime(2025, 1, 5)
+    assert list(occurrences(by_count, datetime(2024, 12, 1), datetime(2026, 1, 1))) == [
+        datetime(2025, 1, 1), datetime(2025, 1, 2), datetime(2025, 1, 3),
+    ]
+    assert rule(datetime(2025, 1, 1), "daily")["ends_at"] is None
+    assert rule(datetime(2025, 1, 1, 12), "daily", until=datetime(2025, 1, 1))["ends_at"] is None
+
+
+@pytest.mark.parametrize("moment, expected", [
+    (datetime(2025, 1, 1, 9), True),
+    (datetime(2025, 1, 8, 9), True),
+    (datetime(2025, 1, 8, 9, 1), False),
+    (datetime(2025, 1, 2, 9), False),
+    (datetime(2025, 1, 29, 9), False),  # пятое повторение, count=4
+    (datetime(2024, 12, 25, 9), False),
+])
+def test_is_occurrence(moment, expected):
+    assert is_occurrence(rule(datetime(2025, 1, 1, 9), "weekly", count=4), moment) is expected
+
+
+def test_expand_skips_materialized():
+    first = rule(datetime(2025, 1, 1, 9), "daily", series_id=1)
+    second = rule(datetime(2025, 1, 1, 18), "daily", series_id=2)
+    start, end = datetime(2025, 1, 1), datetime(2025, 1, 3)
+    taken = {(1, datetime(2025, 1, 2, 9)), (2, datetime(2025, 1, 1, 18))}
+    assert [(series["id"], at) for series, at in expand([first, second], taken, start, end)] == [
+        (1, datetime(2025, 1, 1, 9)), (2, datetime(2025, 1, 2, 18)),
+    ]
+
+
+def test_occurrence_priority_depends_on_its_due_date():
+    now = datetime(2025, 1, 1, 12)
+    series = {
+        **rule(now + timedelta(minutes=30), "daily"), "title": "Water the plants later", "description": None,
+        "owner_id": 1, "shared_with": [], "plan_id": None, "created_at": now, "updated_at": now,
+    }
+    assert occurrence_row(series, now + timedelta(minutes=30), now)["priority"] == "high"
+    assert occurrence_row(series, now + timedelta(days=2), now)["priority"] == "medium"
+    assert occurrence_row(series, now + timedelta(days=10), now)["priority"] == "low"
@@ -0,0 +1,93 @@
+"""Recurring series through the API: expansion, reminders, materialisation."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from helpers import TASKS
+from reminders import ReminderScheduler
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_series_expansion(client, new_user, as_user):
+    headers = as_user(new_user())
+    now = datetime.utcnow().replace(microsecond=0)
+    first = now + timedelta(minutes=30)
+    series = (await client.post(f"{TASKS}/series", json={
+        "title": "Water the plants later", "dtstart": first.isoformat(), "freq": "daily", "count": 10,
+    }, headers=headers)).json()
+    assert series["priority"] == "low"
+    window = {"expand_series": True, "due_from": now.isoformat(), "due_to": (now + timedelta(days=3)).isoformat()}
+
+    items = (await client.get(TASKS, params=window, headers=headers)).json()
+    assert [(item["id"], item["occurrence_at"]) for item in sorted(items, key=lambda item: item["due_date"])] == [
+        (None, (first + timedelta(days=k)).isoformat()) for k in range(3)
+    ]
+    # Приоритет у каждого повторения свой: ближайшее — срочное
+    high = (await client.get(TASKS, params={**window, "priority": "high"}, headers=headers)).json()
+    assert [item["occurrence_at"] for item in high] == [first.isoformat()]
+    reminders = (await client.get("/reminders", headers=headers)).json()["reminders"]
+    assert [(item["series_id"], item["due_date"]) for item in reminders] == [(series["id"], first.isoformat())]
+
+    bad = await client.post(f"{TASKS}/series/{series['id']}/occurrences", json={"occurrence_at": (first + timedelta(minutes=1)).isoformat()}, headers=headers)
+    assert bad.status_code == 400
+    done = await client.post(f"{TASKS}/series/{series['id']}/occurrences", json={"occurrence_at": first.isoformat(), "completed": True}, headers=headers)
+    assert done.status_code == 200, done.text
+    task = done.json()
+    assert task["completed"] and task["series_id"] == series["id"]
+
+    items = (await client.get(TASKS, params=window, headers=headers)).json()
+    assert sorted((item["id"] is None, item["due_date"]) for item in items) == [
+        (False, first.isoformat()), (True, (first + timedelta(days=1)).isoformat()), (True, (first + timedelta(days=2)).isoformat()),
+    ]
+    assert (await client.get("/reminders", headers=headers)).json()["reminders"] == []
+
+    assert (await client.delete(f"{TASKS}/series/{series['id']}", headers=headers)).status_code == 204
+    assert [item["id"] for item in (await client.get(TASKS, params=window, headers=headers)).json()] == [task["id"]]
+
+
+async def test_series_plan_must_be_visible(client, new_user, as_user):
+    owner, member, stranger = (as_user(new_user()) for _ in range(3))
+    plan = (await client.post("/plans/plans", json={"title": "Gym"}, headers=owner)).json()
+    await client.post(f"/plans/plans/{plan['id']}/share", json={"user_id": int(member["X-Test-User"])}, headers=owner)
+    body = {"title": "Stretch", "dtstart": datetime.utcnow().isoformat(), "freq": "daily", "plan_id": plan["id"]}
+    assert (await client.post(f"{TASKS}/series", json=body, headers=stranger)).status_code == 404
+    for headers in (owner, member):
+        response = await client.post(f"{TASKS}/series", json=body, headers=headers)
+        assert response.status_code == 200 and response.json()["plan_id"] == plan["id"]
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+
+async def test_series_push_reminders(client, new_user, as_user):
+    from database import async_session
+
+    user_id = new_user()
+    headers = as_user(user_id)
+    now = datetime.utcnow().replace(microsecond=0)
+    first = now + timedelta(minutes=30)
+    series = (await client.post(f"{TASKS}/series", json={
+        "title": "Stretch", "dtstart": first.isoformat(), "freq": "daily",
+    }, headers=headers)).json()
+    bot = RecordingBot()
+    scheduler = ReminderScheduler(async_session, bot)
+    await scheduler._load(now)
+    assert (series["id"], first) in scheduler._occurrences
+    assert (series["id"], first + timedelta(days=1)) not in scheduler._occurrences
+
+    # Второй воркер с тем же повторением ничего не отправляет
+    await scheduler._fire_series(series["id"], first)
+    await ReminderScheduler(async_session, bot)._fire_series(series["id"], first)
+    assert bot.sent == [user_id]
+
+    # Изменённое повторение — уже задача, напоминание о нём идёт по задаче
+    second = first + timedelta(days=1)
+    await client.post(f"{TASKS}/series/{series['id']}/occurrences", json={"occurrence_at": second.isoformat(), "title": "Stretch more"}, headers=headers)
+    await scheduler._fire_series(series["id"], second)
+    assert bot.sent == [user_id]
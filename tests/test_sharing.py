@@ -0,0 +1,71 @@
+"""Visibility of tasks and plans through the shares table."""
+import pytest
+
+from helpers import TASKS, create_tasks, sync_token, visible_ids
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sharing_visibility(client, new_user, as_user):
+    owner, member, stranger = (as_user(new_user()) for _ in range(3))
+    member_id = int(member["X-Test-User"])
+    plan = (await client.post("/plans/plans", json={"title": "Trip"}, headers=owner)).json()
+    task_id, plan_task, private_task = await create_tasks(client, owner, [
+        {"title": "Pack"}, {"title": "Tickets", "plan_id": plan["id"]}, {"title": "Gift", "plan_id": plan["id"]},
+    ])
+    # Список участника попадает в кэш до выдачи доступа — выдача должна его сбросить
+    assert await visible_ids(client, member) == set()
+
+    for shared in (task_id, plan_task):
+        response = await client.post(f"{TASKS}/{shared}/share", json={"user_id": member_id}, headers=owner)
+        assert response.status_code == 200 and member_id in response.json()["shared_with"]
+    assert (await client.post(f"/plans/plans/{plan['id']}/share", json={"user_id": member_id}, headers=owner)).status_code == 200
+
+    assert await visible_ids(client, member) == {task_id, plan_task}
+    assert await visible_ids(client, member, f"{TASKS}/shared") == {task_id, plan_task}
+    assert (await client.get(f"{TASKS}/{task_id}", headers=member)).status_code == 200
+    assert (await client.get(f"{TASKS}/{task_id}", headers=stranger)).status_code == 404
+    assert await visible_ids(client, stranger) == set()
+    # Участник плана видит в нём только открытые ему задачи
+    detail = (await client.get(f"/plans/plans/{plan['id']}", params={"include_tasks": True}, headers=member)).json()
+    assert [task["id"] for task in detail["tasks"]] == [plan_task]
+    assert private_task not in await visible_ids(client, member)
+    assert (await client.get(f"/plans/plans/{plan['id']}", headers=stranger)).status_code == 404
+    # Роль по умолчанию — viewer: менять задачу он не может
+    assert (await client.put(f"{TASKS}/{task_id}", json={"title": "x"}, headers=member)).status_code == 404
+
+    token = await sync_token(client, member)
+    assert (await client.delete(f"{TASKS}/{task_id}/share/{member_id}", headers=owner)).status_code == 200
+    assert await visible_ids(client, member) == {plan_task}
+    assert (await client.get(f"{TASKS}/{task_id}", headers=member)).status_code == 404
+    changes = (await client.get("/sync", params={"since": token}, headers=member)).json()
+    assert task_id in changes["deleted_tasks"]
+
+    # Доступ вернули — tombstone перекрыт живой строкой
+    await client.post(f"{TASKS}/{task_id}/share", json={"user_id": member_id}, headers=owner)
+    changes = (await client.get("/sync", params={"since": token}, headers=member)).json()
+    assert task_id in {task["id"] for task in changes["tasks"]}
+    assert task_id not in changes["deleted_tasks"]
+
+
+async def test_editor_role(client, new_user, as_user):
+    owner, editor, viewer = (as_user(new_user()) for _ in range(3))
+    plan = (await client.post("/plans/plans", json={"title": "Trip"}, headers=owner)).json()
+    task_id, other_id = await create_tasks(client, owner, [{"title": "Pack"}, {"title": "Tickets"}])
+    for headers, role in ((editor, "editor"), (viewer, "viewer")):
+        share = {"user_id": int(headers["X-Test-User"]), "role": role}
+        assert (await client.post(f"{TASKS}/batch/share", json={"ids": [task_id, other_id], **share}, headers=owner)).status_code == 200
+        assert (await client.post(f"/plans/plans/{plan['id']}/share", json=share, headers=owner)).status_code == 200
+
+    response = await client.put(f"{TASKS}/{task_id}", json={"title": "Pack bags"}, headers=editor)
+    assert response.status_code == 200 and response.json()["title"] == "Pack bags"
+    assert (await client.put(f"{TASKS}/{task_id}", json={"title": "x"}, headers=viewer)).status_code == 404
+    results = (await client.put(f"{TASKS}/batch", json=[{"id": other_id, "completed": True}], headers=editor)).json()
+    assert results[0]["ok"] and results[0]["task"]["completed"]
+    assert not (await client.put(f"{TASKS}/batch", json=[{"id": other_id, "title": "x"}], headers=viewer)).json()[0]["ok"]
+    assert (await client.put(f"/plans/plans/{plan['id']}", json={"title": "Holiday"}, headers=editor)).status_code == 200
+    assert (await client.put(f"/plans/plans/{plan['id']}", json={"title": "x"}, headers=viewer)).status_code == 404
+    # Удалять и делиться дальше может только владелец
+    assert (await client.delete(f"{TASKS}/{task_id}", headers=editor)).status_code == 404
+    stranger = new_user()
+    assert (await client.post(f"{TASKS}/{task_id}/share", json={"user_id": stranger}, headers=editor)).status_code == 404
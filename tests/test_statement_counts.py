@@ -0,0 +1,110 @@
+"""SQL statements per request for the hot endpoints.
+
+Counted with a before_cursor_execute listener; BEGIN/COMMIT go through the
+asyncpg transaction API and are not included. Each request is made once
+before counting so the dialect's first-connect queries do not leak in.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+TASKS = "/tasks/tasks"
+
+
+@pytest.fixture
+async def owner(client, new_user, as_user):
+    headers = as_user(new_user())
+    plan = (await client.post("/plans/plans", json={"title": "Plan"}, headers=headers)).json()
+    response = await client.post(f"{TASKS}/batch", json=[
+        {"title": "Root", "plan_id": plan["id"], "due_date": (datetime.utcnow() + timedelta(minutes=20)).isoformat()},
+        {"title": "Other"},
+    ], headers=headers)
+    root_id, other_id = (result["task"]["id"] for result in response.json())
+    await client.post(TASKS, json={"title": "Child", "parent_id": root_id}, headers=headers)
+    return {"headers": headers, "plan_id": plan["id"], "root_id": root_id, "other_id": other_id}
+
+
+async def count(statements, request) -> int:
+    response, executed = await statements.during(request)
+    assert response.status_code < 400, response.text
+    return executed
+
+
+async def warm_count(statements, method, url, **kwargs) -> int:
+    # Первый вызов — прогрев, считается второй
+    await method(url, **kwargs)
+    return await count(statements, method(url, **kwargs))
+
+
+async def test_create_task(client, owner, statements):
+    # INSERT ... RETURNING и pg_notify
+    assert await warm_count(statements, client.post, TASKS, json={"title": "New"}, headers=owner["headers"]) <= 2
+
+
+async def test_batch_create(client, owner, statements):
+    tasks = [{"title": f"New {i}"} for i in range(50)]
+    assert await warm_count(statements, client.post, f"{TASKS}/batch", json=tasks, headers=owner["headers"]) <= 2
+
+
+@pytest.mark.parametrize("body, params, budget", [
+    ({"completed": True}, {}, 2),
+    # Для анализа приоритета дочитываются description и due_date
+    ({"title": "Renamed"}, {}, 3),
+    ({"completed": False}, {"include_sub_tasks": True}, 3),
+])
+async def test_update_task(client, owner, statements, body, params, budget):
+    assert await warm_count(statements, client.put, f"{TASKS}/{owner['other_id']}", json=body, params=params, headers=owner["headers"]) <= budget
+
+
+async def test_update_task_in_plan(client, owner, statements):
+    # + участники плана: у них сбрасывается кэш списка планов
+    assert await warm_count(statements, client.put, f"{TASKS}/{owner['root_id']}", json={"completed": False}, headers=owner["headers"]) <= 3
+
+
+async def test_delete_task(client, owner, statements):
+    response = await client.post(f"{TASKS}/batch", json=[{"title": "Doomed"}], headers=owner["headers"])
+    await client.delete(f"{TASKS}/{owner['other_id']}", headers=owner["headers"])
+    task_id = response.json()[0]["task"]["id"]
+    assert await count(statements, client.delete(f"{TASKS}/{task_id}", headers=owner["headers"])) <= 2
+
+
+async def test_share_task(client, owner, new_user, statements):
+    url = f"{TASKS}/{owner['other_id']}/share"
+    await client.post(url, json={"user_id": new_user()}, headers=owner["headers"])
+    # grant, UPDATE ... RETURNING, pg_notify; повторная выдача ничего не меняет и не публикует
+    share = {"user_id": new_user()}
+    assert await count(statements, client.post(url, json=share, headers=owner["headers"])) <= 3
+    assert await count(statements, client.post(url, json=share, headers=owner["headers"])) <= 2
+
+
+async def test_update_plan(client, owner, statements):
+    assert await warm_count(statements, client.put, f"/plans/plans/{owner['plan_id']}", json={"title": "Renamed"}, headers=owner["headers"]) <= 2
+
+
+async def test_list_tasks(client, owner, statements):
+    headers = owner["headers"]
+    await client.get(TASKS, params={"sort": "title"}, headers=headers)
+    await client.post(TASKS, json={"title": "Invalidate"}, headers=headers)
+    # Список и все деревья подзадач одним WITH RECURSIVE
+    assert await count(statements, client.get(TASKS, params={"sort": "title"}, headers=headers)) <= 2
+    assert await count(statements, client.get(TASKS, params={"sort": "title"}, headers=headers)) == 0
+
+
+async def test_get_task(client, owner, statements):
+    assert await warm_count(statements, client.get, f"{TASKS}/{owner['root_id']}", headers=owner["headers"]) <= 1
+
+
+async def test_get_plan_with_tasks(client, owner, statements):
+    assert await warm_count(statements, client.get, f"/plans/plans/{owner['plan_id']}", params={"include_tasks": True}, headers=owner["headers"]) <= 2
+
+
+async def test_sync(client, owner, statements):
+    token = (await client.get("/sync", headers=owner["headers"])).json()["token"]
+    # Токен, задачи, планы, tombstones
+    assert await count(statements, client.get("/sync", params={"since": token}, headers=owner["headers"])) <= 4
+
+
+async def test_reminders(client, owner, statements):
+    assert await warm_count(statements, client.get, "/reminders", headers=owner["headers"]) <= 2
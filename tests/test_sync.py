@@ -0,0 +1,45 @@
+"""/sync tokens and tombstone retention."""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+
+from helpers import TASKS, create_tasks, sync_token
+from models import DBTombstone
+from tombstones import purge_tombstones
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sync_reports_changes_since_token(client, new_user, as_user):
+    owner = as_user(new_user())
+    first = (await client.get("/sync", headers=owner)).json()
+    assert first["full"] and first["tasks"] == []
+    kept, doomed = await create_tasks(client, owner, [{"title": "Keep"}, {"title": "Doomed"}])
+    await client.delete(f"{TASKS}/{doomed}", headers=owner)
+    changes = (await client.get("/sync", params={"since": first["token"]}, headers=owner)).json()
+    assert not changes["full"]
+    assert [task["id"] for task in changes["tasks"]] == [kept] and "sub_tasks" not in changes["tasks"][0]
+    assert changes["deleted_tasks"] == [doomed]
+
+
+async def test_stale_token_after_purge_gets_full_snapshot(client, db, new_user, as_user):
+    from database import async_session
+
+    owner = as_user(new_user())
+    kept, doomed = await create_tasks(client, owner, [{"title": "Keep"}, {"title": "Doomed"}])
+    token = await sync_token(client, owner)
+    await client.delete(f"{TASKS}/{doomed}", headers=owner)
+    await db.execute(
+        update(DBTombstone).where(DBTombstone.entity_id == doomed, DBTombstone.kind == "task")
+        .values(deleted_at=DBTombstone.deleted_at - timedelta(days=31))
+    )
+    await db.commit()
+    assert await purge_tombstones(async_session, timedelta(days=30), batch_size=1) >= 1
+
+    changes = (await client.get("/sync", params={"since": token}, headers=owner)).json()
+    assert changes["full"] and changes["deleted_tasks"] == []
+    assert {task["id"] for task in changes["tasks"]} == {kept}
+    # Новый токен уже за горизонтом — снова только изменения
+    changes = (await client.get("/sync", params={"since": changes["token"]}, headers=owner)).json()
+    assert not changes["full"] and changes["tasks"] == []
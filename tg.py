@@ -1,13 +1,15 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from aiogram import Bot
-from aiogram.types import UserProfilePhotos
 from dotenv import load_dotenv
-from database import get_db
-from models import TelegramUser
+from avatars import AvatarService
+from metrics import TelegramTimingMiddleware
+from database import async_session
+from register import TelegramUser, get_current_user
 from schemas import TelegramUserOut
+from user_directory import MAX_LOOKUP_IDS, user_directory
 
 router = APIRouter(prefix="/tg", tags=["telegram"])
 
@@ -16,53 +18,41 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 bot = Bot(token=BOT_TOKEN)
+bot.session.middleware(TelegramTimingMiddleware())
+
+avatar_service = AvatarService(async_session, bot, user_directory)
 
 async def get_bot() -> Bot:
     return bot
 
+async def get_avatar_service() -> AvatarService:
+    return avatar_service
+
+@router.get("/users", response_model=List[TelegramUserOut])
+async def get_telegram_users(
+    ids: str = Query(..., description=f"Comma-separated Telegram user ids, up to {MAX_LOOKUP_IDS}"),
+    current_user: TelegramUser = Depends(get_current_user),
+):
+    # Профили соавторов из БД/кэша одним запросом; Bot API не трогаем —
+    # неизвестных пользователей просто нет в ответе
+    try:
+        user_ids = [int(i) for i in ids.split(",") if i.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if len(user_ids) > MAX_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_IDS} ids per request")
+    users = await user_directory.get_many(user_ids)
+    return [users[i] for i in dict.fromkeys(user_ids) if i in users]
+
 @router.get("/info/{identifier}", response_model=TelegramUserOut)
 async def get_telegram_info(
     identifier: str,
-    db: AsyncSession = Depends(get_db),
-    bot: Bot = Depends(get_bot)
+    avatars: AvatarService = Depends(get_avatar_service)
 ):
     try:
-        chat = await bot.get_chat(identifier)
-        photos: UserProfilePhotos = await bot.get_user_profile_photos(chat.id, limit=1)
-        avatar_url = None
-        if photos.total_count > 0:
-            biggest = photos.photos[0][-1]
-            file = await bot.get_file(biggest.file_id)
-            save_path = f"static/avatars/{chat.id}.jpg"
-            await bot.download_file(file.file_path, save_path)
-            avatar_url = f"/static/avatars/{chat.id}.jpg"
-
+        return await avatars.get_user(identifier)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=" Telegram-User не найден или бот его не видел"
         )
-
-    stmt = select(TelegramUser).where(TelegramUser.id == chat.id)
-    result = await db.execute(stmt)
-    tg_user = result.scalar_one_or_none()
-
-    if tg_user:
-        tg_user.username = chat.username
-        tg_user.first_name = chat.first_name
-        tg_user.last_name = chat.last_name
-        tg_user.avatar_url = avatar_url
-    else:
-        tg_user = TelegramUser(
-            id=chat.id,
-            username=chat.username,
-            first_name=chat.first_name,
-            last_name=chat.last_name,
-            avatar_url=avatar_url,
-        )
-        db.add(tg_user)
-
-    await db.commit()
-    await db.refresh(tg_user)
-
-    return tg_user
\ No newline at end of file
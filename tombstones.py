@@ -0,0 +1,117 @@
+"""Срок хранения tombstones.
+
+Tombstone нужен только клиентам, которые ещё не синхронизировались после
+удаления. Записи старше settings.tombstone_retention_days удаляются
+порциями, а наибольший change_seq среди удалённых запоминается в
+sync_horizon: /sync с токеном не новее него мог бы пропустить удаление и
+поэтому отдаёт полный снимок.
+
+Разовый прогон (например, из cron вместо фоновой задачи):
+
+    python tombstones.py [--older-than-days 90]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import async_session
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 3600
+PURGE_BATCH_SIZE = 5000
+
+# deleted_at заполняется now() по часам сервера, поэтому и срок считается там же.
+# Старые записи — в начале первичного ключа, отдельный индекс по deleted_at не нужен
+PURGE_SQL = """
+    WITH purged AS (
+        DELETE FROM tombstones
+        WHERE id IN (
+            SELECT id FROM tombstones
+            WHERE deleted_at < localtimestamp - make_interval(days => :days)
+            ORDER BY id
+            LIMIT :limit
+        )
+        RETURNING change_seq
+    ),
+    horizon AS (
+        INSERT INTO sync_horizon (id, purged_seq)
+        SELECT true, max(change_seq) FROM purged HAVING count(*) > 0
+        ON CONFLICT (id) DO UPDATE SET purged_seq = greatest(sync_horizon.purged_seq, excluded.purged_seq)
+    )
+    SELECT count(*) FROM purged
+"""
+
+
+async def purge_tombstones(session_factory: async_sessionmaker, older_than: timedelta, batch_size: int) -> int:
+    total = 0
+    while True:
+        async with session_factory() as db:
+            purged = await db.scalar(text(PURGE_SQL), {"days": older_than.days, "limit": batch_size})
+            await db.commit()
+        total += purged
+        if purged < batch_size:
+            return total
+
+
+class TombstonePurger:
+    def __init__(self, session_factory: async_sessionmaker, older_than: timedelta, interval: float, batch_size: int):
+        self.session_factory = session_factory
+        self.older_than = older_than
+        self.interval = interval
+        self.batch_size = batch_size
+        self._runner: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._runner is None and self.older_than > timedelta(0):
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                purged = await purge_tombstones(self.session_factory, self.older_than, self.batch_size)
+                if purged:
+                    logger.info("Purged %d tombstones", purged)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Tombstone purge failed")
+            await asyncio.sleep(self.interval)
+
+
+tombstone_purger = TombstonePurger(
+    async_session,
+    older_than=timedelta(days=settings.tombstone_retention_days),
+    interval=PURGE_INTERVAL,
+    batch_size=PURGE_BATCH_SIZE,
+)
+
+
+async def main() -> None:
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Delete tombstones older than the sync retention period")
+    parser.add_argument("--older-than-days", type=int, default=settings.tombstone_retention_days)
+    args = parser.parse_args()
+    purged = await purge_tombstones(async_session, timedelta(days=args.older_than_days), PURGE_BATCH_SIZE)
+    print(json.dumps({"purged": purged}))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
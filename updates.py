@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = 10
+
+
+def update_chat_id(update: Update) -> Optional[int]:
+    try:
+        event = update.event
+    except Exception:
+        return None
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else None
+
+
+class ChatOrderingMiddleware(BaseMiddleware):
+    """Апдейты разных чатов обрабатываются параллельно, одного чата — строго по очереди.
+
+    Апдейты должны попадать сюда в порядке получения: asyncio.Lock отдаёт
+    блокировку ожидающим в порядке очереди, а feed_update доходит до outer
+    middleware без переключений.
+    """
+
+    def __init__(self, concurrency: int):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # chat_id -> (lock, число апдейтов, держащих или ждущих его)
+        self._chats: dict[int, list] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        chat_id = update_chat_id(event)
+        if chat_id is None:
+            async with self._semaphore:
+                return await handler(event, data)
+
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._semaphore:
+                    return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[chat_id]
+
+
+class UpdateRunner:
+    # Webhook отвечает Telegram сразу, а апдейт обрабатывается в фоне
+    def __init__(self, dispatcher: Dispatcher, bot: Bot):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, update: Update) -> None:
+        task = asyncio.create_task(self.dispatcher.feed_update(self.bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Update processing failed", exc_info=task.exception())
+
+    async def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
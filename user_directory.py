@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import async_session
+from models import TelegramUser
+from schemas import TelegramUserOut
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+FLUSH_DELAY = 0.5
+FLUSH_BATCH = 500
+MAX_LOOKUP_IDS = 200
+
+USER_COLUMNS = [
+    TelegramUser.id, TelegramUser.username, TelegramUser.first_name,
+    TelegramUser.last_name, TelegramUser.avatar_url,
+]
+PROFILE_FIELDS = ("username", "first_name", "last_name")
+
+
+class UserDirectory:
+    """Профили пользователей Telegram: чтение пачкой через TTL-кэш, запись — накоплением.
+
+    Профиль приходит с каждым /start и каждой новой initData; вместо
+    UPSERT на каждое событие изменения копятся и сбрасываются одним
+    многострочным INSERT ... ON CONFLICT раз в FLUSH_DELAY секунд.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        ttl: int = USER_CACHE_TTL,
+        maxsize: int = USER_CACHE_SIZE,
+        flush_delay: float = FLUSH_DELAY,
+        flush_batch: int = FLUSH_BATCH,
+    ):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.flush_delay = flush_delay
+        self.flush_batch = flush_batch
+        self.hits = 0
+        self.misses = 0
+        # id -> (expires_at, профиль или None, если пользователя нет в БД)
+        self._cache: OrderedDict[int, tuple[float, Optional[TelegramUserOut]]] = OrderedDict()
+        self._pending: Dict[int, dict] = {}
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._flushes: set[asyncio.Task] = set()
+        self._closing = False
+
+    def _cached(self, user_id: int):
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        self._cache.move_to_end(user_id)
+        return True, entry[1]
+
+    def _remember(self, user_id: int, user: Optional[TelegramUserOut]) -> None:
+        self._cache[user_id] = (time.monotonic() + self.ttl, user)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def prime(self, user: TelegramUserOut) -> None:
+        self._remember(user.id, user)
+
+    def saved(self, user: TelegramUserOut) -> None:
+        # Профиль только что записан в БД напрямую (/start): накопленная для него
+        # правка старее, сбрасывать её поверх нельзя
+        self._pending.pop(user.id, None)
+        self._remember(user.id, user)
+
+    async def get(self, user_id: int) -> Optional[TelegramUserOut]:
+        return (await self.get_many([user_id])).get(user_id)
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, TelegramUserOut]:
+        found: Dict[int, TelegramUserOut] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            hit, user = self._cached(user_id)
+            if hit:
+                self.hits += 1
+                if user is not None:
+                    found[user_id] = user
+            else:
+                self.misses += 1
+                missing.append(user_id)
+        if missing:
+            stmt = select(*USER_COLUMNS).where(TelegramUser.id.in_(missing))
+            async with self.session_factory() as session:
+                rows = (await session.execute(stmt)).mappings().all()
+            loaded = {row["id"]: TelegramUserOut.model_validate(dict(row)) for row in rows}
+            for user_id in missing:
+                # Неизвестные id тоже кэшируем, чтобы не ходить за ними в БД снова
+                self._remember(user_id, loaded.get(user_id))
+            found.update(loaded)
+        return found
+
+    def record(self, user_id: int, username: Optional[str], first_name: Optional[str], last_name: Optional[str]) -> None:
+        if first_name is None:
+            return
+        values = dict(username=username, first_name=first_name, last_name=last_name)
+        hit, cached = self._cached(user_id)
+        if cached is not None and all(getattr(cached, f) == values[f] for f in PROFILE_FIELDS):
+            return
+        self._pending[user_id] = values
+        if hit:
+            # avatar_url не меняется записью профиля — берём из кэша (у нового пользователя его нет)
+            avatar_url = cached.avatar_url if cached is not None else None
+            self._remember(user_id, TelegramUserOut(id=user_id, avatar_url=avatar_url, **values))
+        else:
+            self._cache.pop(user_id, None)
+
+        if len(self._pending) >= self.flush_batch:
+            self._start_flush()
+        else:
+            self._arm_timer()
+
+    def _arm_timer(self) -> None:
+        if self._flush_timer is None and not self._closing:
+            self._flush_timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        self._flush_timer = None
+        await self.flush()
+
+    def _start_flush(self) -> None:
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        # Сортировка по id — одинаковый порядок блокировок у параллельных сбросов
+        rows = [{"id": user_id, **pending[user_id]} for user_id in sorted(pending)]
+        try:
+            await self._upsert(rows)
+        except IntegrityError:
+            # username уникален: одна занятая строка не должна валить всю пачку
+            for row in rows:
+                try:
+                    await self._upsert([row])
+                except IntegrityError:
+                    logger.warning("Skipping profile update for user %s: username conflict", row["id"])
+        except Exception:
+            logger.exception("Failed to flush %d user profiles, will retry", len(rows))
+            for user_id, values in pending.items():
+                self._pending.setdefault(user_id, values)
+            self._arm_timer()
+
+    async def _upsert(self, rows: list[dict]) -> None:
+        stmt = insert(TelegramUser).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TelegramUser.id],
+            set_={**{f: stmt.excluded[f] for f in PROFILE_FIELDS}, "updated_at": func.now()},
+        )
+        async with self.session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._flushes:
+            await asyncio.wait(set(self._flushes))
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"size": len(self._cache), "pending": len(self._pending), "hits": self.hits, "misses": self.misses}
+
+
+user_directory = UserDirectory(async_session)